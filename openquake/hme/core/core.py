@@ -6,26 +6,72 @@ inputs (seismic sources, observed earthquake catalog, etc.), run the tests, and
 write the output.
 """
 
+import os
 import time
 import logging
 from copy import deepcopy
-from typing import Union, Optional, Tuple
+from functools import lru_cache
+from typing import Union, Optional, Sequence, Tuple
 
 import yaml
 import numpy as np
+import pandas as pd
+import geopandas as gpd
 from geopandas import GeoDataFrame
 
-from openquake.hme.utils.io import process_source_logic_tree, write_mfd_plots_to_gdf
+from openquake.hme.utils.io import (
+    process_source_logic_tree,
+    read_branch_sources,
+    read_branch_weights,
+    read_file_sources,
+    write_mfd_plots_to_gdf,
+)
+from openquake.hme.utils.rupture_table import RuptureTable
+from openquake.hme.utils.binning import (
+    PolygonBinIndex,
+    RuptureRateBinner,
+    bin_ids_to_str,
+    get_h3_cells,
+    get_h3_parents,
+    get_parent_rates,
+    get_depth_slab_names,
+    split_depth_slabs,
+)
+from openquake.hme.utils.datastore import (
+    bin_rupture_rates_from_datastore,
+    rupture_table_from_datastore,
+)
+from openquake.hme.utils.cache import (
+    rupture_cache_key,
+    read_cached_ruptures,
+    write_cached_ruptures,
+    binned_rates_cache_key,
+    read_cached_binned_rates,
+    write_cached_binned_rates,
+)
 from openquake.hme.utils import (
     deep_update,
+    add_bin_geometry,
     make_SpacemagBins_from_bin_gis_file,
     rupture_dict_from_logic_tree_dict,
     rupture_list_to_gdf,
     add_ruptures_to_bins,
     add_earthquakes_to_bins,
+    add_earthquake_counts_to_bins,
+    bin_earthquake_counts,
+    bin_earthquake_counts_from_csv,
+    bin_rupture_rates_from_source_list,
+    bin_rupture_rates_from_source_list_parallel,
+    make_bin_gdf_from_rate_df,
     make_earthquake_gdf_from_csv,
     make_bin_gdf_from_rupture_gdf,
     subset_source,
+    read_subset_region,
+    filter_sources_by_region,
+    get_region_margin,
+    get_polygon_bin_index,
+    get_polygon_bin_rupture_gdf,
+    add_rates_to_bins,
 )
 from openquake.hme.reporting import generate_basic_report
 
@@ -42,9 +88,30 @@ logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
 cfg_defaults = {
+    "config": {
+        "n_procs": None,
+        "max_rups_per_task": None,
+        "max_in_flight_rups": None,
+        "max_rss_gb": None,
+    },
     "input": {
-        "bins": {"h3_res": 3},
-        "ssm": {"branch": None, "tectonic_region_types": None, "source_types": None},
+        "bins": {"h3_res": 3, "bin_gis_file": None, "depth_edges": None},
+        "ssm": {
+            "branch": None,
+            "datastore": None,
+            "all_branches": False,
+            "weighted_mean": True,
+            "tectonic_region_types": None,
+            "source_types": None,
+            "keep_ruptures": False,
+            "analytic_point_sources": True,
+            "rupture_cache_dir": None,
+            "rate_cache_dir": None,
+            "area_source_discretization": 15.0,
+            "rupture_mesh_spacing": 2.0,
+            "complex_fault_mesh_spacing": 5.0,
+            "skip_bad_files": False,
+        },
         "subset": {"file": None, "buffer": 0.0},
     },
 }
@@ -148,24 +215,167 @@ def load_pro_eq_catalog(cfg: dict) -> GeoDataFrame:
     return eq_gdf
 
 
-def load_ruptures_from_ssm(cfg: dict):
+def _get_catalog_chunksize(cfg: dict) -> Optional[int]:
+    return cfg["input"]["seis_catalog"].get("chunksize")
+
+
+def load_eq_counts(cfg: dict) -> dict:
     """
-    Reads a seismic source model, processes it, and returns a GeoDataFrame with
-    the ruptures.  All necessary information is passed from the `cfg`
-    dictionary, as from a test configuration file.
+    Streams the observed earthquake catalog (and the prospective catalog, if
+    there is one) in chunks of `chunksize` earthquakes, as given in the
+    `seis_catalog` configuration, and returns a dictionary with a DataFrame of
+    the number of `observed` (and `prospective`) earthquakes in each spatial
+    bin and magnitude bin. The earthquakes are binned into the same bins as
+    the ruptures (see :func:`_make_binner`), and only those in the subset
+    region are counted; the catalogs themselves are never held in memory.
 
     :param cfg:
         Configuration for the evaluations, such as that parsed from the YAML
         config file.
 
     :returns:
-        A GeoDataFrame of the ruptures.
+        Dictionary of DataFrames of earthquake counts, with the bin ids as
+        the index and the magnitude bin centers as the columns.
     """
+    _check_eq_counts(cfg)
+
+    seis_cat_cfg: dict = cfg["input"]["seis_catalog"]
+    seis_cat_params = {
+        k: v for k, v in seis_cat_cfg["columns"].items() if v is not None
+    }
+    catalog_files = {"observed": seis_cat_cfg["seis_catalog_file"]}
+    if "prospective_catalog" in cfg["input"].keys():
+        catalog_files["prospective"] = cfg["input"]["prospective_catalog"][
+            "prospective_catalog_file"
+        ]
+
+    region = _get_subset_region(cfg)
+
+    eq_counts = {}
+    for category, catalog_file in catalog_files.items():
+        logger.info(f"binning {category} earthquake counts from {catalog_file}")
+        binner = bin_earthquake_counts_from_csv(
+            catalog_file,
+            _make_binner(cfg, region=region),
+            chunksize=_get_catalog_chunksize(cfg),
+            **seis_cat_params,
+        )
+        logger.info(f"  {binner.n_ruptures} earthquakes in {len(binner)} bins")
+        eq_counts[category] = binner.to_dataframe()
+
+    return eq_counts
+
+
+def _check_eq_counts(cfg: dict, reason: str = "a catalog chunksize") -> None:
+    """
+    Raises an error if the configuration needs the earthquakes themselves,
+    which are not kept when the catalogs are binned into counts (e.g. when
+    they are streamed, or split into depth slabs).
+    """
+    if cfg["input"]["ssm"].get("keep_ruptures", False):
+        raise ValueError(f"keep_ruptures cannot be used with {reason}")
+
+    frameworks: dict = cfg["config"]["model_framework"]
+    like_cfg = (frameworks.get("gem") or {}).get("likelihood") or {}
+    if like_cfg.get("likelihood_method") == "empirical":
+        raise ValueError(f"the empirical likelihood test cannot be used with {reason}")
+    n_test_cfg = (frameworks.get("relm") or {}).get("N_test") or {}
+    if n_test_cfg.get("prob_model") == "neg_binom":
+        raise ValueError(f"the neg_binom N-Test cannot be used with {reason}")
+
+
+def _get_n_procs(cfg: dict) -> Optional[int]:
+    """
+    Returns the number of processes to use: 1 if `parallel` is `False`,
+    otherwise `n_procs` from the `config` section (where `None` means
+    `os.cpu_count() - 1`).
+    """
+    if not cfg["config"]["parallel"]:
+        return 1
+    return cfg["config"].get("n_procs", cfg_defaults["config"]["n_procs"])
 
-    logger.info("loading ruptures into geodataframe")
 
+def _get_parallel_budget(cfg: dict) -> dict:
+    """
+    Returns the work unit size and memory budget for the parallel processing
+    of the sources, from the `config` section.
+    """
+    return {
+        param: cfg["config"].get(param, cfg_defaults["config"][param])
+        for param in ("max_rups_per_task", "max_in_flight_rups", "max_rss_gb")
+    }
+
+
+def _get_source_discretization(source_cfg: dict) -> dict:
+    return {
+        param: source_cfg.get(param, cfg_defaults["input"]["ssm"][param])
+        for param in (
+            "area_source_discretization",
+            "rupture_mesh_spacing",
+            "complex_fault_mesh_spacing",
+        )
+    }
+
+
+def _get_skip_bad_files(source_cfg: dict) -> bool:
+    return source_cfg.get(
+        "skip_bad_files", cfg_defaults["input"]["ssm"]["skip_bad_files"]
+    )
+
+
+def load_rupture_table_from_ssm(cfg: dict) -> RuptureTable:
+    """
+    Reads a seismic source model, processes it, and returns a
+    :class:`~openquake.hme.utils.rupture_table.RuptureTable` with the ruptures
+    of the logic tree branch.  All necessary information is passed from the
+    `cfg` dictionary, as from a test configuration file.
+
+    If `rupture_cache_dir` is given in the `ssm` configuration, the ruptures
+    are read from the cache when an entry exists for the same source files,
+    branch, filters and discretization parameters; otherwise they are
+    generated and then written to the cache. If a `datastore` is given, the
+    ruptures are read from it instead of being generated from the sources.
+
+    :param cfg:
+        Configuration for the evaluations, such as that parsed from the YAML
+        config file.
+
+    :returns:
+        A table of the ruptures.
+    """
     source_cfg: dict = cfg["input"]["ssm"]
 
+    if source_cfg.get("datastore") is not None:
+        return rupture_table_from_datastore(
+            source_cfg["datastore"],
+            source_types=source_cfg["source_types"],
+            tectonic_region_types=source_cfg["tectonic_region_types"],
+        )
+
+    discretization = _get_source_discretization(source_cfg)
+    cache_dir = source_cfg.get("rupture_cache_dir")
+    region = _get_subset_region(cfg)
+
+    if cache_dir is not None:
+        branch_files = read_branch_sources(
+            source_cfg["ssm_dir"],
+            lt_file=source_cfg["ssm_lt_file"],
+            branch=source_cfg["branch"],
+        )[source_cfg["branch"]]
+
+        cache_key = rupture_cache_key(
+            branch_files,
+            branch=source_cfg["branch"],
+            source_types=source_cfg["source_types"],
+            tectonic_region_types=source_cfg["tectonic_region_types"],
+            region=region,
+            skip_bad_files=_get_skip_bad_files(source_cfg),
+            **discretization,
+        )
+        rupture_table = read_cached_ruptures(cache_dir, cache_key)
+        if rupture_table is not None:
+            return rupture_table
+
     logger.info("  processing logic tree")
     ssm_lt_ruptures = process_source_logic_tree(
         source_cfg["ssm_dir"],
@@ -173,101 +383,458 @@ def load_ruptures_from_ssm(cfg: dict):
         source_types=source_cfg["source_types"],
         tectonic_region_types=source_cfg["tectonic_region_types"],
         branch=source_cfg["branch"],
+        n_procs=_get_n_procs(cfg),
+        skip_bad_files=_get_skip_bad_files(source_cfg),
+        **discretization,
+    )
+    ssm_lt_ruptures[source_cfg["branch"]] = _filter_sources(
+        cfg, ssm_lt_ruptures[source_cfg["branch"]], region=region
     )
 
     logger.info("  making dictionary of ruptures")
     rupture_dict = rupture_dict_from_logic_tree_dict(
-        ssm_lt_ruptures, parallel=cfg["config"]["parallel"]
+        ssm_lt_ruptures,
+        parallel=cfg["config"]["parallel"],
+        n_procs=_get_n_procs(cfg),
+        **_get_parallel_budget(cfg),
     )
 
     del ssm_lt_ruptures
 
-    logger.info("  making geodataframe from ruptures")
-    rupture_gdf = rupture_list_to_gdf(rupture_dict[source_cfg["branch"]])
-    logger.info("  done preparing rupture dataframe")
+    rupture_table = rupture_dict[source_cfg["branch"]]
 
-    try:
-        logger.info(" writing ruptures to file ")
-        ruptures_out = pd.DataFrame.from_dict(
-            [rup_to_dict(rup) for rup in rupture_gdf["rupture"]]
-        )
+    if cache_dir is not None:
+        write_cached_ruptures(cache_dir, cache_key, rupture_table)
 
-        try:
-            rupture_file = cfg["input"]["ssm"]["rupture_file"]
-            if not os.path.exists(rupture_file):
-                logger.info("writing ruptures")
-                rup_file_type = rupture_file.split(".")[-1]
-                if rup_file_type == "hdf5":
-                    ruptures_out.to_hdf(rupture_file, key="ruptures_out")
-                elif rup_file_type == "feather":
-                    ruptures_out.to_feather(rupture_file)
-        except KeyError:
-            pass
-    except:
-        pass
+    return rupture_table
+
+
+def load_ruptures_from_ssm(cfg: dict):
+    """
+    Reads a seismic source model, processes it, and returns a GeoDataFrame with
+    the ruptures.  All necessary information is passed from the `cfg`
+    dictionary, as from a test configuration file.
+
+    :param cfg:
+        Configuration for the evaluations, such as that parsed from the YAML
+        config file.
+
+    :returns:
+        A GeoDataFrame of the ruptures.
+    """
+
+    logger.info("loading ruptures into geodataframe")
+
+    rupture_table = load_rupture_table_from_ssm(cfg)
+
+    logger.info("  making geodataframe from ruptures")
+    rupture_gdf = rupture_list_to_gdf(rupture_table)
+    logger.info("  done preparing rupture dataframe")
 
     return rupture_gdf
 
 
-def load_inputs(cfg: dict) -> Tuple[GeoDataFrame]:
+def load_rupture_rates_from_ssm(cfg: dict) -> pd.DataFrame:
     """
-    Loads all of the inputs specified by the `cfg` and returns a tuple of
-    :class:`GeoDataFrame` objects, the earthquake catalog and the bins.
+    Reads a seismic source model and returns the total occurrence rate of the
+    ruptures in each spatial bin and magnitude bin, without keeping the
+    ruptures. All necessary information is passed from the `cfg` dictionary,
+    as from a test configuration file.
+
+    The ruptures are reduced into the bins as they are read from each source
+    (by each process, in parallel mode), and unless `analytic_point_sources`
+    is `False` in the `ssm` configuration, the rates of point, area and
+    multipoint sources are calculated from their MFDs without building their
+    ruptures. If `rate_cache_dir` is given, the rates of each source file are
+    cached, and only the files that have changed since the last run are read
+    and binned (see :func:`_bin_source_files`). Otherwise, if
+    `rupture_cache_dir` is given, the rupture table is made (or read from the
+    cache) first and then binned in chunks. If a `datastore` is
+    given, the ruptures already generated by an OpenQuake calculation are read
+    from it in chunks and binned, and the sources are not read at all.
 
     :param cfg:
         Configuration for the evaluations, such as that parsed from the YAML
         config file.
+
+    :returns:
+        A DataFrame of rupture rates, with the `h3` cell ids as the index and
+        the magnitude bin centers as the columns.
     """
-    rupture_gdf = load_ruptures_from_ssm(cfg)
-    bin_gdf = make_bin_gdf_from_rupture_gdf(
-        rupture_gdf,
-        h3_res=cfg["input"]["bins"]["h3_res"],
-        min_mag=cfg["input"]["bins"]["mfd_bin_min"],
-        max_mag=cfg["input"]["bins"]["mfd_bin_max"],
-        bin_width=cfg["input"]["bins"]["mfd_bin_width"],
+    logger.info("binning rupture rates")
+
+    source_cfg: dict = cfg["input"]["ssm"]
+    binner = _make_binner(cfg, region=_get_subset_region(cfg))
+
+    if source_cfg.get("datastore") is not None:
+        bin_rupture_rates_from_datastore(
+            source_cfg["datastore"],
+            binner,
+            source_types=source_cfg["source_types"],
+            tectonic_region_types=source_cfg["tectonic_region_types"],
+        )
+    elif source_cfg.get("rate_cache_dir") is not None:
+        branch_files = read_branch_sources(
+            source_cfg["ssm_dir"],
+            lt_file=source_cfg["ssm_lt_file"],
+            branch=source_cfg["branch"],
+        )[source_cfg["branch"]]
+        for file_rates in _bin_source_files(cfg, branch_files).values():
+            binner.add_arrays(file_rates)
+    elif source_cfg.get("rupture_cache_dir") is not None:
+        binner.add_rupture_table(load_rupture_table_from_ssm(cfg))
+    else:
+        logger.info("  processing logic tree")
+        ssm_lt_sources = process_source_logic_tree(
+            source_cfg["ssm_dir"],
+            lt_file=source_cfg["ssm_lt_file"],
+            source_types=source_cfg["source_types"],
+            tectonic_region_types=source_cfg["tectonic_region_types"],
+            branch=source_cfg["branch"],
+            n_procs=_get_n_procs(cfg),
+            skip_bad_files=_get_skip_bad_files(source_cfg),
+            **_get_source_discretization(source_cfg),
+        )
+        _bin_source_list(cfg, ssm_lt_sources[source_cfg["branch"]], binner)
+
+    logger.info(
+        "  binned {} ruptures into {} bins".format(binner.n_ruptures, len(binner))
     )
 
-    logger.info("bin_gdf shape: {}".format(bin_gdf.shape))
+    return binner.to_dataframe()
 
-    logger.info("rupture_gdf shape: {}".format(rupture_gdf.shape))
-    logger.debug(
-        "rupture_gdf memory: {} GB".format(
-            sum(rupture_gdf.memory_usage(index=True, deep=True)) * 1e-9
-        )
+
+def _get_h3_resolutions(cfg: dict) -> list:
+    """
+    Returns the `h3` resolutions to evaluate the model at, in increasing
+    order. `h3_res` in the `bins` configuration may be a single resolution or
+    a list of them.
+    """
+    h3_res = cfg["input"]["bins"]["h3_res"]
+    if isinstance(h3_res, int):
+        return [h3_res]
+    return sorted(set(h3_res))
+
+
+def _make_binner(cfg: dict, region=None) -> RuptureRateBinner:
+    """
+    Makes an empty binner for the bins in the `cfg`. The ruptures are binned
+    at the finest of the configured `h3` resolutions. If the subset `region`
+    is given (see :func:`_get_subset_region`), only the ruptures in bins that
+    will be kept after subsetting (at the coarsest resolution) are binned.
+    """
+    bin_cfg: dict = cfg["input"]["bins"]
+    h3_resolutions = _get_h3_resolutions(cfg)
+    bin_gis_file = _get_bin_gis_file(cfg)
+    return RuptureRateBinner(
+        h3_res=h3_resolutions[-1],
+        min_mag=bin_cfg["mfd_bin_min"],
+        max_mag=bin_cfg["mfd_bin_max"],
+        bin_width=bin_cfg["mfd_bin_width"],
+        region=region,
+        region_res=h3_resolutions[0] if region is not None else None,
+        bin_index=_read_polygon_bin_index(bin_gis_file) if bin_gis_file else None,
+        depth_edges=_get_depth_edges(cfg),
     )
 
-    logger.info("adding ruptures to bins")
-    add_ruptures_to_bins(rupture_gdf, bin_gdf)
 
-    if cfg["input"]["subset"]["file"] is not None:
-        logger.info("   Subsetting bin_gdf")
-        bin_gdf = subset_source(
-            bin_gdf,
-            subset_file=cfg["input"]["subset"]["file"],
-            buffer=cfg["input"]["subset"]["buffer"],
+def _get_depth_edges(cfg: dict) -> Optional[list]:
+    return cfg["input"]["bins"].get(
+        "depth_edges", cfg_defaults["input"]["bins"]["depth_edges"]
+    )
+
+
+def _get_bin_gis_file(cfg: dict) -> Optional[str]:
+    return cfg["input"]["bins"].get(
+        "bin_gis_file", cfg_defaults["input"]["bins"]["bin_gis_file"]
+    )
+
+
+@lru_cache(maxsize=4)
+def _read_polygon_bin_index(bin_gis_file: str) -> PolygonBinIndex:
+    # read once per file, as a binner is made for each source file or branch
+    return get_polygon_bin_index(gpd.read_file(bin_gis_file))
+
+
+def _make_polygon_bin_gdf(cfg: dict) -> GeoDataFrame:
+    bin_cfg: dict = cfg["input"]["bins"]
+    return make_SpacemagBins_from_bin_gis_file(
+        _get_bin_gis_file(cfg),
+        min_mag=bin_cfg["mfd_bin_min"],
+        max_mag=bin_cfg["mfd_bin_max"],
+        bin_width=bin_cfg["mfd_bin_width"],
+    )
+
+
+def _get_subset_region(cfg: dict):
+    """
+    Returns the (buffered) subset region in the `cfg`, or `None` if the model
+    is not subset.
+    """
+    subset_cfg: dict = cfg["input"].get("subset", cfg_defaults["input"]["subset"])
+    if subset_cfg["file"] is None:
+        return None
+    return read_subset_region(subset_cfg["file"], buffer=subset_cfg["buffer"])
+
+
+def _filter_sources(cfg: dict, source_list: list, region=None) -> list:
+    """
+    Drops the sources that are entirely outside of the subset `region`, if
+    there is one, before their ruptures are made.
+    """
+    if region is None:
+        return source_list
+    margin = get_region_margin(region, _get_h3_resolutions(cfg)[0])
+    return filter_sources_by_region(source_list, region, margin=margin)
+
+
+def _bin_source_list(
+    cfg: dict, source_list: list, binner: RuptureRateBinner
+) -> RuptureRateBinner:
+    """
+    Adds the rupture rates of the sources to the `binner`, in parallel or
+    not, as set in the `cfg`.
+    """
+    source_cfg: dict = cfg["input"]["ssm"]
+    analytic_point_sources = source_cfg.get(
+        "analytic_point_sources",
+        cfg_defaults["input"]["ssm"]["analytic_point_sources"],
+    )
+    source_list = _filter_sources(cfg, source_list, region=binner.region)
+
+    if cfg["config"]["parallel"]:
+        return bin_rupture_rates_from_source_list_parallel(
+            source_list,
+            binner,
+            analytic_point_sources=analytic_point_sources,
+            n_procs=_get_n_procs(cfg),
+            **_get_parallel_budget(cfg),
+        )
+    else:
+        return bin_rupture_rates_from_source_list(
+            source_list, binner, analytic_point_sources=analytic_point_sources,
         )
 
-    del rupture_gdf
 
-    logger.debug(
-        "bin_gdf memory: {} GB".format(
-            sum(bin_gdf.memory_usage(index=True, deep=True)) * 1e-9
+def _bin_source_files(cfg: dict, source_files: Sequence[str]) -> dict:
+    """
+    Returns the binned rupture rates of each of the `source_files`, as made
+    by :meth:`~openquake.hme.utils.binning.RuptureRateBinner.to_arrays`.
+
+    If `rate_cache_dir` is given in the `ssm` configuration, the rates of the
+    files that have not changed since they were last binned (with the same
+    bins, filters and discretization) are read from the cache, and only the
+    other files are read and binned (and then cached).
+    """
+    source_cfg: dict = cfg["input"]["ssm"]
+    cache_dir = source_cfg.get("rate_cache_dir")
+    source_files = list(dict.fromkeys(source_files))
+    region = _get_subset_region(cfg)
+
+    file_rates = {}
+    cache_keys = {}
+
+    if cache_dir is not None:
+        for source_file in source_files:
+            cache_keys[source_file] = binned_rates_cache_key(
+                source_file,
+                binning=_make_binner(cfg, region=region).get_params(),
+                source_types=source_cfg["source_types"],
+                tectonic_region_types=source_cfg["tectonic_region_types"],
+                analytic_point_sources=source_cfg.get(
+                    "analytic_point_sources",
+                    cfg_defaults["input"]["ssm"]["analytic_point_sources"],
+                ),
+                **_get_source_discretization(source_cfg),
+            )
+            cached_rates = read_cached_binned_rates(cache_dir, cache_keys[source_file])
+            if cached_rates is not None:
+                file_rates[source_file] = cached_rates
+
+        logger.info(
+            "  read the rates of {} of {} source files from the cache".format(
+                len(file_rates), len(source_files)
+            )
+        )
+
+    new_files = [f for f in source_files if f not in file_rates]
+    if len(new_files) == 0:
+        return file_rates
+
+    logger.info("  reading source files")
+    file_sources = read_file_sources(
+        new_files,
+        source_types=source_cfg["source_types"],
+        tectonic_region_types=source_cfg["tectonic_region_types"],
+        n_procs=_get_n_procs(cfg),
+        skip_bad_files=_get_skip_bad_files(source_cfg),
+        **_get_source_discretization(source_cfg),
+    )
+
+    for source_file in list(file_sources.keys()):
+        logger.info(f"  binning {source_file}")
+        binner = _bin_source_list(
+            cfg, file_sources.pop(source_file), _make_binner(cfg, region=region)
         )
+        file_rates[source_file] = binner.to_arrays()
+
+        if cache_dir is not None:
+            write_cached_binned_rates(
+                cache_dir, cache_keys[source_file], file_rates[source_file]
+            )
+
+    return file_rates
+
+
+def load_branch_rupture_rates_from_ssm(cfg: dict) -> dict:
+    """
+    Reads all of the branches of a seismic source model logic tree, and
+    returns the total occurrence rate of the ruptures in each spatial bin and
+    magnitude bin for each branch.
+
+    Each distinct source model file is read and binned only once, even if it
+    is used by several branches; the rates of each branch are then the sums
+    of the binned rates of its files. Unless `weighted_mean` is `False` in the
+    `ssm` configuration, the mean of the branches (weighted by the branch
+    weights in the logic tree) is also returned, as `weighted_mean`. If
+    `rate_cache_dir` is given, only the files that have changed since the
+    last run are binned (see :func:`_bin_source_files`).
+
+    :param cfg:
+        Configuration for the evaluations, such as that parsed from the YAML
+        config file.
+
+    :returns:
+        Dictionary of DataFrames of rupture rates, one per branch, with the
+        `h3` cell ids as the index and the magnitude bin centers as the
+        columns.
+    """
+    logger.info("binning rupture rates for all branches")
+
+    source_cfg: dict = cfg["input"]["ssm"]
+
+    branch_files = read_branch_sources(
+        source_cfg["ssm_dir"], lt_file=source_cfg["ssm_lt_file"]
     )
+    branch_files = {
+        branch: list(dict.fromkeys(source_files))
+        for branch, source_files in branch_files.items()
+    }
+
+    file_rates = _bin_source_files(
+        cfg, [source_file for files in branch_files.values() for source_file in files]
+    )
+
+    branch_rates = {}
+    for branch, source_files in branch_files.items():
+        binner = _make_binner(cfg)
+        for source_file in source_files:
+            if source_file in file_rates:
+                binner.add_arrays(file_rates[source_file])
+        logger.info(
+            "  {}: {} ruptures in {} bins".format(
+                branch, binner.n_ruptures, len(binner)
+            )
+        )
+        branch_rates[branch] = binner.to_dataframe()
+
+    if source_cfg.get("weighted_mean", cfg_defaults["input"]["ssm"]["weighted_mean"]):
+        branch_weights = read_branch_weights(
+            source_cfg["ssm_dir"], lt_file=source_cfg["ssm_lt_file"]
+        )
+        total_weight = sum(branch_weights[branch] for branch in branch_files)
+
+        binner = _make_binner(cfg)
+        for branch, source_files in branch_files.items():
+            for source_file in source_files:
+                if source_file in file_rates:
+                    binner.add_arrays(
+                        file_rates[source_file],
+                        weight=branch_weights[branch] / total_weight,
+                    )
+        branch_rates["weighted_mean"] = binner.to_dataframe()
+
+    return branch_rates
+
+
+def load_inputs(cfg: dict) -> Tuple[GeoDataFrame]:
+    """
+    Loads all of the inputs specified by the `cfg` and returns a tuple of
+    :class:`GeoDataFrame` objects, the earthquake catalog and the bins.
+
+    By default only the total rupture rate in each bin is kept. If
+    `keep_ruptures` is `True` in the `ssm` configuration, the ruptures
+    themselves are added to the bins. If a `chunksize` is given in the
+    `seis_catalog` configuration, the catalogs are streamed into earthquake
+    counts (see :func:`load_eq_counts`), and `None` is returned in place of
+    each catalog.
+
+    :param cfg:
+        Configuration for the evaluations, such as that parsed from the YAML
+        config file.
+    """
+    bin_cfg: dict = cfg["input"]["bins"]
+    h3_res = _get_h3_resolutions(cfg)[-1]
+
+    if _get_catalog_chunksize(cfg) is not None:
+        eq_counts = load_eq_counts(cfg)
+    else:
+        eq_counts = None
+
+    if cfg["input"]["ssm"].get("keep_ruptures", False):
+        rupture_gdf = load_ruptures_from_ssm(cfg)
+        if _get_bin_gis_file(cfg) is not None:
+            bin_gdf = _make_polygon_bin_gdf(cfg)
+            rupture_gdf = get_polygon_bin_rupture_gdf(
+                rupture_gdf,
+                bin_gdf,
+                bin_index=_read_polygon_bin_index(_get_bin_gis_file(cfg)),
+            )
+        else:
+            bin_gdf = make_bin_gdf_from_rupture_gdf(
+                rupture_gdf,
+                h3_res=h3_res,
+                min_mag=bin_cfg["mfd_bin_min"],
+                max_mag=bin_cfg["mfd_bin_max"],
+                bin_width=bin_cfg["mfd_bin_width"],
+            )
+
+        logger.info("rupture_gdf shape: {}".format(rupture_gdf.shape))
+        logger.debug(
+            "rupture_gdf memory: {} GB".format(
+                sum(rupture_gdf.memory_usage(index=True, deep=True)) * 1e-9
+            )
+        )
+
+        logger.info("adding ruptures to bins")
+        add_ruptures_to_bins(rupture_gdf, bin_gdf)
+
+        del rupture_gdf
+    else:
+        bin_gdf = _make_bin_gdf_from_rates(cfg, load_rupture_rates_from_ssm(cfg))
+
+    bin_gdf = _subset_bin_gdf(cfg, bin_gdf)
+
+    if eq_counts is not None:
+        logger.info("adding earthquake counts to bins")
+        for category, count_df in eq_counts.items():
+            add_earthquake_counts_to_bins(count_df, bin_gdf, category=category)
+
+        if "prospective" in eq_counts:
+            return bin_gdf, None, None
+        else:
+            return bin_gdf, None
 
     eq_gdf = load_obs_eq_catalog(cfg)
 
     logger.info("adding earthquakes to bins")
-    add_earthquakes_to_bins(eq_gdf, bin_gdf, h3_res=cfg["input"]["bins"]["h3_res"])
+    add_earthquakes_to_bins(eq_gdf, bin_gdf, h3_res=h3_res)
 
     if "prospective_catalog" in cfg["input"].keys():
         logger.info("adding prospective earthquakes to bins")
         pro_gdf = load_pro_eq_catalog(cfg)
         add_earthquakes_to_bins(
-            pro_gdf,
-            bin_gdf,
-            h3_res=cfg["input"]["bins"]["h3_res"],
-            category="prospective",
+            pro_gdf, bin_gdf, h3_res=h3_res, category="prospective",
         )
         return bin_gdf, eq_gdf, pro_gdf
 
@@ -275,6 +842,245 @@ def load_inputs(cfg: dict) -> Tuple[GeoDataFrame]:
         return bin_gdf, eq_gdf
 
 
+def load_branch_inputs(cfg: dict) -> Tuple[dict, GeoDataFrame, Optional[GeoDataFrame]]:
+    """
+    Loads the inputs for all of the branches of the source model logic tree
+    (see :func:`load_branch_rupture_rates_from_ssm`), and returns a
+    dictionary with the bin :class:`GeoDataFrame` of each branch (and of the
+    weighted mean model), the earthquake catalog, and the prospective
+    earthquake catalog (or `None`). The catalogs are only read once.
+
+    :param cfg:
+        Configuration for the evaluations, such as that parsed from the YAML
+        config file.
+    """
+    h3_res = _get_h3_resolutions(cfg)[-1]
+
+    if cfg["input"]["ssm"].get("keep_ruptures", False):
+        raise ValueError("keep_ruptures cannot be used with all_branches")
+    if cfg["input"]["ssm"].get("datastore") is not None:
+        raise ValueError("a datastore cannot be used with all_branches")
+
+    branch_rates = load_branch_rupture_rates_from_ssm(cfg)
+
+    eq_gdf, pro_gdf, eq_counts = None, None, None
+    if _get_catalog_chunksize(cfg) is not None:
+        eq_counts = load_eq_counts(cfg)
+    else:
+        eq_gdf = load_obs_eq_catalog(cfg)
+        if "prospective_catalog" in cfg["input"].keys():
+            pro_gdf = load_pro_eq_catalog(cfg)
+
+    bin_gdfs = {}
+    for branch, rate_df in branch_rates.items():
+        logger.info(f"making bins for {branch}")
+        bin_gdf = _subset_bin_gdf(cfg, _make_bin_gdf_from_rates(cfg, rate_df))
+
+        if eq_counts is not None:
+            for category, count_df in eq_counts.items():
+                add_earthquake_counts_to_bins(count_df, bin_gdf, category=category)
+        else:
+            add_earthquakes_to_bins(eq_gdf, bin_gdf, h3_res=h3_res)
+        if pro_gdf is not None:
+            add_earthquakes_to_bins(
+                pro_gdf, bin_gdf, h3_res=h3_res, category="prospective",
+            )
+        bin_gdfs[branch] = bin_gdf
+
+    return bin_gdfs, eq_gdf, pro_gdf
+
+
+def load_multi_res_inputs(
+    cfg: dict,
+) -> Tuple[dict, GeoDataFrame, Optional[GeoDataFrame]]:
+    """
+    Loads the inputs for evaluating the model at each of the `h3`
+    resolutions given (as a list) in the `h3_res` of the `bins`
+    configuration, and returns a dictionary with the bin
+    :class:`GeoDataFrame` of each (`branch`, `h3_res`) pair, the earthquake
+    catalog, and the prospective earthquake catalog (or `None`). The branch
+    is `None` unless `all_branches` is `True` in the `ssm` configuration.
+
+    The ruptures and earthquakes are only binned once, at the finest
+    resolution; the rupture rates and earthquakes are then rolled up to the
+    coarser resolutions through the parents of the finest cells. As `h3`
+    cells are not exactly nested, the coarser bins are these parent-cell
+    aggregates, which differ slightly from the bins of a direct run at that
+    resolution (see :func:`~openquake.hme.utils.binning.get_parent_rates`).
+
+    :param cfg:
+        Configuration for the evaluations, such as that parsed from the YAML
+        config file.
+    """
+    source_cfg: dict = cfg["input"]["ssm"]
+    resolutions = _get_h3_resolutions(cfg)
+
+    if source_cfg.get("keep_ruptures", False):
+        raise ValueError("keep_ruptures cannot be used with several h3_res")
+    if _get_bin_gis_file(cfg) is not None:
+        raise ValueError("a bin_gis_file cannot be used with several h3_res")
+
+    if source_cfg.get("all_branches", False):
+        if source_cfg.get("datastore") is not None:
+            raise ValueError("a datastore cannot be used with all_branches")
+        branch_rates = load_branch_rupture_rates_from_ssm(cfg)
+    else:
+        branch_rates = {None: load_rupture_rates_from_ssm(cfg)}
+
+    eq_gdf, pro_gdf, eq_counts = None, None, None
+    if _get_catalog_chunksize(cfg) is not None:
+        eq_counts = load_eq_counts(cfg)
+    else:
+        eq_gdf = load_obs_eq_catalog(cfg)
+        eq_cells = get_h3_cells(
+            eq_gdf["longitude"], eq_gdf["latitude"], resolutions[-1]
+        )
+        if "prospective_catalog" in cfg["input"].keys():
+            pro_gdf = load_pro_eq_catalog(cfg)
+            pro_cells = get_h3_cells(
+                pro_gdf["longitude"], pro_gdf["latitude"], resolutions[-1]
+            )
+
+    bin_gdfs = {}
+    for h3_res in resolutions:
+        if eq_counts is not None:
+            res_eq_counts = {
+                category: get_parent_rates(count_df, h3_res)
+                for category, count_df in eq_counts.items()
+            }
+        else:
+            res_eq_cells = get_h3_parents(eq_cells, h3_res)
+        if pro_gdf is not None:
+            res_pro_cells = get_h3_parents(pro_cells, h3_res)
+
+        for branch, rate_df in branch_rates.items():
+            logger.info(f"making bins for {branch or 'model'} at h3_res {h3_res}")
+            bin_gdf = _subset_bin_gdf(
+                cfg, _make_bin_gdf_from_rates(cfg, get_parent_rates(rate_df, h3_res))
+            )
+
+            if eq_counts is not None:
+                for category, count_df in res_eq_counts.items():
+                    add_earthquake_counts_to_bins(count_df, bin_gdf, category=category)
+            else:
+                add_earthquakes_to_bins(
+                    eq_gdf, bin_gdf, h3_res=h3_res, cells=res_eq_cells
+                )
+            if pro_gdf is not None:
+                add_earthquakes_to_bins(
+                    pro_gdf,
+                    bin_gdf,
+                    h3_res=h3_res,
+                    category="prospective",
+                    cells=res_pro_cells,
+                )
+            bin_gdfs[(branch, h3_res)] = bin_gdf
+
+    return bin_gdfs, eq_gdf, pro_gdf
+
+
+def load_depth_inputs(cfg: dict) -> Tuple[dict, GeoDataFrame, Optional[GeoDataFrame]]:
+    """
+    Loads the inputs for evaluating the model in each of the depth slabs
+    between the `depth_edges` of the `bins` configuration, and returns a
+    dictionary with the bin :class:`GeoDataFrame` of each (`branch`, `None`,
+    `depth_slab`), the earthquake catalog, and the prospective earthquake
+    catalog (or `None`). The branch is `None` unless `all_branches` is `True`
+    in the `ssm` configuration.
+
+    The ruptures and the earthquake counts are each binned by cell, depth
+    slab and magnitude in one pass; the rates and counts of each slab are
+    then taken from those. Each slab is evaluated as a separate model, with
+    its own bins, rather than adding a depth axis to the bins.
+
+    :param cfg:
+        Configuration for the evaluations, such as that parsed from the YAML
+        config file.
+    """
+    source_cfg: dict = cfg["input"]["ssm"]
+    h3_resolutions = _get_h3_resolutions(cfg)
+    depth_edges = _get_depth_edges(cfg)
+
+    _check_eq_counts(cfg, reason="depth_edges")
+    if len(h3_resolutions) > 1:
+        raise ValueError("depth_edges cannot be used with several h3_res")
+
+    if source_cfg.get("all_branches", False):
+        if source_cfg.get("datastore") is not None:
+            raise ValueError("a datastore cannot be used with all_branches")
+        branch_rates = load_branch_rupture_rates_from_ssm(cfg)
+    else:
+        branch_rates = {None: load_rupture_rates_from_ssm(cfg)}
+
+    eq_gdf, pro_gdf = None, None
+    if _get_catalog_chunksize(cfg) is not None:
+        eq_counts = load_eq_counts(cfg)
+    else:
+        eq_gdf = load_obs_eq_catalog(cfg)
+        catalogs = {"observed": eq_gdf}
+        if "prospective_catalog" in cfg["input"].keys():
+            pro_gdf = load_pro_eq_catalog(cfg)
+            catalogs["prospective"] = pro_gdf
+        eq_counts = {
+            category: bin_earthquake_counts(cat_gdf, _make_binner(cfg)).to_dataframe()
+            for category, cat_gdf in catalogs.items()
+        }
+    eq_counts = {
+        category: split_depth_slabs(count_df)
+        for category, count_df in eq_counts.items()
+    }
+
+    bin_gdfs = {}
+    for branch, rate_df in branch_rates.items():
+        slab_rates = split_depth_slabs(rate_df)
+        for slab in get_depth_slab_names(depth_edges):
+            logger.info(f"making bins for {branch or 'model'} at depths {slab} km")
+            bin_gdf = _subset_bin_gdf(
+                cfg, _make_bin_gdf_from_rates(cfg, slab_rates[slab])
+            )
+
+            for category, slab_counts in eq_counts.items():
+                add_earthquake_counts_to_bins(
+                    slab_counts[slab], bin_gdf, category=category
+                )
+            bin_gdfs[(branch, None, slab)] = bin_gdf
+
+    return bin_gdfs, eq_gdf, pro_gdf
+
+
+def _make_bin_gdf_from_rates(cfg: dict, rate_df: pd.DataFrame) -> GeoDataFrame:
+    bin_cfg: dict = cfg["input"]["bins"]
+    if _get_bin_gis_file(cfg) is not None:
+        bin_gdf = _make_polygon_bin_gdf(cfg)
+        add_rates_to_bins(rate_df, bin_gdf)
+        return bin_gdf
+
+    return make_bin_gdf_from_rate_df(
+        rate_df,
+        min_mag=bin_cfg["mfd_bin_min"],
+        max_mag=bin_cfg["mfd_bin_max"],
+        bin_width=bin_cfg["mfd_bin_width"],
+    )
+
+
+def _subset_bin_gdf(cfg: dict, bin_gdf: GeoDataFrame) -> GeoDataFrame:
+    logger.info("bin_gdf shape: {}".format(bin_gdf.shape))
+
+    subset_cfg: dict = cfg["input"].get("subset", cfg_defaults["input"]["subset"])
+    if subset_cfg["file"] is not None:
+        logger.info("   Subsetting bin_gdf")
+        bin_gdf = subset_source(
+            bin_gdf, subset_file=subset_cfg["file"], buffer=subset_cfg["buffer"],
+        )
+
+    logger.debug(
+        "bin_gdf memory: {} GB".format(
+            sum(bin_gdf.memory_usage(index=True, deep=True)) * 1e-9
+        )
+    )
+    return bin_gdf
+
+
 """
 running tests
 """
@@ -302,11 +1108,28 @@ def run_tests(cfg: dict) -> None:
     except KeyError:
         pass
 
-    if "prospective_catalog" in cfg["input"].keys():
+    # the bins of each model to evaluate, keyed by (branch, h3_res, depth_slab)
+    if _get_depth_edges(cfg) is not None:
+        bin_gdfs, eq_gdf, pro_gdf = load_depth_inputs(cfg)
+    elif len(_get_h3_resolutions(cfg)) > 1:
+        res_bin_gdfs, eq_gdf, pro_gdf = load_multi_res_inputs(cfg)
+        bin_gdfs = {
+            (branch, h3_res, None): bin_gdf
+            for (branch, h3_res), bin_gdf in res_bin_gdfs.items()
+        }
+    elif cfg["input"]["ssm"].get("all_branches", False):
+        branch_bin_gdfs, eq_gdf, pro_gdf = load_branch_inputs(cfg)
+        bin_gdfs = {
+            (branch, None, None): bin_gdf
+            for branch, bin_gdf in branch_bin_gdfs.items()
+        }
+    elif "prospective_catalog" in cfg["input"].keys():
         bin_gdf, eq_gdf, pro_gdf = load_inputs(cfg)
+        bin_gdfs = {(None, None, None): bin_gdf}
     else:
         bin_gdf, eq_gdf = load_inputs(cfg)
         pro_gdf = None
+        bin_gdfs = {(None, None, None): bin_gdf}
 
     t_done_load = time.time()
     logger.info(
@@ -321,23 +1144,34 @@ def run_tests(cfg: dict) -> None:
         for framework, fw_tests in test_lists.items()
     }
 
-    results = {}
-
-    for framework, tests in test_lists.items():
-        results[framework] = {}
-        for test in tests:
-            results[framework][test_inv[framework][test]] = {
-                "val": test(cfg, bin_gdf=bin_gdf)
-            }
+    model_results = {}
+
+    for model, bin_gdf in bin_gdfs.items():
+        if model != (None, None, None):
+            logger.info(f"evaluating {_get_model_name(*model)}")
+        model_cfg = _get_model_cfg(cfg, *model)
+        results = {}
+        for framework, tests in test_lists.items():
+            results[framework] = {}
+            for test in tests:
+                results[framework][test_inv[framework][test]] = {
+                    "val": test(model_cfg, bin_gdf=bin_gdf)
+                }
+        model_results[model] = results
 
     t_done_eval = time.time()
     logger.info("Done evaluating model in {0:.2f} s".format(t_done_eval - t_done_load))
 
-    if "output" in cfg.keys():
-        write_outputs(cfg, bin_gdf=bin_gdf, eq_gdf=eq_gdf)
+    for model, bin_gdf in bin_gdfs.items():
+        model_cfg = _get_model_cfg(cfg, *model)
+
+        if "output" in cfg.keys():
+            write_outputs(model_cfg, bin_gdf=bin_gdf, eq_gdf=eq_gdf)
 
-    if "report" in cfg.keys():
-        write_reports(cfg, bin_gdf=bin_gdf, eq_gdf=eq_gdf, results=results)
+        if "report" in cfg.keys():
+            write_reports(
+                model_cfg, bin_gdf=bin_gdf, eq_gdf=eq_gdf, results=model_results[model]
+            )
 
     t_out_done = time.time()
     logger.info("Done writing outputs in {0:.2f} s".format(t_out_done - t_done_eval))
@@ -346,6 +1180,60 @@ def run_tests(cfg: dict) -> None:
     )
 
 
+def _get_model_cfg(
+    cfg: dict,
+    model: Optional[str] = None,
+    h3_res: Optional[int] = None,
+    depth_slab: Optional[str] = None,
+) -> dict:
+    """
+    Returns the configuration for evaluating one of several models (such as
+    the branches of a logic tree, or the model at one of several `h3`
+    resolutions or in one of several depth slabs) in the same run: the output
+    and report filenames get the model name added, so that the models do not
+    overwrite each other's outputs.
+    """
+    if model is None and h3_res is None and depth_slab is None:
+        return cfg
+
+    model_cfg = deepcopy(cfg)
+    if model is not None:
+        model_cfg["input"]["ssm"]["branch"] = model
+    if h3_res is not None:
+        model_cfg["input"]["bins"]["h3_res"] = h3_res
+    model = _get_model_name(model, h3_res, depth_slab)
+
+    if "bin_gdf" in model_cfg.get("output", {}):
+        model_cfg["output"]["bin_gdf"]["file"] = _add_model_to_filename(
+            model_cfg["output"]["bin_gdf"]["file"], model
+        )
+
+    if "basic" in model_cfg.get("report", {}):
+        model_cfg["report"]["basic"]["outfile"] = _add_model_to_filename(
+            model_cfg["report"]["basic"]["outfile"], model
+        )
+
+    return model_cfg
+
+
+def _get_model_name(
+    model: Optional[str] = None,
+    h3_res: Optional[int] = None,
+    depth_slab: Optional[str] = None,
+) -> str:
+    name_parts = [] if model is None else [model]
+    if h3_res is not None:
+        name_parts.append(f"res{h3_res}")
+    if depth_slab is not None:
+        name_parts.append(f"depth{depth_slab}")
+    return "_".join(name_parts)
+
+
+def _add_model_to_filename(filename: str, model: str) -> str:
+    root, ext = os.path.splitext(filename)
+    return f"{root}_{model}{ext}"
+
+
 """
 output processing
 """
@@ -372,6 +1260,8 @@ def write_outputs(
 
     logger.info("writing outputs")
 
+    bin_gdf = add_bin_geometry(bin_gdf)
+
     if "plots" in cfg["output"].keys():
         write_mfd_plots_to_gdf(bin_gdf, **cfg["output"]["plots"]["kwargs"])
 
@@ -381,7 +1271,7 @@ def write_outputs(
     if "bin_gdf" in cfg["output"].keys():
         outfile = cfg["output"]["bin_gdf"]["file"]
         out_format = outfile.split(".")[-1]
-        bin_gdf["bin_index"] = bin_gdf.index
+        bin_gdf["bin_index"] = bin_ids_to_str(bin_gdf.index)
         bin_gdf.index = np.arange(len(bin_gdf))
 
         if out_format == "csv":
@@ -426,5 +1316,8 @@ def write_reports(
     """
     logger.info("writing reports")
 
+    if bin_gdf is not None:
+        bin_gdf = add_bin_geometry(bin_gdf)
+
     if "basic" in cfg["report"].keys():
         generate_basic_report(cfg, results, bin_gdf=bin_gdf, eq_gdf=eq_gdf)
@@ -1,6 +1,7 @@
 from typing import Union, Dict
 
 import numpy as np
+from scipy.stats import poisson
 from culpable.stats import pdf_from_samples
 
 from openquake.hme.utils.stats import poisson_likelihood
@@ -178,6 +179,31 @@ def calc_mfd_log_likelihood_independent(obs_eqs: dict,
     return np.exp(np.sum(np.log(bin_likes)) / n_bins)
 
 
+def calc_mfd_log_likelihoods_poisson(counts: np.ndarray,
+                                     rates: np.ndarray,
+                                     time_interval: float = 1.,
+                                     not_modeled_val: float = 1e-5
+                                     ) -> np.ndarray:
+    """
+    Calculation of the Poisson log-likelihood of observing earthquakes of a
+    range of sizes in many spatial bins at once, as with
+    :func:`calc_mfd_log_likelihood_independent`. The `counts` of observed
+    earthquakes and the `rates` have one row per spatial bin and one column
+    per magnitude bin (as in a
+    :class:`~openquake.hme.utils.bins.BinCollection`); one value is returned
+    per spatial bin.
+    """
+    rt = np.asarray(rates) * time_interval
+    counts = np.asarray(counts)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bin_likes = np.where(
+            rt > 0., poisson.pmf(counts, rt),
+            np.where(counts == 0, 1., not_modeled_val))
+
+        return np.exp(np.mean(np.log(bin_likes), axis=1))
+
+
 def calc_stochastic_moment_log_likelihood(spacemag_bin: SpacemagBin,
                                           interval_length: float,
                                           n_iters: int = 1000) -> float:
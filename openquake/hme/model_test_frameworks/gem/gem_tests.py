@@ -5,11 +5,19 @@ import numpy as np
 import pandas as pd
 from geopandas import GeoDataFrame
 
-from openquake.hme.utils import get_source_bins
+from openquake.hme.utils import (
+    get_source_bins,
+    get_bin_collection,
+    get_model_mfd,
+    get_obs_mfd,
+)
 from openquake.hme.utils.plots import plot_mfd
 from ..sanity.sanity_checks import max_check
 from .gem_test_functions import get_stochastic_mfd, get_stochastic_mfds_parallel
-from .gem_stats import calc_mfd_log_likelihood_independent
+from .gem_stats import (
+    calc_mfd_log_likelihood_independent,
+    calc_mfd_log_likelihoods_poisson,
+)
 
 
 def mfd_likelihood_test(
@@ -119,27 +127,18 @@ def mfd_poisson_likelihood_test(cfg, bin_gdf: Optional[GeoDataFrame] = None,) ->
 
     test_config = cfg["config"]["model_framework"]["gem"]["likelihood"]
     source_bin_gdf = get_source_bins(bin_gdf)
+    source_bins = get_bin_collection(source_bin_gdf)
 
-    logging.info("calculating empirical MFDs for source bins")
-
-    source_bin_mfds = source_bin_gdf["SpacemagBin"].apply(
-        lambda x: x.get_rupture_mfd(cumulative=False)
-    )
-
-    def calc_row_log_like(row, mfd_df=source_bin_mfds):
-        obs_eqs = row.SpacemagBin.observed_earthquakes
-        mfd_dict = mfd_df.loc[row._name]
-
-        return calc_mfd_log_likelihood_independent(
-            obs_eqs,
-            mfd_dict,
+    logging.info("calculating log likelihoods for sources")
+    source_bin_log_likes = pd.Series(
+        calc_mfd_log_likelihoods_poisson(
+            source_bins.observed_counts,
+            source_bins.rates,
             time_interval=test_config["investigation_time"],
             not_modeled_val=test_config["not_modeled_val"],
-            likelihood_method="poisson",
-        )
-
-    logging.info("calculating log likelihoods for sources")
-    source_bin_log_likes = source_bin_gdf.apply(calc_row_log_like, axis=1)
+        ),
+        index=source_bin_gdf.index,
+    )
 
     bin_gdf["log_like"] = test_config["default_likelihood"]
     bin_gdf["log_like"].update(source_bin_log_likes)
@@ -154,22 +153,8 @@ def model_mfd_test(cfg, bin_gdf: Optional[GeoDataFrame] = None,) -> None:
 
     test_config = cfg["config"]["model_framework"]["gem"]["model_mfd"]
 
-    mod_mfd = bin_gdf.iloc[0].SpacemagBin.get_rupture_mfd()
-    obs_mfd = bin_gdf.iloc[0].SpacemagBin.get_empirical_mfd(
-        t_yrs=test_config["investigation_time"]
-    )
-
-    for i, row in bin_gdf.iloc[1:].iterrows():
-        bin_mod_mfd = row.SpacemagBin.get_rupture_mfd()
-        bin_obs_mfd = row.SpacemagBin.get_empirical_mfd(
-            t_yrs=test_config["investigation_time"]
-        )
-
-        for bin_center, rate in bin_mod_mfd.items():
-            mod_mfd[bin_center] += rate
-
-        for bin_center, rate in bin_obs_mfd.items():
-            obs_mfd[bin_center] += rate
+    mod_mfd = get_model_mfd(bin_gdf)
+    obs_mfd = get_obs_mfd(bin_gdf, t_yrs=test_config["investigation_time"])
 
     mfd_df = pd.DataFrame.from_dict(mod_mfd, orient="index", columns=["mod_mfd"])
     mfd_df["mod_mfd_cum"] = np.cumsum(mfd_df["mod_mfd"].values[::-1])[::-1]
@@ -1,6 +1,7 @@
 import logging
 
 import numpy as np
+from scipy.stats import poisson
 from openquake.hme.utils.stats import poisson_likelihood, poisson_log_likelihood
 
 
@@ -24,6 +25,21 @@ def bin_observance_log_likelihood(num_events: int, bin_rate: float) -> float:
         return poisson_log_likelihood(num_events, bin_rate)
 
 
+def bin_observance_log_likelihoods(num_events: np.ndarray,
+                                   bin_rates: np.ndarray) -> np.ndarray:
+    """
+    Array version of :func:`bin_observance_log_likelihood`, for the number
+    of events and the rates of many bins at once.
+    """
+    num_events = np.asarray(num_events)
+    bin_rates = np.asarray(bin_rates)
+
+    with np.errstate(invalid='ignore'):
+        return np.where(bin_rates == 0,
+                        np.where(num_events == 0, 0., -1 * np.infty),
+                        poisson.logpmf(num_events, bin_rates))
+
+
 def bin_observance_log_likelihood_zero_rate(num_events: int) -> float:
     if num_events == 0:
         return np.log(1)
@@ -10,7 +10,8 @@ from tqdm import tqdm
 from scipy.stats import poisson, nbinom
 from geopandas import GeoSeries, GeoDataFrame
 
-from openquake.hme.utils.bins import SpacemagBin
+from openquake.hme.utils.bins import SpacemagBin, BinCollection
+from openquake.hme.utils.binning import bin_ids_to_str
 from openquake.hme.utils import (
     get_model_mfd,
     get_obs_mfd,
@@ -23,6 +24,7 @@ from openquake.hme.utils.stats import (
 )
 from openquake.hme.model_test_frameworks.relm.relm_stats import (
     bin_observance_log_likelihood,
+    bin_observance_log_likelihoods,
 )
 
 
@@ -47,7 +49,7 @@ def s_test_bin(sbin: SpacemagBin, test_cfg: dict, N_norm: float = 1.0):
 
     # report zero likelihood bins
     if np.isneginf(obs_L):
-        logging.warn(f"{sbin.bin_id} has zero likelihood")
+        logging.warn(f"{bin_ids_to_str([sbin.bin_id])[0]} has zero likelihood")
         obs_mfd = sbin.get_empirical_mfd(cumulative=False)
         for mag, rate in rate_mfd.items():
             if rate == 0.0 and obs_mfd[mag] > 0.0:
@@ -68,6 +70,45 @@ def s_test_bin(sbin: SpacemagBin, test_cfg: dict, N_norm: float = 1.0):
     return obs_L, stoch_Ls
 
 
+def s_test_collection(
+    bin_collection: BinCollection, test_cfg: dict, N_norm: float = 1.0
+):
+    """
+    Calculates the S-test likelihoods of all of the bins of a
+    :class:`~openquake.hme.utils.bins.BinCollection` at once, as
+    :func:`s_test_bin` does for a single bin. Returns the observed
+    log-likelihood of each bin, and the log-likelihoods of the stochastic
+    event sets, with one row per iteration and one column per bin.
+    """
+    t_yrs = test_cfg["investigation_time"]
+    like_fn = S_TEST_ARRAY_FN[test_cfg["likelihood_fn"]]
+
+    rates = bin_collection.rates * t_yrs * N_norm
+
+    # calculate the observed L
+    obs_Ls = like_fn(rates, bin_collection.observed_counts)
+
+    # report zero likelihood bins
+    for row in np.flatnonzero(np.isneginf(obs_Ls)):
+        logging.warn(
+            f"{bin_ids_to_str(bin_collection.bin_ids[[row]])[0]} has zero likelihood"
+        )
+        for mag, rate, n_obs in zip(
+            bin_collection.mag_bin_centers,
+            rates[row],
+            bin_collection.observed_counts[row],
+        ):
+            if rate == 0.0 and n_obs > 0:
+                logging.warn(f"mag bin {mag} has obs eqs but no ruptures")
+
+    # calculate L for iterated stochastic event sets
+    stoch_Ls = np.array(
+        [like_fn(rates, np.random.poisson(rates)) for i in range(test_cfg["n_iters"])]
+    )
+
+    return obs_Ls, stoch_Ls
+
+
 def get_poisson_counts_from_mfd(mfd: dict):
     return {mag: np.random.poisson(rate) for mag, rate in mfd.items()}
 
@@ -127,6 +168,31 @@ def total_event_likelihood(
 S_TEST_FN = {"n_eqs": total_event_likelihood, "mfd": mfd_log_likelihood}
 
 
+def mfd_log_likelihoods(rates: np.ndarray, num_obs_events: np.ndarray) -> np.ndarray:
+    """
+    Array version of :func:`mfd_log_likelihood`, for many spatial bins at once:
+    `rates` and `num_obs_events` have one row per spatial bin and one column per
+    magnitude bin.
+    """
+    return bin_observance_log_likelihoods(num_obs_events, rates).sum(axis=1)
+
+
+def total_event_likelihoods(
+    rates: np.ndarray, num_obs_events: np.ndarray
+) -> np.ndarray:
+    """
+    Array version of :func:`total_event_likelihood`, for many spatial bins at
+    once: `rates` and `num_obs_events` have one row per spatial bin and one
+    column per magnitude bin.
+    """
+    return bin_observance_log_likelihoods(
+        num_obs_events.sum(axis=1), rates.sum(axis=1)
+    )
+
+
+S_TEST_ARRAY_FN = {"n_eqs": total_event_likelihoods, "mfd": mfd_log_likelihoods}
+
+
 def subdivide_observed_eqs(bin_gdf: GeoDataFrame, subcat_n_years: int):
 
     # collate earthquakes from bins
@@ -3,13 +3,14 @@ from typing import Optional
 
 import numpy as np
 import pandas as pd
+from scipy.stats import poisson
 from geopandas import GeoDataFrame
 
 from openquake.hme.utils.stats import (
     negative_binomial_distribution,
     estimate_negative_binom_parameters,
 )
-from openquake.hme.utils import get_source_bins, get_n_eqs_from_mfd
+from openquake.hme.utils import get_source_bins, get_bin_collection
 from openquake.hme.utils.plots import plot_mfd
 from openquake.hme.utils.stats import poisson_likelihood, poisson_log_likelihood
 from openquake.hme.model_test_frameworks.relm.relm_test_functions import (
@@ -21,7 +22,7 @@ from openquake.hme.model_test_frameworks.relm.relm_test_functions import (
     get_model_mfd,
     get_obs_mfd,
     # s_test_bin,
-    s_test_gdf_series,
+    s_test_collection,
 )
 
 
@@ -86,33 +87,21 @@ def M_test(
     # calculate log-likelihoods
     n_bins = len(mod_mfd.keys())
 
-    stochastic_eq_counts = {
-        bc: np.random.poisson((rate * t_yrs), size=test_config["n_iters"])
-        for bc, rate in mod_mfd.items()
-    }
+    mod_rates = np.array(list(mod_mfd.values())) * t_yrs
+    obs_counts = np.array(
+        [int(obs_rate * t_yrs) for obs_rate in obs_mfd.values()])
 
-    bin_log_likelihoods = {
-        bc: [
-            poisson_log_likelihood(n_stoch, (mod_mfd[bc] * t_yrs))
-            for n_stoch in eq_counts
-        ]
-        for bc, eq_counts in stochastic_eq_counts.items()
-    }
+    # one row of stochastic counts per magnitude bin
+    stochastic_eq_counts = np.random.poisson(
+        mod_rates[:, np.newaxis], size=(n_bins, test_config["n_iters"]))
 
-    stoch_geom_mean_likes = np.array([
-        np.exp(
-            np.sum([bll_mag[i]
-                    for bll_mag in bin_log_likelihoods.values()]) / n_bins)
-        for i in range(test_config["n_iters"])
-    ])
+    stoch_geom_mean_likes = np.exp(
+        np.sum(_poisson_log_likelihoods(stochastic_eq_counts,
+                                        mod_rates[:, np.newaxis]),
+               axis=0) / n_bins)
 
     obs_geom_mean_like = np.exp(
-        np.sum([
-            poisson_log_likelihood(
-                int(obs_mfd[bc] * t_yrs),
-                rate * t_yrs,
-            ) for bc, rate in mod_mfd.items()
-        ]) / n_bins)
+        np.sum(_poisson_log_likelihoods(obs_counts, mod_rates)) / n_bins)
 
     pctile = (len(
         stoch_geom_mean_likes[stoch_geom_mean_likes <= obs_geom_mean_like]) /
@@ -150,33 +139,28 @@ def S_test(
     else:
         prospective = test_config["prospective"]
 
-    N_obs = len(get_total_obs_eqs(bin_gdf, prospective=prospective))
-    N_pred = get_model_annual_eq_rate(bin_gdf) * t_yrs
-    N_norm = N_obs / N_pred
+    bin_collection = get_bin_collection(bin_gdf)
+    obs_counts = (bin_collection.prospective_counts
+                  if prospective else bin_collection.observed_counts)
 
-    bin_likes = s_test_gdf_series(bin_gdf, test_config, N_norm)
+    N_obs = obs_counts.sum()
+    N_pred = bin_collection.rates.sum() * t_yrs
+    N_norm = N_obs / N_pred
 
-    obs_likes = np.array([bl[0] for bl in bin_likes])
-    stoch_likes = np.vstack([bl[1] for bl in bin_likes]).T
+    obs_likes, stoch_likes = s_test_collection(bin_collection, test_config,
+                                               N_norm)
 
     obs_like_total = sum(obs_likes)
     stoch_like_totals = np.sum(stoch_likes, axis=1)
 
     if "append" in test_config.keys():
         if test_config["append"] is True:
-            bin_pcts = []
-            for i, obs_like in enumerate(obs_likes):
-                stoch_like = stoch_likes[:, i]
-                bin_pct = (len(stoch_like[stoch_like <= obs_like]) /
-                           test_config["n_iters"])
-                bin_pcts.append(bin_pct)
-            bin_gdf["S_bin_pct"] = bin_pcts
+            bin_gdf["S_bin_pct"] = (np.sum(stoch_likes <= obs_likes, axis=0) /
+                                    test_config["n_iters"])
 
-            bin_gdf['N_model'] = bin_gdf.SpacemagBin.apply(
-                lambda x: get_n_eqs_from_mfd(x.get_rupture_mfd()) * t_yrs)
+            bin_gdf['N_model'] = bin_collection.rates.sum(axis=1) * t_yrs
 
-            bin_gdf['N_obs'] = bin_gdf.SpacemagBin.apply(
-                lambda x: get_n_eqs_from_mfd(x.observed_earthquakes))
+            bin_gdf['N_obs'] = bin_collection.observed_counts.sum(axis=1)
 
     pctile = (len(stoch_like_totals[stoch_like_totals <= obs_like_total]) /
               test_config["n_iters"])
@@ -216,9 +200,11 @@ def N_test(
     if "conf_interval" not in test_config:
         test_config["conf_interval"] = 0.95
 
-    annual_rup_rate = get_model_annual_eq_rate(bin_gdf)
-    obs_eqs = get_total_obs_eqs(bin_gdf, prospective)
-    n_obs = len(obs_eqs)
+    bin_collection = get_bin_collection(bin_gdf)
+    annual_rup_rate = bin_collection.rates.sum()
+    n_obs = int(
+        bin_collection.get_counts(
+            "prospective" if prospective else "observed").sum())
 
     test_rup_rate = annual_rup_rate * test_config["investigation_time"]
 
@@ -261,6 +247,13 @@ def N_test(
     return test_result
 
 
+def _poisson_log_likelihoods(num_events: np.ndarray,
+                             rates: np.ndarray) -> np.ndarray:
+    # as poisson_log_likelihood, which gives zero for bins with a zero rate
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(rates > 0., poisson.logpmf(num_events, rates), 0.)
+
+
 relm_test_dict = {
     "L_test": L_test,
     "N_test": N_test,
@@ -1,10 +1,14 @@
 import logging
 from typing import Optional
 
+import pandas as pd
 from geopandas import GeoDataFrame, GeoSeries
 
+from openquake.hme.utils import get_bin_collection
+from openquake.hme.utils.binning import bin_ids_to_str
+
 from .sanity_test_functions import (
-    check_bin_max, )
+    check_bins_max, )
 
 
 def min_max_check():
@@ -15,17 +19,19 @@ def max_check(bin_gdf: GeoDataFrame,
               append_check: bool = False,
               warn: bool = False) -> list:
 
-    max_check_col: GeoSeries = bin_gdf.SpacemagBin.apply(check_bin_max)
+    max_check_col = pd.Series(check_bins_max(get_bin_collection(bin_gdf)),
+                              index=bin_gdf.index)
 
     if warn is True:
-        for i, mxc in max_check_col.iteritems():
+        for i, mxc in zip(bin_ids_to_str(max_check_col.index),
+                          max_check_col.tolist()):
             if mxc is False:
                 logging.warn('bin {} fails max mag test.'.format(i))
 
     if append_check is True:
         bin_gdf['max_check'] = max_check_col
 
-    return bin_gdf[~max_check_col].index.to_list()
+    return bin_ids_to_str(bin_gdf[~max_check_col].index).tolist()
 
 
 def min_check():
@@ -1,6 +1,8 @@
 import logging
 
-from openquake.hme.utils.bins import SpacemagBin
+import numpy as np
+
+from openquake.hme.utils.bins import SpacemagBin, BinCollection
 
 
 def _get_mfd_max_mag(mfd: dict) -> float:
@@ -30,3 +32,20 @@ def check_bin_max(sbin: SpacemagBin) -> bool:
     rupture_max = _get_max_rupture_mag(sbin)
 
     return obs_eq_max <= rupture_max
+
+
+def _get_max_mags(vals: np.ndarray, mag_bin_centers) -> np.ndarray:
+    return np.max(np.where(vals > 0., mag_bin_centers, 0.), axis=1)
+
+
+def check_bins_max(bin_collection: BinCollection) -> np.ndarray:
+    """
+    Array version of :func:`check_bin_max` for all of the bins of a
+    :class:`~openquake.hme.utils.bins.BinCollection`.
+    """
+    mag_bin_centers = np.array(bin_collection.mag_bin_centers)
+
+    obs_eq_max = _get_max_mags(bin_collection.observed_counts, mag_bin_centers)
+    rupture_max = _get_max_mags(bin_collection.rates, mag_bin_centers)
+
+    return obs_eq_max <= rupture_max
@@ -0,0 +1,717 @@
+"""
+Aggregation of rupture occurrence rates into spatial (`h3` or arbitrary
+polygon) and magnitude bins.
+
+Most of the model tests only need the total rate of the ruptures in each
+spatial cell and magnitude bin. The :class:`RuptureRateBinner` reduces
+ruptures into those totals as they are produced, so that memory use scales
+with the number of occupied bins rather than with the number of ruptures.
+"""
+import hashlib
+import logging
+import warnings
+from typing import Optional, Sequence, List
+
+import numpy as np
+import pandas as pd
+from h3 import h3
+from shapely.geometry import Polygon
+from shapely.prepared import prep
+
+from .rupture_table import RuptureTable
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# the vectorized `h3` functions are only in h3 >= 3.6, and warn on import
+try:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        from h3.unstable import vect as h3_vect
+except ImportError:
+    h3_vect = None
+
+# bulk STRtree queries are only in shapely >= 2.0; older versions use the
+# (slower) vectorized point-in-polygon tests of `shapely.vectorized`
+try:
+    from shapely import STRtree, points as make_points
+except ImportError:
+    STRtree = None
+    from shapely import vectorized as shapely_vect
+
+
+def get_h3_cells(
+    longitude: Sequence[float], latitude: Sequence[float], h3_res: int = 3
+) -> np.ndarray:
+    """
+    Returns the ids of the `h3` cells at resolution `h3_res` that contain each
+    of the points, as an array of unsigned 64-bit integers. Cell ids are kept
+    as integers for binning and joins, and only converted to hexadecimal
+    strings (with :func:`h3_cells_to_str`) for output.
+
+    The cells are found in a single vectorized call if the installed version
+    of `h3` has the :mod:`h3.unstable.vect` functions, and point by point
+    otherwise.
+    """
+    longitude = np.asarray(longitude, dtype=np.float64).ravel()
+    latitude = np.asarray(latitude, dtype=np.float64).ravel()
+
+    if h3_vect is None or len(longitude) == 0:
+        return np.array(
+            [
+                int(h3.geo_to_h3(lat, lon, h3_res), 16)
+                for lat, lon in zip(latitude.tolist(), longitude.tolist())
+            ],
+            dtype=np.uint64,
+        )
+
+    return np.asarray(h3_vect.geo_to_h3(latitude, longitude, h3_res), np.uint64)
+
+
+def h3_cells_to_str(cells: Sequence[int]) -> np.ndarray:
+    """
+    Returns the hexadecimal string ids of the integer `h3` cell ids in
+    `cells`. Only the unique cells are converted.
+    """
+    cells = np.asarray(cells, dtype=np.uint64)
+    if len(cells) == 0:
+        return np.array([], dtype=str)
+
+    unique_cells, cell_idx = np.unique(cells, return_inverse=True)
+    unique_strs = np.array([format(cell, "x") for cell in unique_cells.tolist()])
+    return unique_strs[cell_idx.ravel()]
+
+
+def h3_cells_from_str(hex_codes: Sequence[str]) -> np.ndarray:
+    """
+    Returns the integer ids of the `h3` cells with the hexadecimal string ids
+    in `hex_codes`, as an array of unsigned 64-bit integers.
+    """
+    return np.array([int(hex_code, 16) for hex_code in hex_codes], dtype=np.uint64)
+
+
+def get_h3_cell_polygons(cells: Sequence[int]) -> List[Polygon]:
+    """
+    Returns the hexagonal (or pentagonal) :class:`~shapely.geometry.Polygon`
+    of each of the integer `h3` cell ids in `cells`, in longitude-latitude
+    order. Only the polygons of the unique cells are made.
+    """
+    cells = np.asarray(cells, dtype=np.uint64)
+    if len(cells) == 0:
+        return []
+
+    unique_cells, cell_idx = np.unique(cells, return_inverse=True)
+    unique_polys = [
+        Polygon(h3.h3_to_geo_boundary(hex_code, geo_json=True))
+        # `h3` only takes python strings, not numpy ones
+        for hex_code in h3_cells_to_str(unique_cells).tolist()
+    ]
+    return [unique_polys[i] for i in cell_idx.ravel().tolist()]
+
+
+def get_h3_parents(cells: Sequence[int], h3_res: int) -> np.ndarray:
+    """
+    Returns the ids of the parent cells at the (coarser) resolution `h3_res`
+    of each of the integer `h3` cell ids in `cells`. Only the parents of the
+    unique cells are looked up.
+    """
+    cells = np.asarray(cells, dtype=np.uint64)
+    if len(cells) == 0:
+        return cells.copy()
+
+    unique_cells, cell_idx = np.unique(cells, return_inverse=True)
+    parents = h3_cells_from_str(
+        [
+            h3.h3_to_parent(cell, h3_res)
+            for cell in h3_cells_to_str(unique_cells).tolist()
+        ]
+    )
+    return parents[cell_idx.ravel()]
+
+
+def get_parent_rates(rate_df: pd.DataFrame, h3_res: int) -> pd.DataFrame:
+    """
+    Rolls binned rupture rates (as made by
+    :meth:`RuptureRateBinner.to_dataframe`) up to the parent cells at the
+    coarser resolution `h3_res`, so that the ruptures only need to be binned
+    once, at the finest resolution of interest.
+
+    The `h3` cells are not exactly nested: a parent cell does not cover
+    exactly the same area as its children, so some ruptures near the cell
+    edges end up in a different cell than if they were binned at `h3_res`
+    directly. The rolled up rates are aggregates over the parent cells, not
+    the rates of a direct binning at `h3_res`.
+    """
+    parent_df = rate_df.groupby(get_h3_parents(rate_df.index.values, h3_res)).sum()
+    parent_df.index = pd.Index(parent_df.index.values, dtype=np.uint64)
+    return parent_df
+
+
+def bin_ids_to_str(bin_ids) -> np.ndarray:
+    """
+    Returns the spatial bin ids (e.g. the index of the bin GeoDataFrame) as
+    hexadecimal strings if they are integer `h3` cell ids, i.e. have an
+    unsigned 64-bit integer dtype. Any other ids (such as those of bins read
+    from a GIS file) are returned unchanged.
+    """
+    bin_ids = np.asarray(bin_ids)
+    if bin_ids.dtype == np.uint64:
+        return h3_cells_to_str(bin_ids)
+    return bin_ids
+
+
+def get_depth_bin_idx(depths: np.ndarray, depth_edges: Sequence[float]) -> np.ndarray:
+    """
+    Returns the index of the depth slab of each depth in `depths`, for the
+    slabs between the `depth_edges` (in km, increasing downward). Slabs are
+    closed at the top, so that events at the top edge (e.g. at 0 km) are
+    binned. Depths outside of the slabs get an index of -1.
+    """
+    depth_edges = np.asarray(depth_edges, dtype=np.float64)
+    idx = np.searchsorted(depth_edges, depths, side="right") - 1
+    idx[(idx < 0) | (idx >= len(depth_edges) - 1)] = -1
+    return idx
+
+
+def get_depth_slab_names(depth_edges: Sequence[float]) -> List[str]:
+    """
+    Returns the names of the depth slabs between the `depth_edges`, such as
+    `0-20` for the slab from 0 to 20 km.
+    """
+    return [f"{top:g}-{bottom:g}" for top, bottom in zip(depth_edges, depth_edges[1:])]
+
+
+def split_depth_slabs(rate_df: pd.DataFrame) -> dict:
+    """
+    Splits binned rupture rates with depth slabs (as made by
+    :meth:`RuptureRateBinner.to_dataframe` with `depth_edges`) into one
+    DataFrame of rates per depth slab, keyed by the slab name, with the
+    magnitude bin centers as the columns.
+    """
+    return {
+        slab: rate_df.xs(slab, axis=1, level="depth")
+        for slab in rate_df.columns.unique(level="depth")
+    }
+
+
+class PolygonBinIndex:
+    """
+    Spatial index of a layer of arbitrary bin polygons (e.g. seismic source
+    zones, read from a GIS file), used in place of `h3` cells to find the bin
+    of each rupture or earthquake. The points are looked up in bulk in a
+    packed STRtree of the polygons, which takes about as long as finding
+    their `h3` cells with :func:`get_h3_cells`.
+
+    :param polygons:
+        Polygons of the bins, in longitude-latitude.
+
+    :param bin_ids:
+        Ids of the bins (e.g. the index of the bin GeoDataFrame). Defaults to
+        the positions of the polygons.
+    """
+
+    def __init__(self, polygons: Sequence[Polygon], bin_ids: Optional[Sequence] = None):
+        self.polygons = np.empty(len(polygons), dtype=object)
+        self.polygons[:] = list(polygons)
+        if bin_ids is None:
+            bin_ids = np.arange(len(self.polygons))
+        self.bin_ids = np.asarray(bin_ids)
+        self._tree = None
+
+    def __len__(self) -> int:
+        return len(self.polygons)
+
+    def __getstate__(self) -> dict:
+        # the tree is rebuilt when needed, rather than pickled
+        state = self.__dict__.copy()
+        state["_tree"] = None
+        return state
+
+    def __repr__(self) -> str:
+        # stable between runs, as this is part of the rate cache keys
+        poly_hash = hashlib.sha256()
+        for poly, bin_id in zip(self.polygons, self.bin_ids.tolist()):
+            poly_hash.update(poly.wkb)
+            poly_hash.update(str(bin_id).encode("utf-8"))
+        return f"PolygonBinIndex({poly_hash.hexdigest()})"
+
+    def get_rows(self, longitude: Sequence[float], latitude: Sequence[float]):
+        """
+        Returns the position of the bin polygon that contains each of the
+        points, or -1 for points outside of all of the bins. Points in
+        several (overlapping) bins get the first one.
+        """
+        longitude = np.asarray(longitude, dtype=np.float64).ravel()
+        latitude = np.asarray(latitude, dtype=np.float64).ravel()
+        if len(longitude) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        rows = np.full(len(longitude), -1, dtype=np.int64)
+
+        if STRtree is not None:
+            if self._tree is None:
+                self._tree = STRtree(self.polygons)
+            query_pts, query_polys = self._tree.query(
+                make_points(longitude, latitude), predicate="intersects"
+            )
+            # the first (lowest) polygon that each point is in
+            order = np.lexsort((query_polys, query_pts))
+            hit_pts, first_hit = np.unique(query_pts[order], return_index=True)
+            rows[hit_pts] = query_polys[order][first_hit]
+        else:
+            for i, poly in enumerate(self.polygons):
+                west, south, east, north = poly.bounds
+                cand = np.flatnonzero(
+                    (longitude >= west)
+                    & (longitude <= east)
+                    & (latitude >= south)
+                    & (latitude <= north)
+                    & (rows == -1)
+                )
+                if len(cand) > 0:
+                    inside = shapely_vect.contains(
+                        poly, longitude[cand], latitude[cand]
+                    )
+                    rows[cand[inside]] = i
+
+        return rows
+
+
+def get_mag_bin_centers(
+    min_mag: float = 6.0, max_mag: float = 9.0, bin_width: float = 0.2
+) -> List[float]:
+    """
+    Returns the centers of the magnitude bins of a
+    :class:`~openquake.hme.utils.bins.SpacemagBin`.
+    """
+    mag_bin_centers = [min_mag]
+    bc = min_mag
+    while bc <= max_mag:
+        bc += bin_width
+        mag_bin_centers.append(np.round(bc, 2))
+    return mag_bin_centers
+
+
+def get_mag_bin_edges(mag_bin_centers: Sequence[float], bin_width: float) -> list:
+    """
+    Returns the edges of the magnitude bins, in the same way as
+    :meth:`~openquake.hme.utils.bins.SpacemagBin.get_bin_edges`.
+    """
+    edges = [bc - bin_width / 2 for bc in mag_bin_centers]
+    edges.append(mag_bin_centers[-1] + bin_width / 2.0)
+    return edges
+
+
+def get_mag_bin_idx(mags: np.ndarray, bin_edges: Sequence[float]) -> np.ndarray:
+    """
+    Returns the index of the magnitude bin of each magnitude in `mags`. Bins
+    are closed on the right, as with :func:`pandas.cut`. Magnitudes outside of
+    the bins get an index of -1.
+    """
+    bin_edges = np.asarray(bin_edges)
+    idx = np.searchsorted(bin_edges, mags, side="left") - 1
+    idx[(idx < 0) | (idx >= len(bin_edges) - 1)] = -1
+    return idx
+
+
+def get_nearest_mag_bin_idx(
+    mags: np.ndarray,
+    mag_bin_centers: Sequence[float],
+    bin_width: float,
+    min_mag: Optional[float] = None,
+    max_mag: Optional[float] = None,
+) -> np.ndarray:
+    """
+    Returns the index of the magnitude bin with the center nearest to each
+    magnitude in `mags`, which is how earthquakes are binned (see
+    :meth:`~openquake.hme.utils.bins.SpacemagBin.add_earthquake`). Magnitudes
+    more than half of a bin width below `min_mag` or above `max_mag` (by
+    default the first and last bin centers) get an index of -1.
+
+    The bins are found by a binary search of the midpoints between the bin
+    centers, so that no (magnitude, bin) array is made.
+    """
+    mags = np.asarray(mags, dtype=np.float64)
+    bca = np.asarray(mag_bin_centers, dtype=np.float64)
+    if min_mag is None:
+        min_mag = bca[0]
+    if max_mag is None:
+        max_mag = bca[-1]
+
+    idx = np.searchsorted((bca[:-1] + bca[1:]) / 2, mags)
+
+    # magnitudes (about) halfway between two centers go to the bin that is
+    # nearer after rounding, or to the lower bin on an exact tie, as with the
+    # `argmin` of the distances in `SpacemagBin.get_mag_bin_center`
+    below = np.maximum(idx - 1, 0)
+    above = np.minimum(idx + 1, len(bca) - 1)
+    idx = np.where(np.abs(mags - bca[below]) <= np.abs(mags - bca[idx]), below, idx)
+    idx = np.where(np.abs(mags - bca[above]) < np.abs(mags - bca[idx]), above, idx)
+
+    idx[(mags < min_mag - bin_width / 2) | (mags > max_mag + bin_width / 2)] = -1
+    return idx
+
+
+class RuptureRateBinner:
+    """
+    Accumulates the occurrence rates of ruptures into `h3` spatial cells and
+    magnitude bins. The rates for each occupied cell are held in an array with
+    one value per magnitude bin.
+
+    :param h3_res:
+        Resolution of the `h3` cells.
+
+    :param min_mag:
+        Minimum magnitude bin center.
+
+    :param max_mag:
+        Maximum magnitude bin center.
+
+    :param bin_width:
+        Width of the magnitude bins.
+
+    :param by_source:
+        Whether to also keep the rates of each source separately, for ruptures
+        added with a `source_id`.
+
+    :param region:
+        Geometry (in longitude-latitude) of the study area. If given, only the
+        ruptures in cells that intersect the region are added, i.e. the same
+        cells that :func:`~openquake.hme.utils.utils.subset_source` would
+        keep.
+
+    :param region_res:
+        Resolution of the cells that are checked against the `region`, if it
+        is coarser than `h3_res` (e.g. the coarsest of several resolutions
+        that are evaluated).
+
+    :param bin_index:
+        Index of arbitrary bin polygons to bin the ruptures into, instead of
+        `h3` cells (in which case `h3_res` is not used). Ruptures outside of
+        all of the polygons are not binned.
+
+    :param depth_edges:
+        Edges of the depth slabs (in km) to also bin the ruptures by
+        hypocentral depth. The rates of each cell are then held with one value
+        per (depth slab, magnitude bin), and ruptures outside of the slabs are
+        not binned.
+    """
+
+    def __init__(
+        self,
+        h3_res: int = 3,
+        min_mag: float = 6.0,
+        max_mag: float = 9.0,
+        bin_width: float = 0.2,
+        by_source: bool = False,
+        region=None,
+        region_res: Optional[int] = None,
+        bin_index: Optional[PolygonBinIndex] = None,
+        depth_edges: Optional[Sequence[float]] = None,
+    ):
+        self.h3_res = h3_res
+        self.min_mag = min_mag
+        self.max_mag = max_mag
+        self.bin_width = bin_width
+        self.by_source = by_source
+        self.region = region
+        self.region_res = region_res
+        self.bin_index = bin_index
+        self.depth_edges = None if depth_edges is None else list(depth_edges)
+        self.mag_bin_centers = get_mag_bin_centers(min_mag, max_mag, bin_width)
+        self.mag_bin_edges = get_mag_bin_edges(self.mag_bin_centers, bin_width)
+
+        self.n_cols = len(self.mag_bin_centers)
+        if self.depth_edges is not None:
+            self.n_cols *= len(self.depth_edges) - 1
+
+        self.n_ruptures = 0
+        self._rates = {}
+        self._source_rates = {}
+        self._cells_in_region = {}
+        self._prepared_region = None
+
+    def __getstate__(self) -> dict:
+        # prepared geometries can't be pickled; they are remade when needed
+        state = self.__dict__.copy()
+        state["_prepared_region"] = None
+        return state
+
+    def __len__(self) -> int:
+        return len(self._rates)
+
+    def get_params(self) -> dict:
+        """
+        Returns the parameters needed to make an empty binner with the same
+        bins, e.g. in another process.
+        """
+        return {
+            "h3_res": self.h3_res,
+            "min_mag": self.min_mag,
+            "max_mag": self.max_mag,
+            "bin_width": self.bin_width,
+            "by_source": self.by_source,
+            "region": self.region,
+            "region_res": self.region_res,
+            "bin_index": self.bin_index,
+            "depth_edges": self.depth_edges,
+        }
+
+    def add_ruptures(
+        self,
+        longitude: np.ndarray,
+        latitude: np.ndarray,
+        mag: np.ndarray,
+        occurrence_rate: np.ndarray,
+        source_id: Optional[str] = None,
+        depth: Optional[np.ndarray] = None,
+    ) -> None:
+        """
+        Adds the rates of a batch of ruptures to the bins. Every cell that
+        contains a rupture hypocenter is added, even if the rupture magnitude
+        falls outside of the magnitude bins. If the binner keeps the rates
+        `by_source`, all of the ruptures in the batch should be from the
+        source `source_id`. The hypocentral `depth` of the ruptures is only
+        needed if the binner has `depth_edges`.
+        """
+        if len(mag) == 0:
+            return
+
+        # in double precision, so that magnitudes on the bin edges are binned
+        # as by `pd.cut`
+        mag = np.asarray(mag, dtype=np.float64)
+        occurrence_rate = np.asarray(occurrence_rate, dtype=np.float64)
+        if depth is not None:
+            depth = np.asarray(depth, dtype=np.float64)
+
+        if self.bin_index is None:
+            cells = get_h3_cells(longitude, latitude, self.h3_res)
+        else:
+            # with polygon bins, the `cells` are the positions of the polygons
+            rows = self.bin_index.get_rows(longitude, latitude)
+            in_bins = rows >= 0
+            cells = rows[in_bins].astype(np.uint64)
+            mag, occurrence_rate = mag[in_bins], occurrence_rate[in_bins]
+            if depth is not None:
+                depth = depth[in_bins]
+            if len(mag) == 0:
+                return
+
+        self.add_binned_ruptures(
+            cells, mag, occurrence_rate, source_id=source_id, depth=depth
+        )
+
+    def add_binned_ruptures(
+        self,
+        cells: np.ndarray,
+        mag: np.ndarray,
+        occurrence_rate: np.ndarray,
+        source_id: Optional[str] = None,
+        depth: Optional[np.ndarray] = None,
+    ) -> None:
+        """
+        Adds the rates of a batch of ruptures whose cells are already known.
+        """
+        if self.depth_edges is not None and depth is None:
+            raise ValueError("rupture depths are needed to bin by depth")
+
+        if self.region is not None:
+            in_region = self.in_region(cells)
+            cells = np.asarray(cells)[in_region]
+            mag = np.asarray(mag)[in_region]
+            occurrence_rate = np.asarray(occurrence_rate)[in_region]
+            if depth is not None:
+                depth = np.asarray(depth)[in_region]
+            if len(mag) == 0:
+                return
+
+        col_idx = get_mag_bin_idx(mag, self.mag_bin_edges)
+        if self.depth_edges is not None:
+            depth_idx = get_depth_bin_idx(depth, self.depth_edges)
+            col_idx = np.where(
+                (col_idx >= 0) & (depth_idx >= 0),
+                depth_idx * len(self.mag_bin_centers) + col_idx,
+                -1,
+            )
+
+        unique_cells, cell_idx = np.unique(cells, return_inverse=True)
+        in_bins = col_idx >= 0
+
+        rates = np.bincount(
+            cell_idx[in_bins] * self.n_cols + col_idx[in_bins],
+            weights=occurrence_rate[in_bins],
+            minlength=len(unique_cells) * self.n_cols,
+        ).reshape(len(unique_cells), self.n_cols)
+
+        unique_cells = unique_cells.tolist()
+        _add_cell_rates(self._rates, unique_cells, rates)
+
+        if self.by_source and source_id is not None:
+            _add_cell_rates(
+                self._source_rates.setdefault(source_id, {}), unique_cells, rates
+            )
+
+        self.n_ruptures += len(mag)
+
+    def in_region(self, cells: np.ndarray) -> np.ndarray:
+        """
+        Returns whether each of the `cells` intersects the `region` (always
+        `True` if the binner has no region). Each cell is only checked once.
+        """
+        cells = np.asarray(cells, dtype=np.uint64)
+        if self.region is None:
+            return np.ones(len(cells), dtype=bool)
+
+        if (
+            self.bin_index is None
+            and self.region_res is not None
+            and self.region_res < self.h3_res
+        ):
+            cells = get_h3_parents(cells, self.region_res)
+
+        unique_cells, cell_idx = np.unique(cells, return_inverse=True)
+        unique_cells = unique_cells.tolist()
+
+        new_cells = [c for c in unique_cells if c not in self._cells_in_region]
+        if len(new_cells) > 0:
+            if self._prepared_region is None:
+                self._prepared_region = prep(self.region)
+            if self.bin_index is None:
+                new_polys = get_h3_cell_polygons(new_cells)
+            else:
+                new_polys = self.bin_index.polygons[new_cells]
+            for cell, poly in zip(new_cells, new_polys):
+                self._cells_in_region[cell] = self._prepared_region.intersects(poly)
+
+        in_region = np.array(
+            [self._cells_in_region[c] for c in unique_cells], dtype=bool
+        )
+        return in_region[cell_idx.ravel()]
+
+    def to_arrays(self) -> dict:
+        """
+        Returns the binned rates as compact arrays: `cells`, the cell ids, and
+        `rates`, with one row of magnitude bin rates per cell. If the binner
+        keeps the rates `by_source`, `source_ids`, `source_cells` and
+        `source_rates` give the rates of each source in each cell. These can
+        be cheaply sent between processes and merged with
+        :meth:`add_arrays`.
+        """
+        cells, rates = _cell_rates_to_arrays(self._rates, self.n_cols)
+        arrays = {"cells": cells, "rates": rates, "n_ruptures": self.n_ruptures}
+
+        if self.by_source:
+            source_ids = []
+            source_cells = []
+            source_rates = []
+            for source_id, cell_rates in self._source_rates.items():
+                src_cells, src_rates = _cell_rates_to_arrays(cell_rates, self.n_cols)
+                source_ids.extend([source_id] * len(src_cells))
+                source_cells.append(src_cells)
+                source_rates.append(src_rates)
+
+            arrays["source_ids"] = np.array(source_ids, dtype=object)
+            arrays["source_cells"] = (
+                np.concatenate(source_cells) if source_cells else cells[:0]
+            )
+            arrays["source_rates"] = (
+                np.vstack(source_rates) if source_rates else rates[:0]
+            )
+
+        return arrays
+
+    def add_arrays(self, arrays: dict, weight: float = 1.0) -> None:
+        """
+        Adds binned rates from :meth:`to_arrays` (of a binner with the same
+        bins) to this binner, multiplied by `weight` (e.g. the weight of a
+        logic tree branch).
+        """
+        _add_cell_rates(self._rates, arrays["cells"].tolist(), arrays["rates"] * weight)
+        self.n_ruptures += arrays["n_ruptures"]
+
+        if self.by_source and "source_ids" in arrays:
+            for source_id, cell, cell_rates in zip(
+                arrays["source_ids"],
+                arrays["source_cells"].tolist(),
+                arrays["source_rates"] * weight,
+            ):
+                _add_cell_rates(
+                    self._source_rates.setdefault(source_id, {}), [cell], [cell_rates]
+                )
+
+    def add_rupture_table(
+        self, rupture_table: RuptureTable, chunk_size: int = 100_000
+    ) -> None:
+        """
+        Adds the ruptures in a
+        :class:`~openquake.hme.utils.rupture_table.RuptureTable`, in chunks of
+        `chunk_size` ruptures (so that memory-mapped tables are not read into
+        memory all at once).
+        """
+        for start in range(0, len(rupture_table), chunk_size):
+            stop = start + chunk_size
+            self.add_ruptures(
+                rupture_table.longitude[start:stop],
+                rupture_table.latitude[start:stop],
+                rupture_table.mag[start:stop],
+                rupture_table.occurrence_rate[start:stop],
+                depth=rupture_table.depth[start:stop],
+            )
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Returns the binned rates as a DataFrame, with the integer `h3` cell ids
+        (or the ids of the `bin_index` polygons) as the index and the
+        magnitude bin centers as the columns. If the binner has `depth_edges`,
+        the columns are a (`depth`, `mag`) MultiIndex; see
+        :func:`split_depth_slabs`.
+        """
+        cells, rates = _cell_rates_to_arrays(self._rates, self.n_cols)
+        return pd.DataFrame(rates, index=self._get_bin_ids(cells), columns=self._columns)
+
+    def to_source_dataframe(self) -> pd.DataFrame:
+        """
+        Returns the binned rates of each source as a DataFrame, with a
+        (`source`, `cell`) MultiIndex and the magnitude bin centers as the
+        columns. Only available if the binner keeps the rates `by_source`.
+        """
+        if not self.by_source:
+            raise ValueError("binner does not keep the rates by source")
+
+        arrays = self.to_arrays()
+        index = pd.MultiIndex.from_arrays(
+            [arrays["source_ids"], self._get_bin_ids(arrays["source_cells"])],
+            names=["source", "cell"],
+        )
+        return pd.DataFrame(arrays["source_rates"], index=index, columns=self._columns)
+
+    @property
+    def _columns(self):
+        if self.depth_edges is None:
+            return self.mag_bin_centers
+        return pd.MultiIndex.from_product(
+            [get_depth_slab_names(self.depth_edges), self.mag_bin_centers],
+            names=["depth", "mag"],
+        )
+
+    def _get_bin_ids(self, cells: np.ndarray) -> pd.Index:
+        if self.bin_index is None:
+            return pd.Index(cells, dtype=np.uint64)
+        return pd.Index(self.bin_index.bin_ids[cells.astype(np.int64)])
+
+
+def _add_cell_rates(cell_rate_dict: dict, cells: list, rates) -> None:
+    for cell, cell_rates in zip(cells, rates):
+        if cell in cell_rate_dict:
+            cell_rate_dict[cell] = cell_rate_dict[cell] + cell_rates
+        else:
+            cell_rate_dict[cell] = np.array(cell_rates, dtype=np.float64)
+
+
+def _cell_rates_to_arrays(cell_rate_dict: dict, n_mags: int):
+    cells = np.array(list(cell_rate_dict.keys()), dtype=np.uint64)
+    if len(cells) > 0:
+        rates = np.vstack(list(cell_rate_dict.values()))
+    else:
+        rates = np.zeros((0, n_mags))
+    return cells, rates
@@ -1,10 +1,18 @@
-from typing import Optional
+from typing import Optional, Sequence
 
 from shapely.geometry import Polygon
 
 import numpy as np
+import pandas as pd
 
 from . import utils
+from .binning import (
+    get_h3_cell_polygons,
+    get_mag_bin_centers,
+    get_nearest_mag_bin_idx,
+)
+from .rupture_table import RuptureTable
+from .stats import sample_event_times_in_interval
 
 
 class MagBin:
@@ -16,21 +24,45 @@ class MagBin:
         bin_width=None,
         rate=None,
         ruptures=None,
+        collection=None,
+        idx=None,
     ):
 
         self.bin_min = bin_min
         self.bin_max = bin_max
         self.bin_center = bin_center
         self.bin_width = bin_width
-        self.rate = rate
+
+        # bins of a BinCollection keep their rate in its `rates` array
+        self.collection = collection
+        self.idx = idx
+        if collection is None:
+            self._rate = rate
+        elif rate is not None:
+            self.rate = rate
 
         if ruptures is None:
             self.ruptures = []
+        else:
+            self.ruptures = ruptures
 
         self.observed_earthquakes = []
         self.stochastic_earthquakes = []
         self.prospective_earthquakes = []
 
+    @property
+    def rate(self):
+        if self.collection is not None:
+            return self.collection.rates[self.idx]
+        return self._rate
+
+    @rate.setter
+    def rate(self, rate):
+        if self.collection is not None:
+            self.collection.rates[self.idx] = rate
+        else:
+            self._rate = rate
+
     def calculate_observed_earthquake_rate(self, t_yrs=1.0, return_rate=False):
         self.observed_earthquake_rate = len(self.observed_earthquakes) / t_yrs
         if return_rate is True:
@@ -42,17 +74,33 @@ class MagBin:
             return self.prospective_earthquake_rate
 
     def calculate_total_rupture_rate(self, t_yrs=1, return_rate=False):
-        self.net_rupture_rate = sum([r.occurrence_rate for r in self.ruptures]) * t_yrs
+        if isinstance(self.ruptures, RuptureTable):
+            total_rate = self.ruptures.occurrence_rate.sum()
+        elif len(self.ruptures) == 0 and self.rate is not None:
+            # rate-only bins, from the binned rupture rates
+            total_rate = self.rate
+        else:
+            total_rate = sum([r.occurrence_rate for r in self.ruptures])
+        self.net_rupture_rate = total_rate * t_yrs
         if return_rate is True:
             return self.net_rupture_rate
 
     def sample_ruptures(self, interval_length, t0=0.0, clean=True):
-        eqs = utils.flatten_list(
-            [
-                utils.sample_earthquakes(rup, interval_length, t0)
-                for rup in self.ruptures
+        if len(self.ruptures) == 0 and self.rate is not None:
+            # rate-only bins: the sum of the ruptures' Poisson processes
+            eqs = [
+                utils.Earthquake(magnitude=self.bin_center, time=et)
+                for et in sample_event_times_in_interval(
+                    self.rate, interval_length, t0
+                )
             ]
-        )
+        else:
+            eqs = utils.flatten_list(
+                [
+                    utils.sample_earthquakes(rup, interval_length, t0)
+                    for rup in self.ruptures
+                ]
+            )
 
         if clean is True:
             self.stochastic_earthquakes = eqs
@@ -100,45 +148,110 @@ class SpacemagBin:
         bin_width=0.2,
         bin_id=None,
         mag_bin_centers=None,
+        collection=None,
+        row=None,
     ):
 
-        self.poly = poly
+        self._poly = poly
         self.bin_id = bin_id
         self.min_mag = min_mag
         self.max_mag = max_mag
         self.bin_width = bin_width
+
+        # a bin of a BinCollection is a view of row `row` of its arrays, and
+        # only makes its MagBins when they are first used
+        self.collection = collection
+        self.row = row
+        if collection is not None:
+            mag_bin_centers = collection.mag_bin_centers
+
+        if mag_bin_centers is None:
+            mag_bin_centers = get_mag_bin_centers(min_mag, max_mag, bin_width)
         self.mag_bin_centers = mag_bin_centers
 
-        self.make_mag_bins()
+        self._mag_bins = None
+        if collection is None:
+            self.make_mag_bins()
         self.stochastic_earthquakes = {bc: [] for bc in self.mag_bin_centers}
         self.observed_earthquakes = {bc: [] for bc in self.mag_bin_centers}
         self.prospective_earthquakes = {bc: [] for bc in self.mag_bin_centers}
 
-    def make_mag_bins(self):
-        if self.mag_bin_centers is None:
-            self.mag_bin_centers = [self.min_mag]
-            bc = self.min_mag
-            while bc <= self.max_mag:
-                bc += self.bin_width
-                self.mag_bin_centers.append(np.round(bc, 2))
+    @property
+    def poly(self):
+        # the polygons of `h3` cells are only made when they are used
+        if self._poly is None and isinstance(self.bin_id, np.uint64):
+            self._poly = get_h3_cell_polygons([self.bin_id])[0]
+        return self._poly
+
+    @poly.setter
+    def poly(self, poly):
+        self._poly = poly
+
+    @property
+    def mag_bins(self):
+        if self._mag_bins is None:
+            self.make_mag_bins()
+        return self._mag_bins
 
+    @mag_bins.setter
+    def mag_bins(self, mag_bins):
+        self._mag_bins = mag_bins
+
+    def make_mag_bins(self):
         self.mag_bins = {
             bc: MagBin(
                 bin_center=bc,
                 bin_width=self.bin_width,
                 bin_min=bc - self.bin_width / 2,
                 bin_max=bc + self.bin_width / 2,
+                collection=self.collection,
+                idx=None if self.collection is None else (self.row, i),
             )
-            for bc in self.mag_bin_centers
+            for i, bc in enumerate(self.mag_bin_centers)
         }
 
     def get_bin_edges(self):
-        edges = [mb.bin_min for mb in self.mag_bins.values()]
+        edges = [bc - self.bin_width / 2 for bc in self.mag_bin_centers]
 
         edges.append(self.mag_bin_centers[-1] + self.bin_width / 2.0)
 
         return edges
 
+    def get_mag_bin_center(self, mag: float):
+        """
+        Returns the center of the magnitude bin nearest to `mag`, or `None` if
+        `mag` is outside of the range of the bins.
+        """
+        if mag < self.min_mag - self.bin_width / 2:
+            return None
+        elif mag > self.max_mag + self.bin_width / 2:
+            return None
+        bca = np.array(self.mag_bin_centers)
+        return self.mag_bin_centers[np.argmin(np.abs(mag - bca))]
+
+    def add_earthquake(self, eq, category: str = "observed") -> None:
+        """
+        Adds an earthquake to the magnitude bin nearest to its magnitude (if
+        it is within the range of the bins), as an `observed` or
+        `prospective` earthquake.
+        """
+        bc = self.get_mag_bin_center(eq.magnitude)
+        if bc is None:
+            return
+
+        if category == "observed":
+            self.mag_bins[bc].observed_earthquakes.append(eq)
+            self.observed_earthquakes[bc].append(eq)
+        elif category == "prospective":
+            self.mag_bins[bc].prospective_earthquakes.append(eq)
+            self.prospective_earthquakes[bc].append(eq)
+        else:
+            return
+
+        if self.collection is not None:
+            counts = self.collection.get_counts(category)
+            counts[self.row, self.mag_bin_centers.index(bc)] += 1
+
     def to_dict(self):
         params = {
             "poly": {
@@ -179,11 +292,16 @@ class SpacemagBin:
 
     def get_rupture_mfd(self, cumulative=False):
 
-        # may not be returned in order in Python < 3.5
-        noncum_mfd = {
-            bc: self.mag_bins[bc].calculate_total_rupture_rate(return_rate=True)
-            for bc in self.mag_bin_centers
-        }
+        if self.collection is not None:
+            noncum_mfd = dict(
+                zip(self.mag_bin_centers, self.collection.rates[self.row].tolist())
+            )
+        else:
+            # may not be returned in order in Python < 3.5
+            noncum_mfd = {
+                bc: self.mag_bins[bc].calculate_total_rupture_rate(return_rate=True)
+                for bc in self.mag_bin_centers
+            }
 
         cum_mfd = {}
         cum_mag = 0.0
@@ -240,13 +358,21 @@ class SpacemagBin:
         Calculates the MFD of empirical (observed) earthquakes; no fitting.
         """
 
-        # may not be returned in order in Python < 3.5
-        noncum_mfd = {
-            bc: self.mag_bins[bc].calculate_observed_earthquake_rate(
-                t_yrs=t_yrs, return_rate=True
+        if self.collection is not None:
+            noncum_mfd = dict(
+                zip(
+                    self.mag_bin_centers,
+                    (self.collection.observed_counts[self.row] / t_yrs).tolist(),
+                )
             )
-            for bc in self.mag_bin_centers
-        }
+        else:
+            # may not be returned in order in Python < 3.5
+            noncum_mfd = {
+                bc: self.mag_bins[bc].calculate_observed_earthquake_rate(
+                    t_yrs=t_yrs, return_rate=True
+                )
+                for bc in self.mag_bin_centers
+            }
 
         cum_mfd = {}
         cum_mag = 0.0
@@ -271,13 +397,21 @@ class SpacemagBin:
         Calculates the MFD of prospective earthquakes; no fitting.
         """
 
-        # may not be returned in order in Python < 3.5
-        noncum_mfd = {
-            bc: self.mag_bins[bc].calculate_prospective_earthquake_rate(
-                t_yrs=t_yrs, return_rate=True
+        if self.collection is not None:
+            noncum_mfd = dict(
+                zip(
+                    self.mag_bin_centers,
+                    (self.collection.prospective_counts[self.row] / t_yrs).tolist(),
+                )
             )
-            for bc in self.mag_bin_centers
-        }
+        else:
+            # may not be returned in order in Python < 3.5
+            noncum_mfd = {
+                bc: self.mag_bins[bc].calculate_prospective_earthquake_rate(
+                    t_yrs=t_yrs, return_rate=True
+                )
+                for bc in self.mag_bin_centers
+            }
 
         cum_mfd = {}
         cum_mag = 0.0
@@ -296,3 +430,182 @@ class SpacemagBin:
             return self.pro_noncum_mfd
         else:
             return self.pro_cum_mfd
+
+
+class BinCollection:
+    """
+    Dense arrays of the model rupture rates and of the observed and
+    prospective earthquake counts of a set of spatial bins, with one row per
+    spatial bin and one column per magnitude bin. The
+    :class:`SpacemagBin` of each spatial bin (as made by
+    :meth:`make_spacemag_bins`) is a view of one row of the arrays, so the
+    tests can work on the arrays of all of the bins at once.
+
+    :param bin_ids:
+        Ids of the spatial bins (e.g. integer `h3` cell ids).
+
+    :param min_mag:
+        Minimum magnitude bin center.
+
+    :param max_mag:
+        Maximum magnitude bin center.
+
+    :param bin_width:
+        Width of the magnitude bins.
+
+    :param mag_bin_centers:
+        Centers of the magnitude bins, if they are not made from `min_mag`,
+        `max_mag` and `bin_width`.
+    """
+
+    def __init__(
+        self,
+        bin_ids: Sequence,
+        min_mag=None,
+        max_mag=None,
+        bin_width=0.2,
+        mag_bin_centers=None,
+        rates: Optional[np.ndarray] = None,
+        observed_counts: Optional[np.ndarray] = None,
+        prospective_counts: Optional[np.ndarray] = None,
+    ):
+        self.bin_ids = np.asarray(bin_ids)
+        self.min_mag = min_mag
+        self.max_mag = max_mag
+        self.bin_width = bin_width
+        if mag_bin_centers is None:
+            mag_bin_centers = get_mag_bin_centers(min_mag, max_mag, bin_width)
+        self.mag_bin_centers = list(mag_bin_centers)
+
+        shape = (len(self.bin_ids), len(self.mag_bin_centers))
+        self.rates = _make_array(rates, shape, np.float64)
+        self.observed_counts = _make_array(observed_counts, shape, np.int64)
+        self.prospective_counts = _make_array(prospective_counts, shape, np.int64)
+
+        self._bin_index = pd.Index(self.bin_ids)
+
+    def __len__(self) -> int:
+        return len(self.bin_ids)
+
+    @classmethod
+    def from_spacemag_bins(
+        cls, spacemag_bins: Sequence[SpacemagBin], bin_ids: Optional[Sequence] = None
+    ) -> "BinCollection":
+        """
+        Makes a new collection with the rates and counts of the
+        `spacemag_bins`, which should all have the same magnitude bins. This
+        is for bins that are not already views of a collection, such as bins
+        holding ruptures.
+        """
+        spacemag_bins = list(spacemag_bins)
+        if bin_ids is None:
+            bin_ids = [sb.bin_id for sb in spacemag_bins]
+        sb0 = spacemag_bins[0]
+
+        def mfd_array(get_mfd):
+            return np.array([list(get_mfd(sb).values()) for sb in spacemag_bins])
+
+        return cls(
+            bin_ids,
+            min_mag=sb0.min_mag,
+            max_mag=sb0.max_mag,
+            bin_width=sb0.bin_width,
+            mag_bin_centers=sb0.mag_bin_centers,
+            rates=mfd_array(lambda sb: sb.get_rupture_mfd()),
+            observed_counts=mfd_array(lambda sb: sb.get_empirical_mfd()),
+            prospective_counts=mfd_array(lambda sb: sb.get_prospective_mfd()),
+        )
+
+    def make_spacemag_bins(self, polys: Sequence[Polygon]) -> list:
+        """
+        Returns a :class:`SpacemagBin` view of each row of the collection,
+        with the polygons `polys`.
+        """
+        return [
+            SpacemagBin(
+                poly,
+                bin_id=bin_id,
+                min_mag=self.min_mag,
+                max_mag=self.max_mag,
+                bin_width=self.bin_width,
+                collection=self,
+                row=row,
+            )
+            for row, (bin_id, poly) in enumerate(zip(self.bin_ids, polys))
+        ]
+
+    def get_rows(self, bin_ids: Sequence) -> np.ndarray:
+        """
+        Returns the row of each of the `bin_ids`, or -1 for ids that are not
+        in the collection.
+        """
+        return self._bin_index.get_indexer(bin_ids)
+
+    def get_mag_cols(self, mags: Sequence[float]) -> np.ndarray:
+        """
+        Returns the column of the nearest magnitude bin to each of the `mags`,
+        or -1 for magnitudes outside of the range of the bins.
+        """
+        return get_nearest_mag_bin_idx(
+            mags,
+            self.mag_bin_centers,
+            self.bin_width,
+            min_mag=self.min_mag,
+            max_mag=self.max_mag,
+        )
+
+    def get_counts(self, category: str = "observed") -> np.ndarray:
+        """
+        Returns the array of `observed` or `prospective` earthquake counts.
+        """
+        if category == "observed":
+            return self.observed_counts
+        elif category == "prospective":
+            return self.prospective_counts
+        raise ValueError(f"{category} is not an earthquake category")
+
+    def take(self, rows: Sequence[int]) -> "BinCollection":
+        """
+        Returns a new collection with copies of the `rows` of this one.
+        """
+        rows = np.asarray(rows)
+        return BinCollection(
+            self.bin_ids[rows],
+            min_mag=self.min_mag,
+            max_mag=self.max_mag,
+            bin_width=self.bin_width,
+            mag_bin_centers=self.mag_bin_centers,
+            rates=self.rates[rows],
+            observed_counts=self.observed_counts[rows],
+            prospective_counts=self.prospective_counts[rows],
+        )
+
+    def get_rupture_mfd(self, cumulative: bool = False) -> np.ndarray:
+        """
+        Returns the total rupture rate in each magnitude bin of all of the
+        bins.
+        """
+        return _sum_mfd(self.rates, cumulative)
+
+    def get_empirical_mfd(
+        self, t_yrs: float = 1.0, cumulative: bool = False, prospective: bool = False
+    ) -> np.ndarray:
+        """
+        Returns the rate of the observed (or prospective) earthquakes in each
+        magnitude bin of all of the bins, over `t_yrs` years.
+        """
+        counts = self.prospective_counts if prospective else self.observed_counts
+        return _sum_mfd(counts, cumulative) / t_yrs
+
+
+def _make_array(vals, shape, dtype) -> np.ndarray:
+    if vals is None:
+        return np.zeros(shape, dtype=dtype)
+    return np.array(vals, dtype=dtype).reshape(shape)
+
+
+def _sum_mfd(vals: np.ndarray, cumulative: bool = False) -> np.ndarray:
+    mfd = vals.sum(axis=0)
+    if cumulative:
+        mfd = np.cumsum(mfd[::-1])[::-1]
+    return mfd
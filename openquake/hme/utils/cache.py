@@ -0,0 +1,283 @@
+"""
+On-disk caches for the expensive stages of a Hamlet run.
+
+Cache entries are content-addressed: the key is a hash of the contents of the
+seismic source model files together with every parameter that changes the
+result (logic tree branch, filters, discretization parameters), so a cache
+entry can never be read back for a model that has since been edited.
+
+The binned rupture rates are cached separately for each source model file, so
+that when some of the files of a model are edited, only those files need to
+be read and binned again.
+"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+from typing import Optional, Sequence
+
+import numpy as np
+
+from .rupture_table import RuptureTable
+
+# increment this when the layout of cache entries changes
+CACHE_VERSION = 3
+
+_HASH_BLOCK_SIZE = 2 ** 20
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+def hash_file(filename: str) -> str:
+    """
+    Returns the SHA-256 hex digest of the contents of a file.
+    """
+    file_hash = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def make_cache_key(source_files: Sequence[str], **params) -> str:
+    """
+    Makes a cache key from the contents of the `source_files` and any other
+    (JSON-serializable) parameters that affect the cached result. The order
+    of the source files does not matter.
+    """
+    key_info = {
+        "cache_version": CACHE_VERSION,
+        "source_files": sorted(hash_file(f) for f in source_files),
+        "params": params,
+    }
+    key_str = json.dumps(key_info, sort_keys=True, default=str)
+    return hashlib.sha256(key_str.encode("utf-8")).hexdigest()
+
+
+def rupture_cache_key(
+    source_files: Sequence[str],
+    branch: Optional[str] = None,
+    source_types: Optional[Sequence[str]] = None,
+    tectonic_region_types: Optional[Sequence[str]] = None,
+    region=None,
+    skip_bad_files: bool = False,
+    **discretization,
+) -> str:
+    """
+    Makes the cache key for the ruptures of a logic tree branch.
+
+    :param source_files:
+        Source model XML files for the branch.
+
+    :param branch:
+        Name of the logic tree branch.
+
+    :param source_types:
+        Source type filter, as passed to
+        :func:`~openquake.hme.utils.io.sort_sources`.
+
+    :param tectonic_region_types:
+        Tectonic region type filter, as passed to
+        :func:`~openquake.hme.utils.io.sort_sources`.
+
+    :param region:
+        Subset region that the sources were filtered with, if any.
+
+    :param skip_bad_files:
+        Whether source files that could not be read were left out, so that a
+        branch cached without them is not used when they are needed.
+
+    :param discretization:
+        Discretization parameters used when reading the sources, e.g.
+        `rupture_mesh_spacing`.
+    """
+    return make_cache_key(
+        source_files,
+        branch=branch,
+        region=region,
+        skip_bad_files=skip_bad_files,
+        source_types=sorted(source_types) if source_types is not None else None,
+        tectonic_region_types=(
+            sorted(tectonic_region_types)
+            if tectonic_region_types is not None
+            else None
+        ),
+        discretization=discretization,
+    )
+
+
+def write_rupture_table(rupture_table: RuptureTable, out_dir: str) -> None:
+    """
+    Writes a :class:`~openquake.hme.utils.rupture_table.RuptureTable` to a
+    directory, with one `.npy` file per column and the source ids in JSON.
+    The directory is written under a temporary name and then moved into
+    place, so that an interrupted write never leaves a partial table behind.
+    """
+    parent_dir = os.path.dirname(os.path.abspath(out_dir))
+    os.makedirs(parent_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent_dir, prefix=".tmp_rups_")
+
+    try:
+        for col in RuptureTable.columns:
+            np.save(os.path.join(tmp_dir, f"{col}.npy"), getattr(rupture_table, col))
+
+        with open(os.path.join(tmp_dir, "source_ids.json"), "w") as f:
+            json.dump([str(s) for s in rupture_table.source_ids], f)
+
+        if os.path.exists(out_dir):
+            shutil.rmtree(out_dir)
+        os.rename(tmp_dir, out_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def read_rupture_table(in_dir: str, mmap: bool = True) -> RuptureTable:
+    """
+    Reads a :class:`~openquake.hme.utils.rupture_table.RuptureTable` written
+    by :func:`write_rupture_table`. If `mmap` is `True`, the columns are
+    memory-mapped rather than read into memory.
+    """
+    mmap_mode = "r" if mmap else None
+
+    with open(os.path.join(in_dir, "source_ids.json")) as f:
+        source_ids = json.load(f)
+
+    cols = {
+        col: np.load(os.path.join(in_dir, f"{col}.npy"), mmap_mode=mmap_mode)
+        for col in RuptureTable.columns
+    }
+
+    return RuptureTable(source_ids=source_ids, **cols)
+
+
+def _rupture_cache_path(cache_dir: str, key: str) -> str:
+    return os.path.join(cache_dir, f"ruptures_{key}")
+
+
+def read_cached_ruptures(
+    cache_dir: str, key: str, mmap: bool = True
+) -> Optional[RuptureTable]:
+    """
+    Returns the cached rupture table for `key`, or `None` if there is no
+    (readable) entry for it.
+    """
+    cache_path = _rupture_cache_path(cache_dir, key)
+    if not os.path.isdir(cache_path):
+        return None
+
+    try:
+        rupture_table = read_rupture_table(cache_path, mmap=mmap)
+    except (OSError, ValueError) as e:
+        logger.warning(f"could not read rupture cache {cache_path}: {e}")
+        return None
+
+    logger.info(f"  read {len(rupture_table)} ruptures from cache {cache_path}")
+    return rupture_table
+
+
+def write_cached_ruptures(cache_dir: str, key: str, rupture_table: RuptureTable):
+    """
+    Writes `rupture_table` into the cache under `key`.
+    """
+    cache_path = _rupture_cache_path(cache_dir, key)
+    logger.info(f"  writing {len(rupture_table)} ruptures to cache {cache_path}")
+    write_rupture_table(rupture_table, cache_path)
+
+
+def binned_rates_cache_key(
+    source_file: str,
+    binning: dict,
+    source_types: Optional[Sequence[str]] = None,
+    tectonic_region_types: Optional[Sequence[str]] = None,
+    **params,
+) -> str:
+    """
+    Makes the cache key for the binned rupture rates of a single source model
+    file.
+
+    :param source_file:
+        Source model XML file.
+
+    :param binning:
+        Parameters of the bins, as given by
+        :meth:`~openquake.hme.utils.binning.RuptureRateBinner.get_params`.
+
+    :param source_types:
+        Source type filter, as passed to
+        :func:`~openquake.hme.utils.io.sort_sources`.
+
+    :param tectonic_region_types:
+        Tectonic region type filter, as passed to
+        :func:`~openquake.hme.utils.io.sort_sources`.
+
+    :param params:
+        Any other parameters that change the binned rates, such as the
+        discretization parameters.
+    """
+    return make_cache_key(
+        [source_file],
+        binning=binning,
+        source_types=sorted(source_types) if source_types is not None else None,
+        tectonic_region_types=(
+            sorted(tectonic_region_types)
+            if tectonic_region_types is not None
+            else None
+        ),
+        **params,
+    )
+
+
+def _binned_rates_cache_path(cache_dir: str, key: str) -> str:
+    return os.path.join(cache_dir, f"rates_{key}.npz")
+
+
+def read_cached_binned_rates(cache_dir: str, key: str) -> Optional[dict]:
+    """
+    Returns the cached binned rates for `key` (as made by
+    :meth:`~openquake.hme.utils.binning.RuptureRateBinner.to_arrays`), or
+    `None` if there is no (readable) entry for it.
+    """
+    cache_path = _binned_rates_cache_path(cache_dir, key)
+    if not os.path.isfile(cache_path):
+        return None
+
+    try:
+        with np.load(cache_path, allow_pickle=False) as cached:
+            arrays = {name: cached[name] for name in cached.files}
+    except (OSError, ValueError) as e:
+        logger.warning(f"could not read rate cache {cache_path}: {e}")
+        return None
+
+    arrays["n_ruptures"] = int(arrays["n_ruptures"])
+    return arrays
+
+
+def write_cached_binned_rates(cache_dir: str, key: str, arrays: dict) -> None:
+    """
+    Writes binned rates (as made by
+    :meth:`~openquake.hme.utils.binning.RuptureRateBinner.to_arrays`) into
+    the cache under `key`. The file is written under a temporary name and
+    then moved into place.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = _binned_rates_cache_path(cache_dir, key)
+
+    # object arrays (the source ids) cannot be read back without pickle
+    arrays = {
+        name: (vals.astype(str) if getattr(vals, "dtype", None) == object else vals)
+        for name, vals in arrays.items()
+    }
+
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=".tmp_rates_", suffix=".npz")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, cache_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
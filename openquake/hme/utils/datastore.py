@@ -0,0 +1,225 @@
+"""
+Reading of ruptures that have already been generated by an OpenQuake
+calculation, from the `ruptures` array in the calculation's HDF5 datastore.
+
+The ruptures are read in chunks of rows, as arrays, so that they can be put
+straight into the bins (or into a
+:class:`~openquake.hme.utils.rupture_table.RuptureTable`) without making any
+rupture objects or reading the whole array into memory.
+"""
+import logging
+from typing import Iterator, Optional, Sequence
+
+import h5py
+import numpy as np
+
+from .binning import RuptureRateBinner
+from .rupture_table import RuptureTable, RuptureTableBuilder
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# the tectonic region type index is stored in the high bits of `trt_smr`
+TWO24 = 2 ** 24
+
+# source type codes in the datastore's `source_info` array
+SOURCE_TYPE_CODES = {
+    "area": (b"A",),
+    "simple_fault": (b"S", b"X"),
+    "complex_fault": (b"C",),
+    "point": (b"P",),
+    "multipoint": (b"M",),
+    "nonpar": (b"N",),
+}
+
+
+def _get_datastore_trts(h5: h5py.File) -> Optional[np.ndarray]:
+    for attrs in (h5["ruptures"].attrs, h5.attrs):
+        if "trts" in attrs:
+            return np.array([_to_str(trt) for trt in attrs["trts"]])
+    return None
+
+
+def _get_datastore_source_ids(h5: h5py.File) -> Optional[np.ndarray]:
+    if "source_info" in h5:
+        return np.array([_to_str(s) for s in h5["source_info"]["source_id"]])
+    return None
+
+
+def _to_str(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+def _get_hypocenters(chunk: np.ndarray):
+    if "hypo" in chunk.dtype.names:
+        return chunk["hypo"][:, 0], chunk["hypo"][:, 1], chunk["hypo"][:, 2]
+    return chunk["lon"], chunk["lat"], chunk["dep"]
+
+
+def iter_datastore_rupture_chunks(
+    datastore_file: str,
+    chunk_size: int = 100_000,
+    source_types: Optional[Sequence[str]] = None,
+    tectonic_region_types: Optional[Sequence[str]] = None,
+) -> Iterator[dict]:
+    """
+    Reads the `ruptures` array of an OpenQuake datastore in chunks of
+    `chunk_size` rows, yielding a dictionary of `longitude`, `latitude`,
+    `depth`, `mag`, `rake`, `occurrence_rate` and `source_id` arrays for each
+    chunk.
+
+    :param datastore_file:
+        HDF5 datastore of an OpenQuake calculation.
+
+    :param chunk_size:
+        Number of ruptures read at once.
+
+    :param source_types:
+        Types of the sources to keep ruptures from (as in
+        :func:`~openquake.hme.utils.io.sort_sources`), or `None` for all.
+        Requires the `source_info` array in the datastore.
+
+    :param tectonic_region_types:
+        Tectonic region types to keep ruptures from, or `None` for all.
+        Requires the tectonic region types to be stored as the `trts`
+        attribute of the datastore or of its `ruptures` array.
+    """
+    with h5py.File(datastore_file, "r") as h5:
+        rups = h5["ruptures"]
+
+        source_ids = _get_datastore_source_ids(h5)
+
+        keep_sources = None
+        if source_types is not None:
+            if "source_info" not in h5:
+                raise ValueError(
+                    f"{datastore_file} has no source_info to filter source types"
+                )
+            codes = [
+                code
+                for source_type in source_types
+                for code in SOURCE_TYPE_CODES.get(source_type, ())
+            ]
+            keep_sources = np.isin(h5["source_info"]["code"], codes)
+
+        keep_trts = None
+        if tectonic_region_types is not None:
+            trts = _get_datastore_trts(h5)
+            if trts is None:
+                raise ValueError(
+                    f"{datastore_file} has no trts to filter tectonic region types"
+                )
+            keep_trts = np.isin(trts, tectonic_region_types)
+
+        logger.info(f"  reading {len(rups)} ruptures from {datastore_file}")
+
+        for start in range(0, len(rups), chunk_size):
+            chunk = rups[start : start + chunk_size]
+
+            keep = np.ones(len(chunk), dtype=bool)
+            if keep_sources is not None:
+                keep &= keep_sources[chunk["source_id"]]
+            if keep_trts is not None:
+                keep &= keep_trts[chunk["trt_smr"] // TWO24]
+            chunk = chunk[keep]
+
+            if len(chunk) == 0:
+                continue
+
+            if source_ids is not None:
+                chunk_source_ids = source_ids[chunk["source_id"]]
+            else:
+                chunk_source_ids = np.array([_to_str(s) for s in chunk["source_id"]])
+
+            lons, lats, depths = _get_hypocenters(chunk)
+
+            yield {
+                "longitude": lons,
+                "latitude": lats,
+                "depth": depths,
+                "mag": chunk["mag"],
+                "rake": chunk["rake"] if "rake" in chunk.dtype.names else None,
+                "occurrence_rate": chunk["occurrence_rate"],
+                "source_id": chunk_source_ids,
+            }
+
+
+def bin_rupture_rates_from_datastore(
+    datastore_file: str,
+    binner: RuptureRateBinner,
+    chunk_size: int = 100_000,
+    source_types: Optional[Sequence[str]] = None,
+    tectonic_region_types: Optional[Sequence[str]] = None,
+) -> RuptureRateBinner:
+    """
+    Adds the occurrence rates of the ruptures in an OpenQuake datastore to the
+    bins of a :class:`~openquake.hme.utils.binning.RuptureRateBinner`, one
+    chunk at a time (see :func:`iter_datastore_rupture_chunks` for the
+    parameters).
+
+    :returns:
+        The `binner`, with the rupture rates added.
+    """
+    for chunk in iter_datastore_rupture_chunks(
+        datastore_file,
+        chunk_size=chunk_size,
+        source_types=source_types,
+        tectonic_region_types=tectonic_region_types,
+    ):
+        if binner.by_source:
+            # each batch added to the binner must be from a single source
+            for source_id in np.unique(chunk["source_id"]):
+                is_source = chunk["source_id"] == source_id
+                binner.add_ruptures(
+                    chunk["longitude"][is_source],
+                    chunk["latitude"][is_source],
+                    chunk["mag"][is_source],
+                    chunk["occurrence_rate"][is_source],
+                    source_id=str(source_id),
+                    depth=chunk["depth"][is_source],
+                )
+        else:
+            binner.add_ruptures(
+                chunk["longitude"],
+                chunk["latitude"],
+                chunk["mag"],
+                chunk["occurrence_rate"],
+                depth=chunk["depth"],
+            )
+
+    return binner
+
+
+def rupture_table_from_datastore(
+    datastore_file: str,
+    chunk_size: int = 100_000,
+    source_types: Optional[Sequence[str]] = None,
+    tectonic_region_types: Optional[Sequence[str]] = None,
+) -> RuptureTable:
+    """
+    Reads the ruptures in an OpenQuake datastore into a
+    :class:`~openquake.hme.utils.rupture_table.RuptureTable` (see
+    :func:`iter_datastore_rupture_chunks` for the parameters). The strike and
+    dip of the ruptures are not stored in the datastore's `ruptures` array,
+    and are left as `NaN`.
+    """
+    builder = RuptureTableBuilder()
+
+    for chunk in iter_datastore_rupture_chunks(
+        datastore_file,
+        chunk_size=chunk_size,
+        source_types=source_types,
+        tectonic_region_types=tectonic_region_types,
+    ):
+        rup_source_ids = chunk.pop("source_id")
+        if chunk["rake"] is None:
+            del chunk["rake"]
+
+        for source_id in np.unique(rup_source_ids):
+            is_source = rup_source_ids == source_id
+            builder.extend(
+                builder.get_source_idx(str(source_id)),
+                **{col: vals[is_source] for col, vals in chunk.items()},
+            )
+
+    return builder.to_table()
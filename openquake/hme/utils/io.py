@@ -1,8 +1,8 @@
 import os
 import logging
-from typing import Union, Optional, Sequence
+from multiprocessing import Pool
+from typing import Union, Optional, Sequence, Iterator, Tuple
 
-import pandas as pd
 from geopandas import GeoDataFrame
 
 from openquake.commonlib.logictree import SourceModelLogicTree
@@ -15,36 +15,177 @@ from openquake.hazardlib.source import (AreaSource, ComplexFaultSource,
 from .bins import SpacemagBin
 from .model import read
 from .plots import plot_mfd
+from .utils import _n_procs
 
 
-def _source_to_series(source):
-
+def get_source_type(source) -> Optional[str]:
+    """
+    Returns the type of a source (`area`, `simple_fault`, `complex_fault`,
+    `point`, `multipoint` or `nonpar`), or `None` if Hamlet does not handle
+    sources of its type.
+    """
     if isinstance(source, AreaSource):
-        source_type = 'area'
+        return 'area'
     elif isinstance(source, (SimpleFaultSource, CharacteristicFaultSource)):
-        source_type = 'simple_fault'
+        return 'simple_fault'
     elif isinstance(source, ComplexFaultSource):
-        source_type = 'complex_fault'
+        return 'complex_fault'
     elif isinstance(source, PointSource):
-        source_type = 'point'
+        return 'point'
     elif isinstance(source, MultiPointSource):
-        source_type = 'multipoint'
+        return 'multipoint'
     elif isinstance(source, NonParametricSeismicSource):
-        source_type = 'nonpar'
+        return 'nonpar'
     else:
-        return
+        return None
+
+
+def _read_source_file(source_file_w_args: tuple) -> tuple:
+    """
+    Reads the sources from a single source model file. Any exception is
+    caught and returned as a message, so that one bad file does not stop the
+    others from being read (or kill a worker process).
+    """
+    source_file, read_kwargs = source_file_w_args
+    try:
+        sources, _ = read(source_file, get_info=False, **read_kwargs)
+        return source_file, sources, None
+    except Exception as e:
+        return source_file, None, f'{e.__class__.__name__}: {e}'
+
+
+def iter_source_files(source_files: Sequence[str],
+                      n_procs: Optional[int] = 1,
+                      **read_kwargs) -> Iterator[Tuple[str, list, str]]:
+    """
+    Reads the sources from each of the `source_files`, yielding the results
+    for each file as soon as it is read. If `n_procs` is more than one, the
+    files are read in a pool of (at most) `n_procs` processes, and the
+    results are yielded in the order that the files finish, rather than in
+    the order given.
+
+    :param source_files:
+        Source model XML files.
+
+    :param n_procs:
+        Maximum number of files read at the same time. If `None` is passed, it
+        defaults to `os.cpu_count() - 1`.
+
+    :param read_kwargs:
+        Keyword arguments passed to :func:`~openquake.hme.utils.model.read`.
+
+    :returns:
+        Generator of (`source_file`, `sources`, `error`) tuples. If a file
+        could not be read, `sources` is `None` and `error` is the error
+        message; otherwise `error` is `None`.
+    """
+    args = [(source_file, read_kwargs) for source_file in source_files]
+    n_procs = min(n_procs or _n_procs, len(args))
+
+    if n_procs <= 1:
+        yield from map(_read_source_file, args)
+    else:
+        with Pool(n_procs) as pool:
+            yield from pool.imap_unordered(_read_source_file, args)
+
 
-    return pd.Series({
-        'source': source,
-        'tectonic_region_type': source.tectonic_region_type,
-        'source_type': source_type
-    })
+def _filter_sources(source_list: list,
+                    source_types: Optional[Sequence[str]] = None,
+                    tectonic_region_types: Optional[Sequence[str]] = None
+                    ) -> list:
+    """
+    Returns the sources in `source_list` of the given `source_types` and
+    `tectonic_region_types` (`None` keeps all of them), in the same order.
+    Sources of types that Hamlet does not handle are left out.
+
+    Most sources are already filtered out while the file is parsed (see
+    :func:`~openquake.hme.utils.model._filter_source_nodes`); this also
+    catches the few that are not, such as those in groups of mutually
+    exclusive sources.
+    """
+    filtered_sources = []
+    for source in source_list:
+        if source is None:
+            continue
+        source_type = get_source_type(source)
+        if source_type is None:
+            continue
+        if source_types is not None and source_type not in source_types:
+            continue
+        if (tectonic_region_types is not None and
+                source.tectonic_region_type not in tectonic_region_types):
+            continue
+        filtered_sources.append(source)
+
+    return filtered_sources
+
+
+def read_file_sources(source_files: Sequence[str],
+                      source_types: Optional[Sequence[str]] = None,
+                      tectonic_region_types: Optional[Sequence[str]] = None,
+                      area_source_discretization: float = 15.,
+                      rupture_mesh_spacing: float = 2.,
+                      complex_fault_mesh_spacing: float = 5.,
+                      n_procs: Optional[int] = 1,
+                      skip_bad_files: bool = False) -> dict:
+    """
+    Reads the sources from each of the `source_files`, optionally filtering
+    them by `source_type` and `tectonic_region_type` (see
+    :func:`sort_sources` for the parameters). The filters are applied while
+    the files are parsed, so the sources that are filtered out are never
+    built. Each file is read once, even if it is listed more than once.
+
+    The error of each file that could not be read is logged, and then a
+    `ValueError` naming all of those files is raised, unless
+    `skip_bad_files` is `True`, in which case they are left out.
+
+    :returns:
+        Dictionary with the list of sources in each source file.
+    """
+    source_files = list(dict.fromkeys(source_files))
+    file_sources = {}
+    bad_files = []
+
+    for source_file, sources, error in iter_source_files(
+            source_files,
+            n_procs=n_procs,
+            source_types=source_types,
+            tectonic_region_types=tectonic_region_types,
+            area_source_discretization=area_source_discretization,
+            rupture_mesh_spacing=rupture_mesh_spacing,
+            complex_fault_mesh_spacing=complex_fault_mesh_spacing):
+        if error is None:
+            file_sources[source_file] = _filter_sources(
+                sources,
+                source_types=source_types,
+                tectonic_region_types=tectonic_region_types)
+        else:
+            logging.error(f'error reading {source_file}: {error}')
+            bad_files.append(source_file)
+
+    if len(bad_files) > 0:
+        msg = (f'{len(bad_files)} of {len(source_files)} source files '
+               f'could not be read: {", ".join(bad_files)}')
+        if not skip_bad_files:
+            raise ValueError(msg)
+        logging.error(msg + '; skipping them')
+
+    # keep the order of the files given
+    return {
+        source_file: file_sources[source_file]
+        for source_file in source_files if source_file in file_sources
+    }
 
 
 def sort_sources(branch_sources: dict,
                  source_types: Optional[Sequence[str]] = None,
                  tectonic_region_types: Optional[Sequence[str]] = None,
-                 branch: Optional[str] = None) -> dict:
+                 branch: Optional[str] = None,
+                 area_source_discretization: float = 15.,
+                 rupture_mesh_spacing: float = 2.,
+                 complex_fault_mesh_spacing: float = 5.,
+                 n_procs: Optional[int] = 1,
+                 skip_bad_files: bool = False) -> dict:
     """
     Creates lists of sources for each branch of interest, optionally filtering
     sources by `source_type` and `tectonic_region_type`.
@@ -64,6 +205,25 @@ def sort_sources(branch_sources: dict,
         Branch to be evaluated; other branches will be skipped if this is not
         `None`.
 
+    :param area_source_discretization:
+        Spacing (in km) of the point sources that area sources are
+        discretized into.
+
+    :param rupture_mesh_spacing:
+        Mesh spacing (in km) of simple fault ruptures.
+
+    :param complex_fault_mesh_spacing:
+        Mesh spacing (in km) of complex fault ruptures.
+
+    :param n_procs:
+        Number of source files read in parallel (see
+        :func:`iter_source_files`). Defaults to 1, which reads the files
+        serially.
+
+    :param skip_bad_files:
+        Whether to leave out the files that could not be read, instead of
+        raising an error (see :func:`read_file_sources`).
+
     :returns:
         Dictionary with one list of sources per branch considered.
     """
@@ -73,47 +233,21 @@ def sort_sources(branch_sources: dict,
     for branch_name, source_file_list in branch_sources.items():
         if branch_name == branch or branch is None:
 
-            source_list = []
-
-            for source_file in source_file_list:
-                try:
-                    sources_from_file = read(source_file,
-                                             get_info=False,
-                                             area_source_discretization=15.,
-                                             rupture_mesh_spacing=2.,
-                                             complex_fault_mesh_spacing=5.)
-                except Exception as e:
-                    logging.warning(
-                        f'error reading {branch} {source_file}: {e}')
-
-                try:
-                    sources_from_file
-                except NameError:
-                    break
-
-                for source in sources_from_file:
-                    if isinstance(source, list):
-                        source_list.extend(
-                            [_source_to_series(s) for s in source])
-                    elif source is None:
-                        pass
-                    else:
-                        source_list.append(_source_to_series(source))
-
-            if len(source_list) == 1:
-                source_df = source_list[0].to_frame().transpose()
-            else:
-                source_df = pd.concat(source_list, axis=1).transpose()
-
-            logging.info(f'source df shape:{source_df.shape}')
-
-            if source_types is not None:
-                source_df = source_df[source_df.source_type.isin(source_types)]
-            if tectonic_region_types is not None:
-                source_df = source_df[source_df.tectonic_region_type.isin(
-                    tectonic_region_types)]
-
-            branch_source_lists[branch_name] = source_df['source'].to_list()
+            file_sources = read_file_sources(
+                source_file_list,
+                source_types=source_types,
+                tectonic_region_types=tectonic_region_types,
+                area_source_discretization=area_source_discretization,
+                rupture_mesh_spacing=rupture_mesh_spacing,
+                complex_fault_mesh_spacing=complex_fault_mesh_spacing,
+                n_procs=n_procs,
+                skip_bad_files=skip_bad_files)
+
+            # keep the order of the files in the logic tree
+            branch_source_lists[branch_name] = [
+                source for sources in file_sources.values()
+                for source in sources
+            ]
 
     return branch_source_lists
 
@@ -137,19 +271,41 @@ def read_branch_sources(base_dir,
     return d
 
 
+def read_branch_weights(base_dir,
+                        lt_file='ssmLT.xml',
+                        branch: Optional[str] = None) -> dict:
+    """
+    Returns the weight of each branch of the source model logic tree (or only
+    of `branch`, if it is given).
+    """
+    lt = SourceModelLogicTree(os.path.join(base_dir, lt_file))
+
+    return {
+        branch_name: float(lt_branch.weight)
+        for branch_name, lt_branch in lt.branches.items()
+        if branch_name == branch or branch is None
+    }
+
+
 def process_source_logic_tree(base_dir: str,
                               lt_file: str = 'ssmLT.xml',
                               branch: Optional[str] = None,
                               source_types: Optional[Sequence] = None,
                               tectonic_region_types: Optional[Sequence] = None,
-                              verbose: bool = False):
+                              verbose: bool = False,
+                              n_procs: Optional[int] = 1,
+                              skip_bad_files: bool = False,
+                              **discretization):
     if verbose:
         print('reading source branches')
     branch_sources = (read_branch_sources(base_dir, lt_file=lt_file))
     lt = sort_sources(branch_sources,
                       source_types=source_types,
                       tectonic_region_types=tectonic_region_types,
-                      branch=branch)
+                      branch=branch,
+                      n_procs=n_procs,
+                      skip_bad_files=skip_bad_files,
+                      **discretization)
 
     if verbose:
         print(lt.keys())
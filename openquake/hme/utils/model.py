@@ -10,7 +10,8 @@ from rtree import index
 from openquake.hazardlib.pmf import PMF
 from openquake.hazardlib.mfd import TruncatedGRMFD, EvenlyDiscretizedMFD
 from openquake.hazardlib.sourceconverter import SourceConverter
-from openquake.hazardlib.nrml import to_python
+from openquake.baselib.node import striptag
+from openquake.hazardlib.nrml import read as read_nrml, node_to_obj
 from openquake.hazardlib.geo.geodetic import distance, azimuth
 from openquake.hazardlib.source import (AreaSource, SimpleFaultSource,
                                         ComplexFaultSource,
@@ -27,12 +28,71 @@ def getcoo(lon, lat):
     return xp, yp
 
 
+# NRML tags of the sources of each source type
+SOURCE_TYPE_TAGS = {
+    'area': ('areaSource',),
+    'simple_fault': ('simpleFaultSource', 'characteristicFaultSource'),
+    'complex_fault': ('complexFaultSource',),
+    'point': ('pointSource',),
+    'multipoint': ('multiPointSource',),
+    'nonpar': ('nonParametricSeismicSource',),
+}
+
+
+def _filter_source_nodes(source_model_node,
+                         source_types=None,
+                         tectonic_region_types=None):
+    """
+    Removes the nodes of the sources that are not of the `source_types` and
+    `tectonic_region_types` from a `sourceModel` node, so that they are never
+    converted into sources. Source groups left without sources are removed.
+    Groups of mutually exclusive sources are kept whole (if any of their
+    sources is kept) so that their source weights still match.
+
+    :parameter source_model_node:
+        A `sourceModel` node, as read by :func:`openquake.hazardlib.nrml.read`
+    :parameter source_types:
+        Source types to keep (keys of `SOURCE_TYPE_TAGS`), or `None` for all
+    :parameter tectonic_region_types:
+        Tectonic region types to keep, or `None` for all
+    """
+    if source_types is None:
+        source_types = SOURCE_TYPE_TAGS.keys()
+    source_tags = {tag for source_type in source_types
+                   for tag in SOURCE_TYPE_TAGS.get(source_type, ())}
+
+    def keep(node, group_trt=None):
+        if striptag(node.tag) not in source_tags:
+            return False
+        if tectonic_region_types is None:
+            return True
+        trt = node.attrib.get('tectonicRegion') or group_trt
+        return trt in tectonic_region_types
+
+    kept_nodes = []
+    for node in source_model_node:
+        if striptag(node.tag) == 'sourceGroup':
+            group_trt = node.attrib.get('tectonicRegion')
+            group_nodes = [n for n in node if keep(n, group_trt)]
+            if len(group_nodes) == 0:
+                continue
+            if node.attrib.get('src_interdep') != 'mutex':
+                node.nodes = group_nodes
+            kept_nodes.append(node)
+        elif keep(node):
+            kept_nodes.append(node)
+
+    source_model_node.nodes = kept_nodes
+
+
 def _get_source_model(source_file,
                       investigation_time=1.,
                       rupture_mesh_spacing=10.0,
                       complex_fault_mesh_spacing=10.0,
                       width_of_mfd_bin=0.1,
                       area_source_discretization=20.,
+                      source_types=None,
+                      tectonic_region_types=None,
                       **kwargs):
     """
     Read and build a source model from an xml file
@@ -49,6 +109,11 @@ def _get_source_model(source_file,
         A positive float
     :parameter float area_discretisation:
         A positive float
+    :parameter source_types:
+        If given, only the sources of these types are built (see
+        :func:`_filter_source_nodes`)
+    :parameter tectonic_region_types:
+        If given, only the sources in these tectonic regions are built
     :returns:
         A list of :class:`~openquake.hazardlib.sourceconverter.SourceGroup`
         instances
@@ -56,7 +121,11 @@ def _get_source_model(source_file,
     conv = SourceConverter(investigation_time, rupture_mesh_spacing,
                            complex_fault_mesh_spacing, width_of_mfd_bin,
                            area_source_discretization, **kwargs)
-    srcs = to_python(source_file, conv)
+    [node] = read_nrml(source_file)
+    if source_types is not None or tectonic_region_types is not None:
+        _filter_source_nodes(node, source_types=source_types,
+                             tectonic_region_types=tectonic_region_types)
+    srcs = node_to_obj(node, source_file, conv)
     return srcs.src_groups
 
 
@@ -66,6 +135,9 @@ def read(model_filename, get_info=True, **kwargs):
 
     :parameter model_filename:
         The name (including path) to a nrml formatted earthquake source model
+    :parameter kwargs:
+        Passed to :func:`_get_source_model`, e.g. the discretization
+        parameters and the `source_types` and `tectonic_region_types` filters
     :return:
         A list of sources and information on the model
     """
@@ -0,0 +1,288 @@
+"""
+Columnar (struct-of-arrays) storage for the ruptures of a seismic source
+model.
+
+Instead of holding one Python object per rupture, the :class:`RuptureTable`
+holds one NumPy array per rupture parameter, and a table of the `source_id`
+values that the ruptures' integer source indices point into. Individual
+:class:`~openquake.hme.utils.simple_rupture.SimpleRupture` objects are only
+made on demand, when a single rupture is indexed or the table is iterated.
+"""
+from array import array
+from typing import Optional, Sequence, List
+
+import numpy as np
+import pandas as pd
+from openquake.hazardlib.geo.point import Point
+
+from .simple_rupture import SimpleRupture
+
+RUPTURE_TABLE_DTYPES = {
+    "mag": np.float64,
+    "occurrence_rate": np.float64,
+    "longitude": np.float64,
+    "latitude": np.float64,
+    "depth": np.float32,
+    "strike": np.float32,
+    "dip": np.float32,
+    "rake": np.float32,
+    "source_idx": np.int32,
+}
+
+# typecodes for the `array.array` buffers used while building a table
+_ARRAY_TYPECODES = {
+    "mag": "d",
+    "occurrence_rate": "d",
+    "longitude": "d",
+    "latitude": "d",
+    "depth": "f",
+    "strike": "f",
+    "dip": "f",
+    "rake": "f",
+    "source_idx": "i",
+}
+
+
+class RuptureTable:
+    """
+    Struct-of-arrays container of ruptures. Each rupture parameter (`mag`,
+    `occurrence_rate`, `longitude`, `latitude`, `depth`, `strike`, `dip`,
+    `rake`) is a NumPy array, and `source_idx` is an integer index into the
+    `source_ids` table.
+
+    :param source_ids:
+        Sequence of the `source_id` values of the sources that the ruptures
+        belong to.
+
+    :param columns:
+        Arrays of the rupture parameters, with names given by the keys of
+        `RUPTURE_TABLE_DTYPES`. All must have the same length. Missing
+        parameters are filled with `NaN` (or 0 for `source_idx`).
+    """
+
+    columns = tuple(RUPTURE_TABLE_DTYPES.keys())
+
+    def __init__(self, source_ids: Optional[Sequence[str]] = None, **columns):
+
+        n_rups = None
+        for name, col in columns.items():
+            if name not in RUPTURE_TABLE_DTYPES:
+                raise ValueError(f"{name} is not a rupture table column")
+            if n_rups is None:
+                n_rups = len(col)
+            elif len(col) != n_rups:
+                raise ValueError("all rupture table columns must be same length")
+
+        n_rups = n_rups or 0
+
+        for name, dtype in RUPTURE_TABLE_DTYPES.items():
+            if name in columns:
+                col = np.asarray(columns[name], dtype=dtype)
+            elif name == "source_idx":
+                col = np.zeros(n_rups, dtype=dtype)
+            else:
+                col = np.full(n_rups, np.nan, dtype=dtype)
+            setattr(self, name, col)
+
+        self.source_ids = np.asarray(
+            source_ids if source_ids is not None else [], dtype=object
+        )
+
+    def __len__(self) -> int:
+        return len(self.mag)
+
+    def __repr__(self) -> str:
+        return "<RuptureTable: {} ruptures from {} sources>".format(
+            len(self), len(self.source_ids)
+        )
+
+    def __getitem__(self, idx):
+        """
+        Returns a single :class:`SimpleRupture` if `idx` is an integer,
+        otherwise a new :class:`RuptureTable` with the selected rows (from a
+        slice, integer index array or Boolean mask), sharing the
+        `source_ids` table.
+        """
+        if np.isscalar(idx):
+            return self._make_rupture(int(idx))
+
+        return RuptureTable(
+            source_ids=self.source_ids,
+            **{name: getattr(self, name)[idx] for name in self.columns},
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._make_rupture(i)
+
+    def _make_rupture(self, i: int) -> SimpleRupture:
+        if len(self.source_ids) > 0:
+            source = self.source_ids[self.source_idx[i]]
+        else:
+            source = None
+
+        return SimpleRupture(
+            strike=float(self.strike[i]),
+            dip=float(self.dip[i]),
+            rake=float(self.rake[i]),
+            mag=float(self.mag[i]),
+            hypocenter=Point(
+                float(self.longitude[i]),
+                float(self.latitude[i]),
+                float(self.depth[i]),
+            ),
+            occurrence_rate=float(self.occurrence_rate[i]),
+            source=source,
+        )
+
+    @property
+    def source(self) -> np.ndarray:
+        """
+        The `source_id` of each rupture.
+        """
+        return self.source_ids[self.source_idx]
+
+    @classmethod
+    def concatenate(cls, tables: Sequence["RuptureTable"]) -> "RuptureTable":
+        """
+        Joins several rupture tables into one, merging their source id tables
+        (so that a source whose ruptures are split between several tables
+        gets a single source index).
+        """
+        tables = [t for t in tables if t is not None]
+        if len(tables) == 0:
+            return cls()
+
+        all_source_ids = np.concatenate(
+            [np.asarray(t.source_ids, dtype=object) for t in tables]
+        )
+        source_ids, inverse = np.unique(
+            all_source_ids.astype(str), return_inverse=True
+        )
+
+        offset = 0
+        source_idxs = []
+        for t in tables:
+            source_idxs.append(inverse[offset + t.source_idx])
+            offset += len(t.source_ids)
+
+        cols = {
+            name: np.concatenate([getattr(t, name) for t in tables])
+            for name in cls.columns
+            if name != "source_idx"
+        }
+
+        return cls(
+            source_ids=source_ids.astype(object),
+            source_idx=np.concatenate(source_idxs),
+            **cols,
+        )
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> "RuptureTable":
+        """
+        Makes a rupture table from a DataFrame with the rupture table columns
+        (as made by :meth:`RuptureTable.to_dataframe`); the `source` column
+        should be a categorical column.
+        """
+        cols = {name: df[name].values for name in cls.columns if name in df}
+
+        if "source" in df:
+            source = df["source"].astype("category")
+            cols["source_idx"] = source.cat.codes.values
+            source_ids = list(source.cat.categories)
+        else:
+            source_ids = None
+
+        return cls(source_ids=source_ids, **cols)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Returns a DataFrame with one (numeric) column per rupture parameter.
+        The sources are stored as a categorical `source` column, which keeps
+        the integer source index and the source id table.
+        """
+        df = pd.DataFrame(
+            {name: getattr(self, name) for name in self.columns if name != "source_idx"}
+        )
+        if len(self.source_ids) > 0:
+            df["source"] = pd.Categorical.from_codes(
+                self.source_idx, categories=pd.Index(self.source_ids.astype(str))
+            )
+        return df
+
+
+class RuptureTableBuilder:
+    """
+    Accumulates rupture parameters in compact `array.array` buffers, so that
+    a :class:`RuptureTable` can be built from a stream of ruptures without
+    keeping any per-rupture Python objects.
+    """
+
+    def __init__(self):
+        self.source_ids: List[str] = []
+        self._source_lookup = {}
+        self._cols = {name: array(tc) for name, tc in _ARRAY_TYPECODES.items()}
+
+    def __len__(self) -> int:
+        return len(self._cols["mag"])
+
+    def get_source_idx(self, source_id: str) -> int:
+        try:
+            return self._source_lookup[source_id]
+        except KeyError:
+            idx = len(self.source_ids)
+            self._source_lookup[source_id] = idx
+            self.source_ids.append(source_id)
+            return idx
+
+    def append(
+        self,
+        mag: float,
+        occurrence_rate: float,
+        longitude: float,
+        latitude: float,
+        depth: float,
+        strike: float,
+        dip: float,
+        rake: float,
+        source_idx: int,
+    ) -> None:
+        cols = self._cols
+        cols["mag"].append(mag)
+        cols["occurrence_rate"].append(occurrence_rate)
+        cols["longitude"].append(longitude)
+        cols["latitude"].append(latitude)
+        cols["depth"].append(depth)
+        cols["strike"].append(strike)
+        cols["dip"].append(dip)
+        cols["rake"].append(rake)
+        cols["source_idx"].append(source_idx)
+
+    def extend(self, source_idx: int, **columns) -> None:
+        """
+        Appends a batch of ruptures from one source, given as arrays of the
+        rupture parameters (`mag`, `occurrence_rate`, `longitude`,
+        `latitude`, `depth`, `strike`, `dip`, `rake`). Missing parameters are
+        filled with `NaN`.
+        """
+        n_rups = len(columns["mag"])
+        columns["source_idx"] = np.full(n_rups, source_idx)
+
+        for name, col in self._cols.items():
+            if name in columns:
+                values = columns[name]
+            else:
+                values = np.full(n_rups, np.nan)
+            col.frombytes(
+                np.ascontiguousarray(values, dtype=RUPTURE_TABLE_DTYPES[name]).tobytes()
+            )
+
+    def to_table(self) -> RuptureTable:
+        return RuptureTable(
+            source_ids=self.source_ids,
+            **{
+                name: np.frombuffer(col, dtype=RUPTURE_TABLE_DTYPES[name]).copy()
+                for name, col in self._cols.items()
+            },
+        )
@@ -0,0 +1,130 @@
+"""
+Memory-aware scheduling of work in a process pool.
+
+Tasks are only started when there is a free process and when starting them
+keeps the number of ruptures being worked on (and, optionally, the resident
+memory of the whole process tree) within a budget. Otherwise the scheduler
+waits for running tasks to finish before starting new ones, so peak memory
+depends on the budget rather than on the number of cores.
+"""
+import os
+import logging
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterator, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def get_memory_use(pid: Optional[int] = None) -> Optional[float]:
+    """
+    Returns the resident memory (in GB) of the process `pid` (the current
+    process by default) and all of its child processes, or `None` if
+    `psutil` is not installed.
+    """
+    if psutil is None:
+        return None
+
+    proc = psutil.Process(pid or os.getpid())
+    rss = proc.memory_info().rss
+    for child in proc.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return rss * 1e-9
+
+
+def iter_budgeted_tasks(
+    func: Callable,
+    tasks: Sequence,
+    task_sizes: Sequence[int],
+    n_procs: int,
+    max_in_flight_rups: Optional[int] = None,
+    max_rss_gb: Optional[float] = None,
+) -> Iterator:
+    """
+    Runs `func` on each of the `tasks` in a pool of `n_procs` processes, and
+    yields the results as the tasks finish.
+
+    A task is started only when a process is free, and when the sum of the
+    sizes of the running tasks (including the new one) is no more than
+    `max_in_flight_rups` and the memory use of this process and its workers
+    is under `max_rss_gb`. If neither holds, the scheduler waits for a running
+    task to finish first. A task is always started if nothing is running, so
+    a single task larger than the budget can still run (by itself). The
+    memory use is only checked before starting a task; running tasks are not
+    stopped if it grows past `max_rss_gb` afterwards.
+
+    If a worker process dies (e.g. it is killed by the operating system for
+    using too much memory), a :class:`RuntimeError` naming the tasks that
+    were running is raised, rather than waiting for their results forever.
+
+    :param func:
+        Function run on each task. It must be picklable.
+
+    :param tasks:
+        Arguments for `func`, one per task.
+
+    :param task_sizes:
+        Size of each task, typically the number of ruptures.
+
+    :param n_procs:
+        Number of processes.
+
+    :param max_in_flight_rups:
+        Maximum total size of the running tasks, or `None` for no limit.
+
+    :param max_rss_gb:
+        Maximum resident memory (in GB) of this process and its workers, or
+        `None` for no limit. Requires `psutil`.
+    """
+    if max_rss_gb is not None and psutil is None:
+        logger.warning("psutil is not installed; the memory budget is not used")
+        max_rss_gb = None
+
+    # (task index, task size) of the running tasks, keyed by their futures
+    in_flight = {}
+
+    def can_start(size):
+        if len(in_flight) == 0:
+            return True
+        if len(in_flight) >= n_procs:
+            return False
+        if (
+            max_in_flight_rups is not None
+            and sum(s for _, s in in_flight.values()) + size > max_in_flight_rups
+        ):
+            return False
+        if max_rss_gb is not None and get_memory_use() > max_rss_gb:
+            return False
+        return True
+
+    pending = iter(enumerate(zip(tasks, task_sizes)))
+    next_task = next(pending, None)
+
+    with ProcessPoolExecutor(n_procs) as executor:
+        while next_task is not None or len(in_flight) > 0:
+            while next_task is not None and can_start(next_task[1][1]):
+                i, (task, size) = next_task
+                in_flight[executor.submit(func, task)] = (i, size)
+                next_task = next(pending, None)
+
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except BrokenProcessPool as err:
+                    running = sorted(i for i, _ in in_flight.values())
+                    raise RuntimeError(
+                        "a worker process died while running tasks {}; it may "
+                        "have been killed for using too much memory".format(running)
+                    ) from err
+                in_flight.pop(future)
+                yield result
@@ -0,0 +1,196 @@
+"""
+Rupture occurrence rates calculated directly from the parameters of
+distributed-seismicity sources.
+
+For point, area and multipoint sources, all of the ruptures at a point share
+the hypocenter longitude and latitude, and the nodal plane probabilities sum to
+one. The total rate at each point, magnitude and hypocentral depth is
+therefore just the product of the MFD rate and the hypocentral depth
+probability, so there is no need to build the (magnitude × nodal plane ×
+hypocentral depth) ruptures to find it.
+
+For non-parametric sources, the ruptures are already listed in the source,
+and their expected numbers of occurrences are found for all of them at once.
+"""
+from typing import Optional
+
+import numpy as np
+from openquake.hazardlib.source import (
+    AreaSource,
+    PointSource,
+    MultiPointSource,
+    NonParametricSeismicSource,
+)
+
+RATE_ONLY_SOURCE_TYPES = (PointSource, AreaSource, MultiPointSource)
+
+
+def _get_point_rates(
+    lons: np.ndarray, lats: np.ndarray, mag_rates: np.ndarray, hypo_depths
+) -> dict:
+    """
+    Makes the arrays of rupture rates for every combination of point,
+    magnitude and hypocentral depth.
+
+    :param lons:
+        Longitudes of the points.
+
+    :param lats:
+        Latitudes of the points.
+
+    :param mag_rates:
+        Array of (magnitude, annual occurrence rate) pairs at each point.
+
+    :param hypo_depths:
+        Hypocentral depth distribution, as (probability, depth) pairs.
+    """
+    mag_rates = np.asarray(mag_rates, dtype=np.float64).reshape(-1, 2)
+    hypo_depths = np.asarray(hypo_depths, dtype=np.float64).reshape(-1, 2)
+
+    n_pts, n_mags, n_depths = len(lons), len(mag_rates), len(hypo_depths)
+    shape = (n_pts, n_mags, n_depths)
+
+    rates = mag_rates[:, 1][None, :, None] * hypo_depths[:, 0][None, None, :]
+
+    return {
+        "longitude": np.broadcast_to(
+            np.asarray(lons, dtype=np.float64)[:, None, None], shape
+        ).ravel(),
+        "latitude": np.broadcast_to(
+            np.asarray(lats, dtype=np.float64)[:, None, None], shape
+        ).ravel(),
+        "depth": np.broadcast_to(hypo_depths[:, 1][None, None, :], shape).ravel(),
+        "mag": np.broadcast_to(mag_rates[:, 0][None, :, None], shape).ravel(),
+        "occurrence_rate": np.broadcast_to(rates, shape).ravel(),
+    }
+
+
+def _concat_rates(rate_list: list) -> dict:
+    return {
+        col: np.concatenate([rates[col] for rates in rate_list])
+        for col in rate_list[0].keys()
+    }
+
+
+def get_point_source_rates(source: PointSource) -> dict:
+    """
+    Returns the rupture rates of a :class:`PointSource`, summed over the
+    nodal planes.
+    """
+    return _get_point_rates(
+        [source.location.longitude],
+        [source.location.latitude],
+        source.get_annual_occurrence_rates(),
+        source.hypocenter_distribution.data,
+    )
+
+
+def get_area_source_rates(source: AreaSource) -> dict:
+    """
+    Returns the rupture rates of an :class:`AreaSource`, summed over the
+    nodal planes. The area is discretized into points in the same way as in
+    OpenQuake, and the MFD is divided evenly between the points.
+    """
+    mesh = source.polygon.discretize(source.area_discretization)
+    n_pts = len(mesh)
+
+    mag_rates = np.array(source.get_annual_occurrence_rates(), dtype=np.float64)
+    mag_rates = mag_rates.reshape(-1, 2)
+    mag_rates[:, 1] /= n_pts
+
+    return _get_point_rates(
+        mesh.lons.ravel(),
+        mesh.lats.ravel(),
+        mag_rates,
+        source.hypocenter_distribution.data,
+    )
+
+
+def get_multipoint_source_rates(source: MultiPointSource) -> dict:
+    """
+    Returns the rupture rates of a :class:`MultiPointSource`, summed over the
+    nodal planes. Each point has its own MFD.
+    """
+    return _concat_rates(
+        [get_point_source_rates(point_source) for point_source in source]
+    )
+
+
+def _get_expected_occurrences(pmfs: list) -> np.ndarray:
+    """
+    Returns the expected number of occurrences for each of the probability
+    mass functions in `pmfs`. Each is either a
+    :class:`~openquake.hazardlib.pmf.PMF` of (probability, number of
+    occurrences) pairs, or an array of the probabilities of 0, 1, 2...
+    occurrences.
+    """
+    probs = []
+    n_occurrences = []
+    for pmf in pmfs:
+        if hasattr(pmf, "data"):
+            pmf_data = np.asarray(pmf.data, dtype=np.float64).reshape(-1, 2)
+            probs.append(pmf_data[:, 0])
+            n_occurrences.append(pmf_data[:, 1])
+        else:
+            pmf_probs = np.asarray(pmf, dtype=np.float64).ravel()
+            probs.append(pmf_probs)
+            n_occurrences.append(np.arange(len(pmf_probs), dtype=np.float64))
+
+    rup_idx = np.repeat(np.arange(len(probs)), [len(p) for p in probs])
+
+    return np.bincount(
+        rup_idx,
+        weights=np.concatenate(probs) * np.concatenate(n_occurrences),
+        minlength=len(probs),
+    )
+
+
+def get_nonparametric_source_rates(source: NonParametricSeismicSource) -> dict:
+    """
+    Returns the rates of the ruptures of a :class:`NonParametricSeismicSource`
+    (their expected annual numbers of occurrences), with their `longitude`,
+    `latitude`, `depth`, `mag` and `rake`, as arrays with one value per
+    rupture, in the same order as the source's `data`.
+    """
+    rup_params = np.array(
+        [
+            (
+                rup.hypocenter.longitude,
+                rup.hypocenter.latitude,
+                rup.hypocenter.depth,
+                rup.mag,
+                rup.rake,
+            )
+            for rup, pmf in source.data
+        ],
+        dtype=np.float64,
+    ).reshape(-1, 5)
+
+    return {
+        "longitude": rup_params[:, 0],
+        "latitude": rup_params[:, 1],
+        "depth": rup_params[:, 2],
+        "mag": rup_params[:, 3],
+        "rake": rup_params[:, 4],
+        "occurrence_rate": _get_expected_occurrences(
+            [pmf for rup, pmf in source.data]
+        ),
+    }
+
+
+def get_source_rates(source) -> Optional[dict]:
+    """
+    Returns the rupture rates of a point, area or multipoint source, as a
+    dictionary of `longitude`, `latitude`, `depth`, `mag` and
+    `occurrence_rate` arrays, with one value for each combination of point,
+    magnitude and hypocentral depth. Returns `None` for other types of
+    sources, whose ruptures must be built to find their locations.
+    """
+    if isinstance(source, MultiPointSource):
+        return get_multipoint_source_rates(source)
+    elif isinstance(source, AreaSource):
+        return get_area_source_rates(source)
+    elif isinstance(source, PointSource):
+        return get_point_source_rates(source)
+    else:
+        return None
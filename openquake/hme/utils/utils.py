@@ -2,12 +2,14 @@ import os
 import json
 import logging
 import datetime
-from time import time, sleep
+from array import array
+from time import time
 from functools import partial
+from itertools import islice
 from multiprocessing import Pool
 from collections import deque
 from collections.abc import Mapping
-from typing import Sequence, List, Optional, Union, Tuple
+from typing import Callable, Sequence, List, Optional, Union, Tuple
 
 import attr
 import dateutil
@@ -17,16 +19,37 @@ import geopandas as gpd
 
 from h3 import h3
 from tqdm import tqdm, trange
-from shapely.geometry import Point, Polygon
-from openquake.hazardlib.source.rupture_collection import split
-from openquake.hazardlib.source import MultiPointSource, ComplexFaultSource
+from shapely.geometry import Point, Polygon, box
+from shapely.prepared import prep
+from openquake.hazardlib.mfd import ArbitraryMFD
+from openquake.hazardlib.geo.geodetic import azimuth
+from openquake.hazardlib.geo.surface import ComplexFaultSurface, PlanarSurface
+from openquake.hazardlib.source import (
+    MultiPointSource,
+    ComplexFaultSource,
+    SimpleFaultSource,
+    NonParametricSeismicSource,
+)
 from openquake.hazardlib.source.rupture import (
     NonParametricProbabilisticRupture,
     ParametricProbabilisticRupture,
 )
 
 from .simple_rupture import SimpleRupture
-from .bins import SpacemagBin
+from .rupture_table import RuptureTable, RuptureTableBuilder
+from .binning import (
+    PolygonBinIndex,
+    RuptureRateBinner,
+    bin_ids_to_str,
+    get_h3_cells,
+    get_h3_cell_polygons,
+    get_mag_bin_idx,
+    get_nearest_mag_bin_idx,
+    h3_cells_to_str,
+)
+from .source_rates import get_source_rates, get_nonparametric_source_rates
+from .scheduler import iter_budgeted_tasks
+from .bins import SpacemagBin, BinCollection
 from .stats import sample_event_times_in_interval
 
 _n_procs = max(1, os.cpu_count() - 1)
@@ -128,6 +151,7 @@ def rupture_dict_from_logic_tree_dict(
     simple_ruptures: bool = True,
     parallel: bool = True,
     n_procs: Optional[int] = _n_procs,
+    **budget,
 ) -> dict:
     """
     Creates a dictionary of ruptures from a dictionary representation of a 
@@ -157,6 +181,11 @@ def rupture_dict_from_logic_tree_dict(
         Number of parallel processes. If `None` is passed, it defaults to
         `os.cpu_count() -1`. Only used if `parallel` is `True`.
 
+    :param budget:
+        Work unit size and memory budget for the parallel processing
+        (`max_rups_per_task`, `max_in_flight_rups`, `max_rss_gb`), passed to
+        :func:`rupture_list_from_source_list_parallel`.
+
     :returns:
         Ruptures from the logic tree collected into each logic tree branch.
 
@@ -165,7 +194,10 @@ def rupture_dict_from_logic_tree_dict(
     if parallel is True:
         return {
             branch_name: rupture_list_from_source_list_parallel(
-                source_list, simple_ruptures=simple_ruptures, n_procs=n_procs
+                source_list,
+                simple_ruptures=simple_ruptures,
+                n_procs=n_procs,
+                **budget,
             )
             for branch_name, source_list in logic_tree_dict.items()
         }
@@ -180,51 +212,136 @@ def rupture_dict_from_logic_tree_dict(
 
 def rupture_list_from_source_list(
     source_list: list, simple_ruptures: bool = True
-) -> list:
+) -> Union[RuptureTable, list]:
     """
-    Creates a list of ruptures from all of the sources within a single logic
-    tree branch, adding the `source_id` of each source to the rupture as an
-    attribute called `source`.
+    Creates a table of ruptures from all of the sources within a single logic
+    tree branch, recording the `source_id` of each source as the rupture's
+    `source`.
 
     :param source_list:
         List of sources containing ruptures.
 
     :param simple_ruptures:
-        Whether to use
-        :class:`openquake.hme.utils.simple_rupture.SimpleRupture` to represent
-        ruptures, instead of the full OpenQuake version.
+        Whether to store the ruptures in a columnar
+        :class:`~openquake.hme.utils.rupture_table.RuptureTable`, instead of
+        as a list of the full OpenQuake ruptures.
 
     :returns:
         All of the ruptures from all sources of `sources_types` in the logic
         tree branch.
     """
 
-    rupture_list = []
+    if simple_ruptures is False:
+        return [
+            _process_rup(r, source, simple_ruptures=False)
+            for source in source_list
+            for r in source.iter_ruptures()
+        ]
 
-    rups = [
-        _process_rup(r, source, simple_ruptures=simple_ruptures)
-        for source in source_list
-        for r in source.iter_ruptures()
-    ]
+    builder = RuptureTableBuilder()
+    for source in source_list:
+        _add_source_to_builder(source, builder)
 
-    rupture_list.extend(rups)
+    return builder.to_table()
 
-    return rupture_list
+
+def _get_surface_strike_dip(surface) -> Tuple[float, float]:
+    try:
+        return surface.get_strike(), surface.get_dip()
+    except Exception:
+        return np.nan, np.nan
+
+
+def _get_top_edge_strike(surface) -> float:
+    """
+    Returns the azimuth from the first to the last point of the top edge of a
+    fault surface's mesh, which is the strike of a straight fault (following
+    the right-hand rule).
+    """
+    lons = surface.mesh.lons
+    lats = surface.mesh.lats
+    return azimuth(lons[0, 0], lats[0, 0], lons[0, -1], lats[0, -1])
+
+
+def _make_strike_dip_getter(source):
+    """
+    Returns a function that gives the (strike, dip) of each of the ruptures
+    of `source`, without the mesh computations of
+    :meth:`get_strike` and :meth:`get_dip` for every rupture where possible:
+
+    - the planar surfaces of point source ruptures already have their strike
+      and dip;
+
+    - the ruptures of a simple fault source all have the dip of the source,
+      and their strike is that of the top edge of their (already built) mesh;
+
+    - the ruptures of a complex fault source have the mean dip of the whole
+      fault surface, which is only calculated once, and the strike of the top
+      edge of their mesh.
+
+    Other ruptures use the strike and dip of their surfaces.
+    """
+    if isinstance(source, _RuptureRange):
+        source = source.source
+
+    if isinstance(source, SimpleFaultSource):
+        dip = source.dip
+
+        def get_strike_dip(rup):
+            return _get_top_edge_strike(rup.surface), dip
+
+    elif isinstance(source, ComplexFaultSource):
+        source_surface = {}
+
+        def get_strike_dip(rup):
+            if "dip" not in source_surface:
+                source_surface["dip"] = _get_surface_strike_dip(
+                    ComplexFaultSurface.from_fault_data(
+                        source.edges, source.rupture_mesh_spacing
+                    )
+                )[1]
+            return _get_top_edge_strike(rup.surface), source_surface["dip"]
+
+    else:
+
+        def get_strike_dip(rup):
+            if isinstance(rup.surface, PlanarSurface):
+                return rup.surface.strike, rup.surface.dip
+            return _get_surface_strike_dip(rup.surface)
+
+    def get_strike_dip_or_nan(rup):
+        try:
+            return get_strike_dip(rup)
+        except Exception:
+            return np.nan, np.nan
+
+    return get_strike_dip_or_nan
 
 
 def _process_rup(
     rup: Union[ParametricProbabilisticRupture, NonParametricProbabilisticRupture],
     source,
     simple_ruptures=True,
+    get_strike_dip: Optional[Callable] = None,
 ):
+    """
+    Returns the rupture as a :class:`SimpleRupture` (or, if `simple_ruptures`
+    is `False`, the rupture itself), recording the `source_id` of the
+    `source`. The `get_strike_dip` function (see
+    :func:`_make_strike_dip_getter`) is needed for simple ruptures, and
+    should be made once per source by the caller.
+    """
+    if get_strike_dip is None and simple_ruptures is not False:
+        raise ValueError("get_strike_dip is needed to make simple ruptures")
 
     try:
         if simple_ruptures is False:
             rup.source = source.source_id
         elif isinstance(rup, ParametricProbabilisticRupture):
+            strike, dip = get_strike_dip(rup)
             rup = SimpleRupture(
-                strike=rup.surface.get_strike(),
-                dip=rup.surface.get_dip(),
+                strike=strike,
+                dip=dip,
                 rake=rup.rake,
                 mag=rup.mag,
                 hypocenter=rup.hypocenter,
@@ -233,16 +350,15 @@ def _process_rup(
             )
 
         elif isinstance(rup, NonParametricProbabilisticRupture):
-            occurrence_rate = sum(
-                i * prob_occur for i, prob_occur in enumerate(rup.probs_occur)
-            )
+            strike, dip = get_strike_dip(rup)
             rup = SimpleRupture(
-                strike=rup.surface.get_strike(),
-                dip=rup.surface.get_dip(),
+                strike=strike,
+                dip=dip,
                 rake=rup.rake,
                 mag=rup.mag,
                 hypocenter=rup.hypocenter,
-                occurrence_rate=occurrence_rate,
+                occurrence_rate=_get_rupture_occurrence_rate(rup),
+                source=source.source_id,
             )
         return rup
     except:
@@ -250,11 +366,282 @@ def _process_rup(
         return rup
 
 
+def _get_rupture_occurrence_rate(
+    rup: Union[ParametricProbabilisticRupture, NonParametricProbabilisticRupture]
+) -> float:
+    """
+    Returns the annual occurrence rate of a rupture; for non-parametric
+    ruptures this is the expected number of occurrences.
+    """
+    if isinstance(rup, NonParametricProbabilisticRupture):
+        return float(np.dot(rup.probs_occur, np.arange(len(rup.probs_occur))))
+    return rup.occurrence_rate
+
+
+def _add_rup_to_builder(
+    rup: Union[ParametricProbabilisticRupture, NonParametricProbabilisticRupture],
+    source_idx: int,
+    builder: RuptureTableBuilder,
+    get_strike_dip: Optional[Callable] = None,
+) -> None:
+    """
+    Appends the parameters of a single OpenQuake rupture to the columns of a
+    :class:`~openquake.hme.utils.rupture_table.RuptureTableBuilder`.
+    `get_strike_dip` gives the rupture's strike and dip (see
+    :func:`_make_strike_dip_getter`); by default they are calculated from its
+    surface.
+    """
+
+    occurrence_rate = _get_rupture_occurrence_rate(rup)
+
+    if get_strike_dip is None:
+        strike, dip = _get_surface_strike_dip(rup.surface)
+    else:
+        strike, dip = get_strike_dip(rup)
+
+    builder.append(
+        mag=rup.mag,
+        occurrence_rate=occurrence_rate,
+        longitude=rup.hypocenter.longitude,
+        latitude=rup.hypocenter.latitude,
+        depth=rup.hypocenter.depth,
+        strike=strike,
+        dip=dip,
+        rake=rup.rake,
+        source_idx=source_idx,
+    )
+
+
+def _add_source_to_builder(
+    source, builder: RuptureTableBuilder, pbar: tqdm = None
+) -> None:
+
+    source_idx = builder.get_source_idx(source.source_id)
+    get_strike_dip = _make_strike_dip_getter(source)
+    n_rups = len(builder)
+
+    if isinstance(source, NonParametricSeismicSource):
+        # the ruptures are listed in the source, so they can be added at once
+        rup_params = get_nonparametric_source_rates(source)
+        strike_dip = np.array(
+            [get_strike_dip(rup) for rup, pmf in source.data], dtype=np.float64
+        ).reshape(-1, 2)
+        builder.extend(
+            source_idx, strike=strike_dip[:, 0], dip=strike_dip[:, 1], **rup_params
+        )
+    else:
+        for rup in source.iter_ruptures():
+            _add_rup_to_builder(rup, source_idx, builder, get_strike_dip=get_strike_dip)
+
+    if pbar is not None:
+        pbar.update(n=len(builder) - n_rups)
+
+
+def bin_rupture_rates_from_source_list(
+    source_list: list,
+    binner: RuptureRateBinner,
+    chunk_size: int = 100_000,
+    analytic_point_sources: bool = True,
+    progress: bool = True,
+) -> RuptureRateBinner:
+    """
+    Adds the occurrence rates of the ruptures from all of the sources in
+    `source_list` to the bins of a
+    :class:`~openquake.hme.utils.binning.RuptureRateBinner`, without keeping
+    the ruptures. The ruptures are read from each source and reduced into the
+    bins in batches of `chunk_size`, so the memory use depends on the number
+    of occupied bins rather than on the number of ruptures.
+
+    :param source_list:
+        List of sources containing ruptures.
+
+    :param binner:
+        Binner that the rupture rates are added to.
+
+    :param chunk_size:
+        Number of ruptures held in memory before they are added to the bins.
+
+    :param analytic_point_sources:
+        Whether to calculate the rates of point, area and multipoint sources
+        directly from their MFDs, locations and hypocentral depth
+        distributions (see
+        :func:`~openquake.hme.utils.source_rates.get_source_rates`), rather
+        than building their ruptures. The rates of non-parametric sources are
+        always read from the sources' rupture lists all at once.
+
+    :param progress:
+        Whether to show a progress bar.
+
+    :returns:
+        The `binner`, with the rupture rates added.
+    """
+    cols = {
+        col: array("d")
+        for col in ("longitude", "latitude", "depth", "mag", "occurrence_rate")
+    }
+
+    def add_chunk_to_binner(source_id=None):
+        binner.add_ruptures(
+            source_id=source_id,
+            **{col: np.frombuffer(vals) for col, vals in cols.items()},
+        )
+        for col in cols:
+            cols[col] = array("d")
+
+    for source in tqdm(source_list, disable=not progress):
+        if isinstance(source, NonParametricSeismicSource):
+            source_rates = get_nonparametric_source_rates(source)
+        elif analytic_point_sources:
+            source_rates = get_source_rates(source)
+        else:
+            source_rates = None
+
+        if source_rates is not None:
+            binner.add_ruptures(
+                longitude=source_rates["longitude"],
+                latitude=source_rates["latitude"],
+                mag=source_rates["mag"],
+                occurrence_rate=source_rates["occurrence_rate"],
+                source_id=source.source_id,
+                depth=source_rates["depth"],
+            )
+            continue
+
+        for rup in source.iter_ruptures():
+            cols["longitude"].append(rup.hypocenter.longitude)
+            cols["latitude"].append(rup.hypocenter.latitude)
+            cols["depth"].append(rup.hypocenter.depth)
+            cols["mag"].append(rup.mag)
+            cols["occurrence_rate"].append(_get_rupture_occurrence_rate(rup))
+
+            if len(cols["mag"]) >= chunk_size:
+                add_chunk_to_binner(source.source_id)
+
+        if binner.by_source:
+            # keep each chunk to a single source
+            add_chunk_to_binner(source.source_id)
+
+    add_chunk_to_binner()
+
+    return binner
+
+
+def _bin_source_chunk(source_chunk_w_args: dict) -> dict:
+
+    sc = source_chunk_w_args
+
+    binner = RuptureRateBinner(**sc["binner_params"])
+    bin_rupture_rates_from_source_list(
+        sc["source_chunk"],
+        binner,
+        analytic_point_sources=sc["analytic_point_sources"],
+        progress=False,
+    )
+
+    return binner.to_arrays()
+
+
+def bin_rupture_rates_from_source_list_parallel(
+    source_list: list,
+    binner: RuptureRateBinner,
+    analytic_point_sources: bool = True,
+    n_procs: Optional[int] = _n_procs,
+    max_rups_per_task: Optional[int] = None,
+    max_in_flight_rups: Optional[int] = None,
+    max_rss_gb: Optional[float] = None,
+) -> RuptureRateBinner:
+    """
+    Adds the occurrence rates of the ruptures from all of the sources in
+    `source_list` to the bins of a
+    :class:`~openquake.hme.utils.binning.RuptureRateBinner`, working in
+    parallel.
+
+    The sources are divided into several chunks per process, which are handed
+    out by a memory-aware scheduler (see
+    :func:`~openquake.hme.utils.scheduler.iter_budgeted_tasks`). Each process
+    bins the ruptures of its sources itself and only sends back the binned
+    rates (see
+    :meth:`~openquake.hme.utils.binning.RuptureRateBinner.to_arrays`), which
+    are then merged into the `binner`. No ruptures are sent between
+    processes.
+
+    :param source_list:
+        List of sources containing ruptures.
+
+    :param binner:
+        Binner that the rupture rates are added to.
+
+    :param analytic_point_sources:
+        Whether to calculate the rates of point, area and multipoint sources
+        directly from their MFDs (see
+        :func:`bin_rupture_rates_from_source_list`).
+
+    :param n_procs:
+        Number of parallel processes. If `None` is passed, it defaults to
+        `os.cpu_count() -1`.
+
+    :param max_rups_per_task:
+        Maximum number of ruptures in each chunk of sources (though a single
+        source that cannot be split may have more).
+
+    :param max_in_flight_rups:
+        Maximum number of ruptures in the chunks being processed at any time.
+
+    :param max_rss_gb:
+        New chunks are not started while the memory use (in GB) of the main
+        process and the workers is more than this.
+
+    :returns:
+        The `binner`, with the rupture rates added.
+    """
+    n_procs = n_procs or _n_procs
+
+    logger.info("    chunking sources")
+    source_chunks, chunk_sums = _chunk_source_list(
+        source_list, n_procs * _CHUNKS_PER_PROC, max_chunk_size=max_rups_per_task
+    )
+
+    chunks_with_args = [
+        {
+            "source_chunk": source_chunk,
+            "binner_params": binner.get_params(),
+            "analytic_point_sources": analytic_point_sources,
+        }
+        for source_chunk in source_chunks
+    ]
+
+    logger.info("    beginning multiprocess source binning")
+    for binned_arrays in tqdm(
+        iter_budgeted_tasks(
+            _bin_source_chunk,
+            chunks_with_args,
+            chunk_sums,
+            n_procs,
+            max_in_flight_rups=max_in_flight_rups,
+            max_rss_gb=max_rss_gb,
+        ),
+        total=len(chunks_with_args),
+    ):
+        binner.add_arrays(binned_arrays)
+
+    return binner
+
+
 def _process_source(source, simple_ruptures: bool = True, pbar: tqdm = None):
 
+    if simple_ruptures is True:
+        builder = RuptureTableBuilder()
+        _add_source_to_builder(source, builder, pbar=pbar)
+        return builder.to_table()
+
     ruptures = list(
         map(
-            partial(_process_rup, source=source, simple_ruptures=simple_ruptures),
+            partial(
+                _process_rup,
+                source=source,
+                simple_ruptures=simple_ruptures,
+                get_strike_dip=_make_strike_dip_getter(source),
+            ),
             source.iter_ruptures(),
         )
     )
@@ -265,24 +652,21 @@ def _process_source(source, simple_ruptures: bool = True, pbar: tqdm = None):
     return ruptures
 
 
-def _process_source_chunk(source_chunk_w_args) -> list:
+def _process_source_chunk(source_chunk_w_args) -> Union[RuptureTable, list]:
 
     sc = source_chunk_w_args
 
-    pos = str(sc["position"] + 1)
-    if len(pos) == 1:
-        pos = f"0{pos}"
-
-    text = f"source chunk #{pos}"
+    if sc["simple_ruptures"] is True:
+        builder = RuptureTableBuilder()
+        for source in sc["source_chunk"]:
+            _add_source_to_builder(source, builder)
 
-    pbar = tqdm(total=sc["chunk_sum"], position=sc["position"], desc=text)
-
-    # wait so that processes don't finish at same time and take too much RAM
-    sleep(sc["position"] * 0.5)
+        del sc["source_chunk"]
+        return builder.to_table()
 
     rups = (
         [
-            _process_source(source, simple_ruptures=sc["simple_ruptures"], pbar=pbar)
+            _process_source(source, simple_ruptures=sc["simple_ruptures"])
             for source in sc["source_chunk"]
         ],
     )
@@ -294,19 +678,123 @@ def _process_source_chunk(source_chunk_w_args) -> list:
     return rups
 
 
-def _chunk_source_list(sources: list, n_chunks: int = _n_procs) -> Tuple[list, list]:
+class _RuptureRange:
+    """
+    The ruptures from `start` to `stop` (in the order of
+    :meth:`iter_ruptures`) of a fault source that cannot be split into
+    magnitude slices. It can be used in place of the source when the
+    ruptures are made or binned. The ruptures before `start` are still made
+    by the source but are skipped before any further work is done on them.
+    """
+
+    def __init__(self, source, start: int, stop: int):
+        self.source = source
+        self.start = start
+        self.stop = stop
+
+    @property
+    def source_id(self) -> str:
+        return self.source.source_id
+
+    def count_ruptures(self) -> int:
+        return self.stop - self.start
+
+    def iter_ruptures(self):
+        return islice(self.source.iter_ruptures(), self.start, self.stop)
+
+
+def _make_fault_source_with_mfd(source, mfd):
+    """
+    Makes a new simple or complex fault source with the parameters of
+    `source` but with another `mfd`.
+    """
+    params = dict(
+        source_id=source.source_id,
+        name=source.name,
+        tectonic_region_type=source.tectonic_region_type,
+        mfd=mfd,
+        rupture_mesh_spacing=source.rupture_mesh_spacing,
+        magnitude_scaling_relationship=source.magnitude_scaling_relationship,
+        rupture_aspect_ratio=source.rupture_aspect_ratio,
+        temporal_occurrence_model=source.temporal_occurrence_model,
+        rake=source.rake,
+    )
+    if isinstance(source, SimpleFaultSource):
+        return SimpleFaultSource(
+            upper_seismogenic_depth=source.upper_seismogenic_depth,
+            lower_seismogenic_depth=source.lower_seismogenic_depth,
+            fault_trace=source.fault_trace,
+            dip=source.dip,
+            hypo_list=source.hypo_list,
+            slip_list=source.slip_list,
+            **params,
+        )
+    return ComplexFaultSource(edges=source.edges, **params)
+
+
+def _split_fault_source(source, n_slices: int) -> list:
+    """
+    Splits a fault source into (at most) `n_slices` slices, so that the
+    ruptures of a single large fault can be made by several processes.
+    Together, the slices have the same ruptures as the original source.
+
+    Sources with several magnitudes are split into new sources that each
+    have some of the magnitudes of the original MFD. The magnitudes are
+    interleaved between the slices (i.e., the first slice gets the 1st,
+    `n_slices + 1`-th, etc. magnitudes), so that each slice has a similar
+    number of magnitudes. Sources with a single magnitude (e.g.
+    characteristic faults) are split into ranges of their ruptures instead
+    (see :class:`_RuptureRange`).
+    """
+    mag_rates = [
+        (mag, rate)
+        for mag, rate in source.mfd.get_annual_occurrence_rates()
+        if rate > 0.0
+    ]
+
+    if len(mag_rates) == 1:
+        n_rups = source.count_ruptures()
+        n_slices = min(n_slices, n_rups)
+        if n_slices <= 1:
+            return [source]
+        edges = np.linspace(0, n_rups, n_slices + 1).astype(int).tolist()
+        return [
+            _RuptureRange(source, start, stop)
+            for start, stop in zip(edges[:-1], edges[1:])
+        ]
+
+    n_slices = min(n_slices, len(mag_rates))
+    if n_slices <= 1:
+        return [source]
+
+    source_slices = []
+    for i in range(n_slices):
+        mags, rates = zip(*mag_rates[i::n_slices])
+        source_slices.append(
+            _make_fault_source_with_mfd(source, ArbitraryMFD(list(mags), list(rates)))
+        )
+
+    return source_slices
+
+
+# fault sources with more ruptures than this fraction of the mean number of
+# ruptures per chunk are split into slices
+_SPLIT_FRACTION = 0.25
+
+# number of work units (source chunks) made per process, so that the work can
+# be handed out in smaller pieces than one chunk per process
+_CHUNKS_PER_PROC = 4
+
+
+def _chunk_source_list(
+    sources: list, n_chunks: int = _n_procs, max_chunk_size: Optional[int] = None
+) -> Tuple[list, list]:
 
     sources_temp = []
     for s in sources:
         if isinstance(s, MultiPointSource):
             for ps in s:
                 sources_temp.append(ps)
-
-        # very slow
-        # elif isinstance(s, ComplexFaultSource):
-        #    for chunk in split(s, chunksize=s.count_ruptures() // n_chunks):
-        #        sources_temp.append(chunk)
-
         else:
             sources_temp.append(s)
 
@@ -314,6 +802,29 @@ def _chunk_source_list(sources: list, n_chunks: int = _n_procs) -> Tuple[list, l
 
     source_counts = [s.count_ruptures() for s in sources]
 
+    if max_chunk_size is not None:
+        n_chunks = max(n_chunks, int(np.ceil(sum(source_counts) / max_chunk_size)))
+
+    # split the largest fault sources so that no single source holds up a
+    # process; the slices of a Gutenberg-Richter MFD have more ruptures at the
+    # lower magnitudes, so each slice is counted separately
+    max_count = max(1, int(sum(source_counts) / n_chunks * _SPLIT_FRACTION))
+    sources_temp = []
+    counts_temp = []
+    for s, count in zip(sources, source_counts):
+        if count > max_count and isinstance(
+            s, (SimpleFaultSource, ComplexFaultSource)
+        ):
+            source_slices = _split_fault_source(s, int(np.ceil(count / max_count)))
+            slice_counts = [sl.count_ruptures() for sl in source_slices]
+            sources_temp.extend(source_slices)
+            counts_temp.extend(slice_counts)
+        else:
+            sources_temp.append(s)
+            counts_temp.append(count)
+
+    sources, source_counts = sources_temp, counts_temp
+
     sources = [
         s
         for c, s in sorted(
@@ -341,58 +852,83 @@ def _chunk_source_list(sources: list, n_chunks: int = _n_procs) -> Tuple[list, l
 
 
 def rupture_list_from_source_list_parallel(
-    source_list: list, simple_ruptures: bool = True, n_procs: Optional[int] = _n_procs
-) -> list:
+    source_list: list,
+    simple_ruptures: bool = True,
+    n_procs: Optional[int] = _n_procs,
+    max_rups_per_task: Optional[int] = None,
+    max_in_flight_rups: Optional[int] = None,
+    max_rss_gb: Optional[float] = None,
+) -> Union[RuptureTable, list]:
     """
-    Creates a list of ruptures from all of the sources within list,
-    adding the `source_id` of each source to the rupture as an
-    attribute called `source`.
+    Creates a table of ruptures from all of the sources within list,
+    recording the `source_id` of each source as the rupture's `source`.
 
-    Works in parallel.
+    Works in parallel. The sources are divided into several chunks per
+    process, which are handed out by a memory-aware scheduler (see
+    :func:`~openquake.hme.utils.scheduler.iter_budgeted_tasks`). Each process
+    returns a columnar
+    :class:`~openquake.hme.utils.rupture_table.RuptureTable`, which is much
+    cheaper to send back to the main process than many rupture objects.
 
     :param simple_ruptures:
-        Whether to use
-        :class:`openquake.hme.utils.simple_rupture.simple_rupture` to represent
-        ruptures, instead of the full OpenQuake version.
+        Whether to store the ruptures in a columnar
+        :class:`~openquake.hme.utils.rupture_table.RuptureTable`, instead of
+        as a list of the full OpenQuake ruptures.
 
     :param n_procs:
         Number of parallel processes. If `None` is passed, it defaults to
         `os.cpu_count() -1`.
 
+    :param max_rups_per_task:
+        Maximum number of ruptures in each chunk of sources (though a single
+        source that cannot be split may have more).
+
+    :param max_in_flight_rups:
+        Maximum number of ruptures in the chunks being processed at any time.
+
+    :param max_rss_gb:
+        New chunks are not started while the memory use (in GB) of the main
+        process and the workers is more than this.
+
     :returns:
         All of the ruptures from all sources of `sources_types` in the logic
         tree branch.
     """
+    n_procs = n_procs or _n_procs
+
     logger.info("    chunking sources")
-    source_chunks, chunk_sums = _chunk_source_list(source_list, n_procs)
+    source_chunks, chunk_sums = _chunk_source_list(
+        source_list, n_procs * _CHUNKS_PER_PROC, max_chunk_size=max_rups_per_task
+    )
 
-    if n_procs > len(source_chunks):
-        logging.info("    fewer chunks than processes.")
+    chunks_with_args = [
+        {"source_chunk": source_chunk, "simple_ruptures": simple_ruptures}
+        for source_chunk in source_chunks
+    ]
 
     logger.info("    beginning multiprocess source processing")
-    with Pool(n_procs, maxtasksperchild=None) as pool:
-
-        rupture_list = []
-
-        chunks_with_args = [
-            {
-                "source_chunk": source_chunk,
-                "position": i,
-                "chunk_sum": chunk_sums[i],
-                "simple_ruptures": simple_ruptures,
-            }
-            for i, source_chunk in enumerate(source_chunks)
-        ]
-
-        pbar = tqdm([n for n in range(n_procs)])
-
-        for rups in pool.imap_unordered(_process_source_chunk, chunks_with_args):
+    rupture_list = []
+    pbar = tqdm(total=sum(chunk_sums))
+
+    for rups in iter_budgeted_tasks(
+        _process_source_chunk,
+        chunks_with_args,
+        chunk_sums,
+        n_procs,
+        max_in_flight_rups=max_in_flight_rups,
+        max_rss_gb=max_rss_gb,
+    ):
+        if simple_ruptures is True:
+            rupture_list.append(rups)
+        else:
             rupture_list.extend(rups)
-            rups = ""
+        pbar.update(len(rups))
+
+    pbar.close()
+    logging.info("    finishing multiprocess source processing, cleaning up.")
 
-        pbar.write("\n" * n_procs)
-        pbar.close()
-        logging.info("    finishing multiprocess source processing, cleaning up.")
+    if simple_ruptures is True:
+        return RuptureTable.concatenate(rupture_list)
 
     while isinstance(rupture_list[0], list):
         rupture_list = flatten_list(rupture_list)
@@ -411,23 +947,40 @@ def _add_rupture_geom(df):
 
 
 def rupture_list_to_gdf(
-    rupture_list: list, gdf: bool = False, parallel: bool = True
+    rupture_list: Union[RuptureTable, list], gdf: bool = False, parallel: bool = True
 ) -> Union[pd.DataFrame, gpd.GeoDataFrame]:
     """
     Creates a Pandas DataFrame or GeoPandas GeoDataFrame from a rupture list.
 
     :param rupture_list:
-        List of :class:`~openquake.hme.utils.simple_rupture.SimpleRupture`.
+        :class:`~openquake.hme.utils.rupture_table.RuptureTable`, or list of
+        rupture objects (such as
+        :class:`~openquake.hme.utils.simple_rupture.SimpleRupture`).
 
     :param gdf:
         Boolean flag to determine whether output is GeoDataFrame (True)
         or DataFrame (False).
 
     :returns:
-        GeoDataFrame, with two columns, `rupture` which holds the
-        :class:`Rupture` object, and `geometry` which has the geometry as a
-        Shapely :class:`~shapely.geometry.Point` object.
+        For a :class:`RuptureTable`, a DataFrame with one numeric column per
+        rupture parameter and a categorical `source` column. For a list, a
+        DataFrame with a `rupture` column which holds the :class:`Rupture`
+        object. If `gdf` is `True`, a `geometry` column is added with the
+        hypocenter of each rupture as a Shapely
+        :class:`~shapely.geometry.Point` object.
     """
+    if isinstance(rupture_list, RuptureTable):
+        df = rupture_list.to_dataframe()
+
+        if gdf is True:
+            return gpd.GeoDataFrame(
+                df,
+                geometry=gpd.points_from_xy(df["longitude"], df["latitude"]),
+                crs="epsg:4326",
+            )
+        else:
+            return df
+
     df = pd.DataFrame(
         index=range(len(rupture_list)), data=rupture_list, columns=["rupture"]
     )
@@ -445,26 +998,6 @@ def rupture_list_to_gdf(
         return df
 
 
-def _h3_bin_from_rupture(
-    rupture: Union[
-        SimpleRupture, NonParametricProbabilisticRupture, ParametricProbabilisticRupture
-    ],
-    h3_res: int = 3,
-) -> str:
-    """
-    Returns the hexadecimal string that is the index of the `h3` spatial bin
-    which contains the hypocenter of the `rupture` at the given level of
-    resolution (`res`).
-
-    See the documentation for `h3` (https://uber.github.io/h3/) for more
-    information.
-    """
-
-    return h3.geo_to_h3(
-        rupture.hypocenter.latitude, rupture.hypocenter.longitude, h3_res
-    )
-
-
 def make_bin_gdf_from_rupture_gdf(
     rupture_gdf: gpd.GeoDataFrame,
     h3_res: int = 3,
@@ -478,10 +1011,13 @@ def make_bin_gdf_from_rupture_gdf(
     Takes all of the ruptures, finds the `h3` spatial bins for each, and then
     makes a new `GeoDataFrame` of all of the spatial bins, with
     :class:`~openquake.hme.utils.bins.SpacemagBin` initialized for each of the
-    bins.
+    bins. The cells are added to `rupture_gdf` as a `bin_id` column, and are
+    the index of the bins, as integer `h3` cell ids.
 
     :param rupture_gdf:
-        `GeoDataFrame` with all of the ruptures.
+        `DataFrame` with all of the ruptures, either in columnar form (with
+        `longitude` and `latitude` columns) or with a `rupture` column of
+        rupture objects.
 
     :param h3_res:
         Resolution for the `h3` bins (spatial cells). See
@@ -490,14 +1026,12 @@ def make_bin_gdf_from_rupture_gdf(
         grid cells.
 
     :param parallel:
-        Boolean flag determining whether to find the spatial indices of the
-        ruptures in parallel or not. The parallel algorithm has a lot of
-        overhead and will be slower with a relatively low number of
-        ruptures (hundreds of thousands or so, depending on the computer).
+        Not used; the spatial indices of all of the ruptures are found in one
+        vectorized call (see :func:`~openquake.hme.utils.binning.get_h3_cells`).
+        Kept for backwards compatibility.
 
     :param n_procs:
-        Number of simultaneous processes run if `parallel` is `True`. Defaults
-        to os.cpu_count() - 1 for multicore systems.
+        Not used; kept for backwards compatibility.
 
     :param min_mag:
         Minimum magnitude of the :class:`~openquake.hme.utils.bins.SpacemagBin`
@@ -511,42 +1045,86 @@ def make_bin_gdf_from_rupture_gdf(
 
     """
 
-    n_procs = n_procs or _n_procs
-
     logging.info("starting rupture-bin spatial join")
 
-    if (parallel is False) or (n_procs == 1):
-        rupture_gdf["bin_id"] = list(
-            tqdm(
-                map(
-                    partial(_h3_bin_from_rupture, h3_res=h3_res),
-                    rupture_gdf["rupture"].values,
-                ),
-                total=rupture_gdf.shape[0],
-            )
-        )
-    else:
-        with Pool(n_procs) as pool:
-            rupture_gdf["bin_id"] = tqdm(
-                pool.imap(
-                    partial(_h3_bin_from_rupture, h3_res=h3_res),
-                    rupture_gdf["rupture"].values,
-                    chunksize=500,
-                ),
-                total=rupture_gdf.shape[0],
-            )
+    lons, lats = _get_rupture_lons_lats(rupture_gdf)
+    rupture_gdf["bin_id"] = get_h3_cells(lons, lats, h3_res)
 
     logging.info("finished rupture-bin spatial join")
 
-    hex_codes = list(set(rupture_gdf["bin_id"].values))
+    cells = np.unique(rupture_gdf["bin_id"].values)
 
-    polies = [
-        Polygon(h3.h3_to_geo_boundary(hex_code, geo_json=True))
-        for hex_code in hex_codes
-    ]
+    return _make_bin_gdf_from_h3_cells(
+        cells, min_mag=min_mag, max_mag=max_mag, bin_width=bin_width
+    )
+
+
+def _get_rupture_lons_lats(rupture_gdf: gpd.GeoDataFrame):
+    if "rupture" not in rupture_gdf.columns:
+        return rupture_gdf["longitude"].values, rupture_gdf["latitude"].values
+
+    hypos = [rup.hypocenter for rup in rupture_gdf["rupture"].values]
+    lons = [hypo.longitude for hypo in hypos]
+    lats = [hypo.latitude for hypo in hypos]
+    return lons, lats
+
+
+def get_polygon_bin_index(bin_gdf: gpd.GeoDataFrame) -> PolygonBinIndex:
+    """
+    Makes the spatial index of the polygons of a GeoDataFrame of bins that
+    are not `h3` cells (e.g. read with
+    :func:`make_SpacemagBins_from_bin_gis_file`), with the index of the
+    GeoDataFrame as the bin ids.
+    """
+    return PolygonBinIndex(bin_gdf.geometry.values, bin_ids=bin_gdf.index.values)
+
+
+def get_polygon_bin_rupture_gdf(
+    rupture_gdf: gpd.GeoDataFrame,
+    bin_gdf: gpd.GeoDataFrame,
+    bin_index: Optional[PolygonBinIndex] = None,
+) -> gpd.GeoDataFrame:
+    """
+    Finds the polygon bin (e.g. from a GIS file) that contains the hypocenter
+    of each rupture, and returns the ruptures that are in a bin, with the
+    `bin_id` column needed by :func:`add_ruptures_to_bins`. This is the
+    counterpart of :func:`make_bin_gdf_from_rupture_gdf` for bins that are
+    not `h3` cells.
 
+    :param rupture_gdf: DataFrame of ruptures, as made by
+        :func:`rupture_list_to_gdf`.
+
+    :param bin_gdf: GeoDataFrame of the bin polygons.
+
+    :param bin_index: Spatial index of the bins, if it has already been made
+        with :func:`get_polygon_bin_index`.
+    """
+    if bin_index is None:
+        bin_index = get_polygon_bin_index(bin_gdf)
+
+    lons, lats = _get_rupture_lons_lats(rupture_gdf)
+    rows = bin_index.get_rows(lons, lats)
+    in_bins = rows >= 0
+
+    rupture_gdf = rupture_gdf.loc[in_bins].copy()
+    rupture_gdf["bin_id"] = bin_index.bin_ids[rows[in_bins]]
+    return rupture_gdf
+
+
+def _make_bin_gdf_from_h3_cells(
+    cells: Sequence[int],
+    min_mag: Optional[float] = 6.0,
+    max_mag: Optional[float] = 9.0,
+    bin_width: Optional[float] = 0.2,
+) -> gpd.GeoDataFrame:
+
+    cells = np.asarray(cells, dtype=np.uint64)
+
+    # the cell polygons are made by `add_bin_geometry` if they are needed
     bin_gdf = gpd.GeoDataFrame(
-        index=hex_codes, geometry=polies, crs={"init": "epsg:4326", "no_defs": True}
+        index=pd.Index(cells, dtype=np.uint64),
+        geometry=gpd.GeoSeries([None] * len(cells), index=cells),
+        crs={"init": "epsg:4326", "no_defs": True},
     )
     bin_gdf = make_SpacemagBins_from_bin_gdf(
         bin_gdf, min_mag=min_mag, max_mag=max_mag, bin_width=bin_width
@@ -554,8 +1132,103 @@ def make_bin_gdf_from_rupture_gdf(
     return bin_gdf
 
 
+def add_bin_geometry(bin_gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """
+    Makes the polygons of the `h3` cell bins that do not have a geometry yet.
+    Bins made from `h3` cells only get their polygons when they are needed
+    (i.e. for subsetting, plotting or writing the bins), and then all of them
+    are made at once. The GeoDataFrame is modified in place and returned.
+
+    :param bin_gdf: GeoDataFrame of the bins, indexed by the integer `h3`
+        cell ids.
+    """
+    missing = bin_gdf.geometry.isna().values
+    if bin_gdf.index.dtype != np.uint64 or not missing.any():
+        return bin_gdf
+
+    polys = get_h3_cell_polygons(bin_gdf.index.values[missing])
+
+    geoms = list(bin_gdf.geometry.values)
+    for i, poly in zip(np.flatnonzero(missing), polys):
+        geoms[i] = poly
+    bin_gdf["geometry"] = gpd.GeoSeries(geoms, index=bin_gdf.index, crs=bin_gdf.crs)
+
+    if "SpacemagBin" in bin_gdf.columns:
+        for sb, poly in zip(bin_gdf["SpacemagBin"].values[missing], polys):
+            if sb._poly is None:
+                sb.poly = poly
+
+    return bin_gdf
+
+
+def make_bin_gdf_from_rate_df(
+    rate_df: pd.DataFrame,
+    min_mag: Optional[float] = 6.0,
+    max_mag: Optional[float] = 9.0,
+    bin_width: Optional[float] = 0.2,
+) -> gpd.GeoDataFrame:
+    """
+    Makes a `GeoDataFrame` of the spatial bins from binned rupture rates (as
+    made by :meth:`~openquake.hme.utils.binning.RuptureRateBinner.to_dataframe`)
+    with a :class:`~openquake.hme.utils.bins.SpacemagBin` for each bin. The
+    rates are set as the `rate` of each
+    :class:`~openquake.hme.utils.bins.MagBin`; no ruptures are added.
+
+    :param rate_df:
+        `DataFrame` of rupture rates, with the `h3` cell ids as the index and
+        the magnitude bin centers as the columns.
+
+    :param min_mag:
+        Minimum magnitude of the :class:`~openquake.hme.utils.bins.SpacemagBin`
+
+    :param max_mag:
+        Maximum magnitude of the :class:`~openquake.hme.utils.bins.SpacemagBin`
+
+    :param bin_width:
+        Width of the :class:`~openquake.hme.utils.bins.SpacemagBin` bins in
+        magnitude units.
+    """
+    bin_gdf = _make_bin_gdf_from_h3_cells(
+        rate_df.index.values, min_mag=min_mag, max_mag=max_mag, bin_width=bin_width
+    )
+    add_rates_to_bins(rate_df, bin_gdf)
+
+    return bin_gdf
+
+
+def add_rates_to_bins(rate_df: pd.DataFrame, bin_gdf: gpd.GeoDataFrame) -> None:
+    """
+    Adds binned rupture rates to the `rate` of each
+    :class:`~openquake.hme.utils.bins.MagBin` in the bins. This function
+    modifies the `bin_gdf` in memory and does not return any value.
+
+    :param rate_df:
+        `DataFrame` of rupture rates, with the `h3` cell ids as the index and
+        the magnitude bin centers as the columns.
+
+    :param bin_gdf: GeoDataFrame of the bins, with a `SpacemagBin` column.
+    """
+    mag_bin_centers = list(rate_df.columns)
+
+    bin_collection = _get_view_collection(bin_gdf)
+    if bin_collection is not None:
+        rows = bin_collection.get_rows(rate_df.index.values)
+        cols = [bin_collection.mag_bin_centers.index(bc) for bc in mag_bin_centers]
+        in_bins = rows >= 0
+        bin_collection.rates[rows[in_bins, np.newaxis], cols] += rate_df.values[in_bins]
+        return
+
+    for bin_id, bin_rates in zip(rate_df.index, rate_df.values):
+        mag_bins = bin_gdf.loc[bin_id, "SpacemagBin"].mag_bins
+        for bc, rate in zip(mag_bin_centers, bin_rates):
+            mb = mag_bins[bc]
+            mb.rate = rate if mb.rate is None else mb.rate + rate
+
+
 def add_ruptures_to_bins(
-    rupture_gdf: gpd.GeoDataFrame, bin_gdf: gpd.GeoDataFrame
+    rupture_gdf: gpd.GeoDataFrame,
+    bin_gdf: gpd.GeoDataFrame,
+    keep_ruptures: bool = True,
 ) -> None:
     """
     Takes a GeoPandas GeoDataFrame of ruptures and adds them to the ruptures
@@ -564,43 +1237,91 @@ def add_ruptures_to_bins(
     magnitude. This function modifies both GeoDataFrames in memory and does not
     return any value.
 
-    :param rupture_gdf: GeoDataFrame of ruptures; this should have two columns,
-        one of them being the `rupture` column with the :class:`Rupture` object,
-        and the other being the `geometry` column, with a GeoPandas/Shapely
-        geometry class.
+    :param rupture_gdf: DataFrame of ruptures, as made by
+        :func:`rupture_list_to_gdf`. This is either the columnar form, with
+        one column per rupture parameter (in which case each
+        :class:`~openquake.hme.utils.bins.MagBin` gets a
+        :class:`~openquake.hme.utils.rupture_table.RuptureTable` of its
+        ruptures), or has a `rupture` column with the :class:`Rupture` object.
+        It must have a `bin_id` column from
+        :func:`make_bin_gdf_from_rupture_gdf`.
 
     :param bin_gdf: GeoDataFrame of the bins. This should have a `geometry`
         column with a GeoPandas/Shapely geometry and a `SpacemagBin` column that
         has a :class:`~openquake.hme.utils.bins.SpacemagBin` object.
 
+    :param keep_ruptures: Whether to add the ruptures themselves to the
+        magnitude bins. If `False`, only the rupture rates are summed into the
+        bins' :class:`~openquake.hme.utils.bins.BinCollection` (bins without a
+        collection always get the ruptures).
+
     :Returns: `None`.
     """
     logger.info("    adding ruptures to bins")
 
     bin_edges = bin_gdf.iloc[0].SpacemagBin.get_bin_edges()
-    bin_centers = bin_gdf.iloc[0].SpacemagBin.mag_bin_centers
+    bin_centers = np.array(bin_gdf.iloc[0].SpacemagBin.mag_bin_centers)
 
     logging.info("\tgetting mag bin vals")
-    rupture_gdf["mag_r"] = pd.cut(
-        list(map(lambda r: r.mag, rupture_gdf["rupture"])),
-        bin_edges,
-        labels=bin_centers,
-    )
-
-    rup_groups = rupture_gdf.groupby(["bin_id"])
+    if "rupture" in rupture_gdf.columns:
+        mags = np.array([r.mag for r in rupture_gdf["rupture"]], dtype=np.float64)
+    else:
+        mags = rupture_gdf["mag"].values
 
-    pbar = tqdm(total=len(rupture_gdf))
+    cols = get_mag_bin_idx(mags, bin_edges)
+    rupture_gdf["mag_r"] = np.where(
+        cols >= 0, bin_centers[np.maximum(cols, 0)], np.nan
+    )
 
-    for (bin_id, rup_group) in rup_groups:
-        sbin = bin_gdf.loc[bin_id, "SpacemagBin"]
+    bin_collection = _get_view_collection(bin_gdf)
+    if bin_collection is not None:
+        rows = bin_collection.get_rows(rupture_gdf["bin_id"].values)
+        in_bins = np.flatnonzero((rows >= 0) & (cols >= 0))
+        if "rupture" in rupture_gdf.columns:
+            rates = np.array(
+                [r.occurrence_rate for r in rupture_gdf["rupture"]], dtype=np.float64
+            )
+        else:
+            rates = rupture_gdf["occurrence_rate"].values.astype(np.float64)
+        n_mags = len(bin_centers)
+        flat_idx = rows[in_bins] * n_mags + cols[in_bins]
+        bin_collection.rates += np.bincount(
+            flat_idx, weights=rates[in_bins], minlength=bin_collection.rates.size
+        ).reshape(bin_collection.rates.shape)
+
+        if keep_ruptures is False:
+            logging.info("\tdone adding ruptures to bins")
+            return
+
+    rows = bin_gdf.index.get_indexer(rupture_gdf["bin_id"].values)
+    in_bins = np.flatnonzero((rows >= 0) & (cols >= 0))
+
+    # the ruptures of each (bin, mag bin) are contiguous in the sort order
+    order = in_bins[np.lexsort((cols[in_bins], rows[in_bins]))]
+    group_rows, group_cols = rows[order], cols[order]
+    group_starts = np.flatnonzero(
+        np.r_[True, (np.diff(group_rows) != 0) | (np.diff(group_cols) != 0)]
+    )[: len(order)]
+    group_stops = np.r_[group_starts[1:], len(order)]
+
+    if "rupture" not in rupture_gdf.columns:
+        # columnar ruptures: each MagBin gets a view of the rupture table
+        rupture_table = RuptureTable.from_dataframe(rupture_gdf)
+    else:
+        ruptures = rupture_gdf["rupture"].values
 
-        mag_groups = rup_group.groupby("mag_r")
+    spacemag_bins = bin_gdf["SpacemagBin"].values
+    for start, stop in tqdm(zip(group_starts, group_stops), total=len(group_starts)):
+        mb = spacemag_bins[group_rows[start]].mag_bins[bin_centers[group_cols[start]]]
+        rup_idx = order[start:stop]
 
-        for mag_bin, mag_group in mag_groups:
-            sbin.mag_bins[mag_bin].ruptures.extend(mag_group["rupture"].values)
-        pbar.update(len(rup_group))
+        if "rupture" in rupture_gdf.columns:
+            mb.ruptures.extend(ruptures[rup_idx])
+        elif len(mb.ruptures) == 0:
+            mb.ruptures = rupture_table[rup_idx]
+        else:
+            mb.ruptures = RuptureTable.concatenate([mb.ruptures, rupture_table[rup_idx]])
 
-    pbar.close()
     logging.info("\tdone adding ruptures to bins")
     return
 
@@ -636,6 +1357,45 @@ def _parse_eq_time(
     return dateutil.parser.parse(time_string)
 
 
+_TIME_UNITS = ("year", "month", "day", "hour", "minute", "second")
+
+
+def _parse_eq_times(
+    df: pd.DataFrame, time_cols: Union[List[str], Tuple[str], str, None] = None,
+) -> pd.Series:
+    """
+    Parses the time information for all of the earthquakes in a catalog at
+    once. A single column is parsed with :func:`pandas.to_datetime`; multiple
+    columns are taken as year, month, day, hour, minute, second (in that
+    order) and assembled into timestamps without any string formatting; times
+    given only to the year or month are put at the start of the year or
+    month. Times that cannot be assembled this way, such as those outside of
+    the range of :class:`pandas.Timestamp` (i.e. before 1677), fall back to
+    :func:`_parse_eq_time`.
+    """
+    if time_cols is None:
+        return None
+
+    if isinstance(time_cols, str):
+        time_cols = [time_cols]
+
+    try:
+        if len(time_cols) == 1:
+            return pd.to_datetime(df[time_cols[0]])
+
+        time_df = df[list(time_cols)].copy()
+        time_df.columns = _TIME_UNITS[: len(time_cols)]
+        for unit in ("month", "day"):
+            if unit not in time_df.columns:
+                time_df[unit] = 1
+        return pd.to_datetime(time_df)
+
+    # includes `pd.errors.OutOfBoundsDatetime`
+    except ValueError:
+        logging.warning("cannot assemble earthquake times, parsing row by row")
+        return df.apply(_parse_eq_time, time_cols=time_cols, axis=1)
+
+
 def make_earthquake_gdf_from_csv(
     eq_csv: str,
     x_col: str = "longitude",
@@ -666,10 +1426,9 @@ def make_earthquake_gdf_from_csv(
 
     :param time: Name of column(s) with time values. If multiple values are
         used, they should be arranged in increasing resolution, i.e. year, then
-        month, then day, then hour, etc. These will be parsed using `dateutil`
-        if possible.  This parsing is brittle and will probably fail with
-        multiple columns; it's better to make a single, unambiguously formatted
-        column first.
+        month, then day, then hour, minute and second. A single column is
+        parsed with :func:`pandas.to_datetime`, so it should be unambiguously
+        formatted.
 
     :param source: Optional column specifying the source of that earthquake.
 
@@ -683,10 +1442,45 @@ def make_earthquake_gdf_from_csv(
     :returns: GeoDataFrame of earthquakes, converted to EPSG:4326 (WGS84).
     """
 
-    df = pd.read_csv(eq_csv)
+    return _make_earthquake_gdf(
+        pd.read_csv(eq_csv),
+        x_col=x_col,
+        y_col=y_col,
+        depth=depth,
+        magnitude=magnitude,
+        time=time,
+        source=source,
+        event_id=event_id,
+        epsg=epsg,
+    )
+
+
+def iter_earthquake_gdf_chunks_from_csv(
+    eq_csv: str, chunksize: int = 1_000_000, **csv_params
+):
+    """
+    Reads an earthquake catalog from a CSV file in chunks of `chunksize`
+    earthquakes, and yields a GeoDataFrame of each chunk, so that the whole
+    catalog is never held in memory. The `csv_params` (the column names and
+    EPSG code) are those of :func:`make_earthquake_gdf_from_csv`.
+    """
+    for df in pd.read_csv(eq_csv, chunksize=chunksize):
+        yield _make_earthquake_gdf(df, **csv_params)
+
 
+def _make_earthquake_gdf(
+    df: pd.DataFrame,
+    x_col: str = "longitude",
+    y_col: str = "latitude",
+    depth: str = "depth",
+    magnitude: str = "magnitude",
+    time: Union[List[str], Tuple[str], str, None] = None,
+    source: Optional[str] = None,
+    event_id: Optional[str] = None,
+    epsg: int = 4326,
+) -> gpd.GeoDataFrame:
     if time is not None:
-        df["time"] = df.apply(_parse_eq_time, time_cols=time, axis=1)
+        df["time"] = _parse_eq_times(df, time)
 
     if source is not None:
         df.rename({source: "source"}, axis=1, inplace=True)
@@ -697,24 +1491,135 @@ def make_earthquake_gdf_from_csv(
     if event_id is not None:
         df.rename({event_id: "event_id"}, axis=1, inplace=True)
 
-    def parse_geometry(row, x=x_col, y=y_col, z=depth):
-        return Point(row[x], row[y], row[z])
-
-    df["geometry"] = df.apply(parse_geometry, axis=1)
-    df.drop([x_col, y_col], axis=1)
-
-    eq_gdf = gpd.GeoDataFrame(df)
-    eq_gdf.crs = {"init": "epsg:{}".format(epsg)}
+    geometry = gpd.points_from_xy(df[x_col], df[y_col], df[depth])
+    eq_gdf = gpd.GeoDataFrame(df, geometry=geometry, crs=f"EPSG:{epsg}")
 
     if epsg != 4326:
         eq_gdf = eq_gdf.to_crs(epsg=4326)
 
-    eq_gdf["longitude"] = [eq["geometry"].xy[0][0] for i, eq in eq_gdf.iterrows()]
-    eq_gdf["latitude"] = [eq["geometry"].xy[1][0] for i, eq in eq_gdf.iterrows()]
+    eq_gdf["longitude"] = eq_gdf.geometry.x
+    eq_gdf["latitude"] = eq_gdf.geometry.y
 
     return eq_gdf
 
 
+def bin_earthquake_counts_from_csv(
+    eq_csv: str,
+    binner: RuptureRateBinner,
+    chunksize: int = 1_000_000,
+    **csv_params,
+) -> RuptureRateBinner:
+    """
+    Reads an earthquake catalog from a CSV file in chunks of `chunksize`
+    earthquakes and adds the number of earthquakes in each bin to the
+    `binner`, as a rate of one per earthquake. Neither the catalog nor an
+    :class:`Earthquake` for each event are held in memory, so this is suited to
+    very large (e.g. stochastic) catalogs.
+
+    Each earthquake is put into the magnitude bin with the nearest center, as
+    in :meth:`~openquake.hme.utils.bins.SpacemagBin.add_earthquake`;
+    earthquakes outside of the magnitude bins (or of the region or depth
+    slabs of the `binner`) are dropped.
+
+    :param eq_csv: file path to CSV
+
+    :param binner:
+        :class:`~openquake.hme.utils.binning.RuptureRateBinner` with the
+        bins of the model.
+
+    :param chunksize: Number of earthquakes to read at once.
+
+    :param csv_params:
+        Column names and EPSG code of the catalog, as for
+        :func:`make_earthquake_gdf_from_csv`. The times are not read.
+
+    :returns: The `binner`, with the counts in its rates.
+    """
+    csv_params = {k: v for k, v in csv_params.items() if k != "time"}
+
+    for eq_gdf in iter_earthquake_gdf_chunks_from_csv(
+        eq_csv, chunksize=chunksize, **csv_params
+    ):
+        bin_earthquake_counts(eq_gdf, binner)
+
+    return binner
+
+
+def bin_earthquake_counts(
+    eq_gdf: gpd.GeoDataFrame, binner: RuptureRateBinner
+) -> RuptureRateBinner:
+    """
+    Adds the number of earthquakes of a catalog in each bin to the `binner`,
+    as a rate of one per earthquake, without making an :class:`Earthquake`
+    for each event. The earthquakes are binned as in
+    :func:`bin_earthquake_counts_from_csv`.
+
+    :param eq_gdf:
+        GeoDataFrame of earthquakes, as made by
+        :func:`make_earthquake_gdf_from_csv`.
+
+    :param binner:
+        :class:`~openquake.hme.utils.binning.RuptureRateBinner` with the
+        bins of the model.
+
+    :returns: The `binner`, with the counts in its rates.
+    """
+    mag_bin_centers = np.array(binner.mag_bin_centers)
+    mag_idx = get_nearest_mag_bin_idx(
+        eq_gdf["magnitude"].values,
+        mag_bin_centers,
+        binner.bin_width,
+        min_mag=binner.min_mag,
+        max_mag=binner.max_mag,
+    )
+    in_bins = mag_idx >= 0
+    if not in_bins.any():
+        return binner
+
+    eq_gdf = eq_gdf.loc[in_bins]
+    binner.add_ruptures(
+        eq_gdf["longitude"].values,
+        eq_gdf["latitude"].values,
+        # bin centers, so that the binner puts each earthquake in its bin
+        mag_bin_centers[mag_idx[in_bins]],
+        np.ones(len(eq_gdf)),
+        depth=None if binner.depth_edges is None else eq_gdf.geometry.z.values,
+    )
+    return binner
+
+
+def add_earthquake_counts_to_bins(
+    count_df: pd.DataFrame, bin_gdf: gpd.GeoDataFrame, category: str = "observed"
+) -> None:
+    """
+    Adds binned earthquake counts (as made from
+    :func:`bin_earthquake_counts_from_csv`) to the `observed` or `prospective`
+    counts of the bins. No :class:`Earthquake` objects are added. This function
+    modifies the `bin_gdf` in memory and does not return any value.
+
+    :param count_df:
+        `DataFrame` of earthquake counts, with the `h3` cell ids as the index
+        and the magnitude bin centers as the columns.
+
+    :param bin_gdf:
+        GeoDataFrame of the bins, with a `SpacemagBin` column of views of a
+        :class:`~openquake.hme.utils.bins.BinCollection`.
+
+    :param category: `observed` or `prospective`.
+    """
+    bin_collection = _get_view_collection(bin_gdf)
+    if bin_collection is None:
+        raise ValueError("earthquake counts can only be added to a BinCollection")
+
+    counts = bin_collection.get_counts(category)
+    rows = bin_collection.get_rows(count_df.index.values)
+    cols = [bin_collection.mag_bin_centers.index(bc) for bc in count_df.columns]
+    in_bins = rows >= 0
+    counts[rows[in_bins, np.newaxis], cols] += np.rint(
+        count_df.values[in_bins]
+    ).astype(counts.dtype)
+
+
 @attr.s(auto_attribs=True)
 # @dataclass
 class Earthquake:
@@ -750,16 +1655,12 @@ def _make_earthquake_from_row(row):
     return Earthquake(**eq_d)
 
 
-def _nearest_bin(val, bin_centers):
-    bca = np.array(bin_centers)
-    return bin_centers[np.argmin(np.abs(val - bca))]
-
-
 def add_earthquakes_to_bins(
     earthquake_gdf: gpd.GeoDataFrame,
     bin_df: gpd.GeoDataFrame,
     category: str = "observed",
     h3_res: int = 3,
+    cells: Optional[Sequence[int]] = None,
 ) -> None:
     """
     Takes a GeoPandas GeoDataFrame of observed earthquakes (i.e., an
@@ -786,38 +1687,46 @@ def add_earthquakes_to_bins(
         catalog is to be considered, then this is added using the `prospective`
         value.
 
+    :param h3_res:
+        Resolution of the `h3` cells of the bins. Bins that are not indexed by
+        integer `h3` cell ids are treated as arbitrary polygons, and the
+        earthquakes are found in them with a
+        :class:`~openquake.hme.utils.binning.PolygonBinIndex`.
+
+    :param cells:
+        Integer `h3` cell ids of the earthquakes at `h3_res`, if they are
+        already known (e.g. rolled up from a finer resolution with
+        :func:`~openquake.hme.utils.binning.get_h3_parents`).
+
     :Returns:
         `None`.
     """
 
     earthquake_gdf["Eq"] = earthquake_gdf.apply(_make_earthquake_from_row, axis=1)
-    earthquake_gdf["bin_id"] = [
-        h3.geo_to_h3(eq.latitude, eq.longitude, h3_res) for eq in earthquake_gdf.Eq
-    ]
-
-    for i, eq in earthquake_gdf.iterrows():
-        try:
-            spacemag_bin = bin_df.loc[eq.bin_id, "SpacemagBin"]
+    spacemag_bins = bin_df["SpacemagBin"].values
 
-            if eq.magnitude < spacemag_bin.min_mag - spacemag_bin.bin_width / 2:
-                pass
-            elif eq.magnitude > (spacemag_bin.max_mag + spacemag_bin.bin_width / 2):
-                pass
-            else:
-                nearest_bc = _nearest_bin(eq.Eq.magnitude, spacemag_bin.mag_bin_centers)
+    if bin_df.index.dtype != np.uint64:
+        # polygon bins (e.g. from a GIS file), rather than `h3` cells
+        bin_idx = get_polygon_bin_index(bin_df).get_rows(
+            [eq.longitude for eq in earthquake_gdf.Eq],
+            [eq.latitude for eq in earthquake_gdf.Eq],
+        )
+        bin_ids = np.empty(len(bin_idx), dtype=object)
+        bin_ids[bin_idx >= 0] = bin_df.index.values[bin_idx[bin_idx >= 0]]
+        earthquake_gdf["bin_id"] = bin_ids
+    else:
+        if cells is None:
+            cells = get_h3_cells(
+                [eq.longitude for eq in earthquake_gdf.Eq],
+                [eq.latitude for eq in earthquake_gdf.Eq],
+                h3_res,
+            )
+        earthquake_gdf["bin_id"] = np.asarray(cells, dtype=np.uint64)
+        bin_idx = bin_df.index.get_indexer(earthquake_gdf["bin_id"].values)
 
-                if category == "observed":
-                    spacemag_bin.mag_bins[nearest_bc].observed_earthquakes.append(
-                        eq["Eq"]
-                    )
-                    spacemag_bin.observed_earthquakes[nearest_bc].append(eq["Eq"])
-                elif category == "prospective":
-                    spacemag_bin.mag_bins[nearest_bc].prospective_earthquakes.append(
-                        eq["Eq"]
-                    )
-                    spacemag_bin.prospective_earthquakes[nearest_bc].append(eq["Eq"])
-        except:
-            pass
+    for i, eq in zip(bin_idx, earthquake_gdf["Eq"].values):
+        if i >= 0:
+            spacemag_bins[i].add_earthquake(eq, category=category)
 
 
 def make_SpacemagBins_from_bin_gis_file(
@@ -882,20 +1791,20 @@ def make_SpacemagBins_from_bin_gdf(
         :class:`~openquake.hme.utils.bins.SpacemagBin` as a column.
     """
 
-    def bin_to_mag(row):
-        return SpacemagBin(
-            row.geometry,
-            bin_id=row._name,
-            min_mag=min_mag,
-            max_mag=max_mag,
-            bin_width=bin_width,
-        )
-
-    bin_gdf["SpacemagBin"] = bin_gdf.apply(bin_to_mag, axis=1)
+    # the index values keep their dtype (e.g. integer `h3` cell ids)
+    bin_collection = BinCollection(
+        bin_gdf.index.values, min_mag=min_mag, max_mag=max_mag, bin_width=bin_width
+    )
+    bin_gdf["SpacemagBin"] = bin_collection.make_spacemag_bins(bin_gdf.geometry)
 
     # create serialization functions and add to instantiated GeoDataFrame
     def to_dict():
-        out_dict = {i: bin_gdf.loc[i, "SpacemagBin"].to_dict() for i in bin_gdf.index}
+        out_dict = {
+            bin_id: {**sbin.to_dict(), "bin_id": bin_id}
+            for bin_id, sbin in zip(
+                bin_ids_to_str(bin_gdf.index).tolist(), bin_gdf["SpacemagBin"]
+            )
+        }
 
         return out_dict
 
@@ -940,13 +1849,8 @@ def get_source_bins(bin_gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
     :returns:
         GeoDataFrame of bins with sources
     """
-    source_list = []
-    for i, row in bin_gdf.iterrows():
-        cum_mfd = row.SpacemagBin.get_rupture_mfd(cumulative=True)
-        if sum(cum_mfd.values()) > 0:
-            source_list.append(i)
-
-    source_bin_gdf = bin_gdf.loc[source_list]
+    bin_collection = get_bin_collection(bin_gdf)
+    source_bin_gdf = bin_gdf[bin_collection.rates.sum(axis=1) > 0]
     return source_bin_gdf
 
 
@@ -976,15 +1880,88 @@ def subset_source(
         `sub_gdf` areas that may still affect the study area to be included.
         Defaults to zero.
     """
+    bin_gdf = add_bin_geometry(bin_gdf)
+
+    region = read_subset_region(subset_file, buffer=buffer)
+
+    return bin_gdf.loc[bin_gdf.intersects(region).values]
+
+
+def read_subset_region(subset_file: str, buffer: float = 0.0):
+    """
+    Reads the geographic region used to subset the source model (see
+    :func:`subset_source`) as a single (multi)polygon, with the `buffer` (in
+    degrees) applied.
+    """
     sub_gdf = gpd.read_file(subset_file)
-    sub_gdf.crs = bin_gdf.crs
 
     if buffer != 0:
         sub_gdf["geometry"] = sub_gdf["geometry"].buffer(buffer)
 
-    sj = gpd.sjoin(bin_gdf, sub_gdf)
+    return sub_gdf.unary_union
+
+
+def get_source_bbox(source) -> Optional[Tuple[float, float, float, float]]:
+    """
+    Returns the (west, south, east, north) bounding box of a source, or
+    `None` if it can't be found (in which case the source should be kept
+    by any spatial filter).
+    """
+    try:
+        west, south, east, north = source.get_bounding_box(0.0)
+    except Exception:
+        return None
+
+    if west > east:
+        # crosses the antimeridian
+        return None
+    return west, south, east, north
+
+
+def filter_sources_by_region(
+    source_list: list, region, margin: float = 0.0
+) -> list:
+    """
+    Returns the sources in `source_list` whose bounding boxes intersect the
+    `region`, so that the ruptures of sources outside of the study area are
+    never made.
+
+    :param source_list:
+        List of sources.
+
+    :param region:
+        Geometry of the study area, as from :func:`read_subset_region`.
 
-    return bin_gdf.loc[sj.index]
+    :param margin:
+        Distance (in degrees) that the bounding boxes are expanded by, so that
+        sources with ruptures in bins overlapping the edge of the region are
+        kept.
+    """
+    prepared_region = prep(region)
+
+    kept_sources = []
+    for source in source_list:
+        bbox = get_source_bbox(source)
+        if bbox is None or prepared_region.intersects(box(*bbox).buffer(margin)):
+            kept_sources.append(source)
+
+    logger.info(
+        "  {} of {} sources are in the subset region".format(
+            len(kept_sources), len(source_list)
+        )
+    )
+    return kept_sources
+
+
+def get_region_margin(region, h3_res: int) -> float:
+    """
+    Returns the width (in degrees of longitude at the highest latitude of the
+    `region`) of an `h3` cell at resolution `h3_res`, which is how far the
+    ruptures of a bin that intersects the region can be from it.
+    """
+    max_lat = min(max(abs(region.bounds[1]), abs(region.bounds[3])), 80.0)
+    cell_width_km = 2.0 * h3.edge_length(h3_res, unit="km")
+    return cell_width_km / (111.2 * np.cos(np.radians(max_lat)))
 
 
 def sample_earthquakes(
@@ -1064,27 +2041,51 @@ def get_n_eqs_from_mfd(mfd: dict):
         return sum(len(val) for val in mfd.values())
 
 
-def get_model_mfd(bin_gdf: gpd.GeoDataFrame, cumulative: bool = False) -> dict:
-    mod_mfd = bin_gdf.iloc[0].SpacemagBin.get_rupture_mfd()
-    mag_bin_centers = bin_gdf.iloc[0].SpacemagBin.mag_bin_centers
+def get_bin_collection(bin_gdf: gpd.GeoDataFrame) -> BinCollection:
+    """
+    Returns a :class:`~openquake.hme.utils.bins.BinCollection` with the rates
+    and earthquake counts of the bins in `bin_gdf`, in the same order. If the
+    bins are views of a collection (as made by
+    :func:`make_SpacemagBins_from_bin_gdf`), that collection (or the rows of
+    it in `bin_gdf`) is returned; otherwise a new one is made from the bins.
+    """
+    bin_collection = _get_view_collection(bin_gdf)
+    if bin_collection is None:
+        return BinCollection.from_spacemag_bins(
+            bin_gdf["SpacemagBin"].values, bin_ids=bin_gdf.index.values
+        )
 
-    for i, row in bin_gdf.iloc[1:].iterrows():
-        bin_mod_mfd = row.SpacemagBin.get_rupture_mfd()
-        for bin_center, rate in bin_mod_mfd.items():
-            mod_mfd[bin_center] += rate
+    rows = np.array([sb.row for sb in bin_gdf["SpacemagBin"].values], dtype=int)
+    if len(rows) == len(bin_collection) and np.all(rows == np.arange(len(rows))):
+        return bin_collection
+    return bin_collection.take(rows)
 
-    if cumulative is True:
-        cum_mfd = {}
-        cum_mag = 0.0
-        # dict has descending order
-        for cb in mag_bin_centers[::-1]:
-            cum_mag += mod_mfd[cb]
-            cum_mfd[cb] = cum_mag
 
-        # make new dict with ascending order
-        mod_mfd = {cb: cum_mfd[cb] for cb in mag_bin_centers}
+def _get_view_collection(bin_gdf: gpd.GeoDataFrame) -> Optional[BinCollection]:
+    """
+    Returns the collection that all of the bins are views of, if there is
+    one.
+    """
+    spacemag_bins = bin_gdf["SpacemagBin"].values
+    if len(spacemag_bins) == 0:
+        return None
 
-    return mod_mfd
+    bin_collection = spacemag_bins[0].collection
+    if bin_collection is None or any(
+        sb.collection is not bin_collection for sb in spacemag_bins
+    ):
+        return None
+    return bin_collection
+
+
+def get_model_mfd(bin_gdf: gpd.GeoDataFrame, cumulative: bool = False) -> dict:
+    bin_collection = get_bin_collection(bin_gdf)
+    return dict(
+        zip(
+            bin_collection.mag_bin_centers,
+            bin_collection.get_rupture_mfd(cumulative=cumulative).tolist(),
+        )
+    )
 
 
 def get_obs_mfd(
@@ -1093,45 +2094,15 @@ def get_obs_mfd(
     prospective: bool = False,
     cumulative: bool = False,
 ) -> dict:
-    mag_bin_centers = bin_gdf.iloc[0].SpacemagBin.mag_bin_centers
-
-    if prospective is False:
-        obs_mfd = bin_gdf.iloc[0].SpacemagBin.get_empirical_mfd(t_yrs=t_yrs)
-    else:
-        obs_mfd = bin_gdf.iloc[0].SpacemagBin.get_prospective_mfd(t_yrs=t_yrs)
-
-    for i, row in bin_gdf.iloc[1:].iterrows():
-        if prospective is False:
-            bin_obs_mfd = row.SpacemagBin.get_empirical_mfd(t_yrs=t_yrs)
-        else:
-            bin_obs_mfd = row.SpacemagBin.get_prospective_mfd(t_yrs=t_yrs)
-
-        for bin_center, rate in bin_obs_mfd.items():
-            obs_mfd[bin_center] += rate
-
-    if cumulative is True:
-        cum_mfd = {}
-        cum_mag = 0.0
-        # dict has descending order
-        for cb in mag_bin_centers[::-1]:
-            cum_mag += obs_mfd[cb]
-            cum_mfd[cb] = cum_mag
-
-        # make new dict with ascending order
-        obs_mfd = {cb: cum_mfd[cb] for cb in mag_bin_centers}
-
-    return obs_mfd
+    bin_collection = get_bin_collection(bin_gdf)
+    obs_mfd = bin_collection.get_empirical_mfd(
+        t_yrs=t_yrs, cumulative=cumulative, prospective=prospective
+    )
+    return dict(zip(bin_collection.mag_bin_centers, obs_mfd.tolist()))
 
 
 def get_model_annual_eq_rate(bin_gdf: gpd.GeoDataFrame) -> float:
-    annual_rup_rate = 0.0
-    for i, row in bin_gdf.iterrows():
-        sb = row.SpacemagBin
-        min_bin_center = np.min(sb.mag_bin_centers)
-        bin_mfd = sb.get_rupture_mfd(cumulative=True)
-        annual_rup_rate += bin_mfd[min_bin_center]
-
-    return annual_rup_rate
+    return float(get_bin_collection(bin_gdf).rates.sum())
 
 
 def get_total_obs_eqs(bin_gdf: gpd.GeoDataFrame, prospective: bool = False) -> list:
@@ -82,7 +82,7 @@ class test_relm_test_functions(unittest.TestCase):
     def test_s_test_bin(self):
         S_test_cfg = self.cfg["config"]["model_framework"]["relm"]["S_test"]
 
-        sb = self.bin_gdf.loc["836860fffffffff"].SpacemagBin
+        sb = self.bin_gdf.loc[0x836860fffffffff].SpacemagBin
 
         s_test_bin_res = s_test_bin(sb, S_test_cfg)
 
@@ -92,7 +92,7 @@ class test_relm_test_functions(unittest.TestCase):
         N_test_cfg = self.cfg["config"]["model_framework"]["relm"]["N_test"]
         t_yrs = N_test_cfg["investigation_time"]
 
-        sb = self.bin_gdf.loc["836864fffffffff"].SpacemagBin
+        sb = self.bin_gdf.loc[0x836864fffffffff].SpacemagBin
 
         obs_eqs = sb.observed_earthquakes
         rate_mfd = sb.get_rupture_mfd()
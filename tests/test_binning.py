@@ -0,0 +1,330 @@
+import unittest
+import time
+
+import numpy as np
+import pandas as pd
+from h3 import h3
+from shapely.geometry import Point, box
+
+from openquake.hme.utils.bins import MagBin, SpacemagBin
+from openquake.hme.utils import binning
+from openquake.hme.utils.binning import (
+    bin_ids_to_str,
+    get_depth_bin_idx,
+    split_depth_slabs,
+    get_h3_cells,
+    get_h3_cell_polygons,
+    get_h3_parents,
+    get_parent_rates,
+    h3_cells_from_str,
+    h3_cells_to_str,
+    get_mag_bin_centers,
+    get_mag_bin_idx,
+    get_nearest_mag_bin_idx,
+    PolygonBinIndex,
+    RuptureRateBinner,
+)
+
+
+class TestMagBins(unittest.TestCase):
+    def test_mag_bin_centers(self):
+        sbin = SpacemagBin(None, min_mag=6.0, max_mag=9.0, bin_width=0.2)
+        self.assertEqual(get_mag_bin_centers(6.0, 9.0, 0.2), sbin.mag_bin_centers)
+
+    def test_mag_bin_idx(self):
+        sbin = SpacemagBin(None, min_mag=6.0, max_mag=8.0, bin_width=0.2)
+        edges = sbin.get_bin_edges()
+        mags = np.array([5.0, 5.9, 5.95, 6.0, 6.1, 6.55, 7.3, 8.1, 8.3, 9.0])
+
+        cut = pd.cut(mags, edges, labels=False)
+        cut = np.where(np.isnan(cut), -1, cut).astype(int)
+
+        np.testing.assert_array_equal(get_mag_bin_idx(mags, edges), cut)
+
+    def test_nearest_mag_bin_idx(self):
+        sbin = SpacemagBin(None, min_mag=6.0, max_mag=8.0, bin_width=0.2)
+        mags = np.concatenate(
+            [
+                [5.0, 5.9, 5.95, 6.0, 6.1, 6.3, 6.55, 6.9, 7.3, 7.9, 8.1, 8.3],
+                np.arange(5.8, 8.3, 0.05),
+                np.arange(58, 83) / 10.0,
+            ]
+        )
+
+        idx = get_nearest_mag_bin_idx(
+            mags, sbin.mag_bin_centers, 0.2, min_mag=6.0, max_mag=8.0
+        )
+        centers = [sbin.get_mag_bin_center(mag) for mag in mags]
+
+        np.testing.assert_array_equal(idx == -1, [bc is None for bc in centers])
+        self.assertEqual(
+            [sbin.mag_bin_centers[i] for i in idx if i >= 0],
+            [bc for bc in centers if bc is not None],
+        )
+
+
+class TestH3Cells(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.lons = rng.uniform(-180.0, 180.0, 1000)
+        self.lats = rng.uniform(-85.0, 85.0, 1000)
+
+    def test_get_h3_cells(self):
+        for h3_res in (0, 3, 9):
+            expected = [
+                h3.geo_to_h3(lat, lon, h3_res) for lon, lat in zip(self.lons, self.lats)
+            ]
+            cells = get_h3_cells(self.lons, self.lats, h3_res)
+
+            self.assertEqual(cells.dtype, np.uint64)
+            np.testing.assert_array_equal(h3_cells_to_str(cells), expected)
+            np.testing.assert_array_equal(h3_cells_from_str(expected), cells)
+
+    def test_get_h3_cells_without_vect(self):
+        h3_vect = binning.h3_vect
+        binning.h3_vect = None
+        try:
+            cells = get_h3_cells(self.lons, self.lats, 3)
+        finally:
+            binning.h3_vect = h3_vect
+
+        np.testing.assert_array_equal(cells, get_h3_cells(self.lons, self.lats, 3))
+
+    def test_no_points(self):
+        self.assertEqual(len(get_h3_cells([], [], 3)), 0)
+        self.assertEqual(len(h3_cells_to_str([])), 0)
+
+    def test_get_h3_parents(self):
+        # h3 cells are not exactly nested, so the parent of the cell holding a
+        # point is not always the coarser cell holding that point
+        cells = get_h3_cells(self.lons, self.lats, 5)
+        for h3_res in (2, 3, 5):
+            expected = [
+                int(h3.h3_to_parent(format(cell, "x"), h3_res), 16)
+                for cell in cells.tolist()
+            ]
+            np.testing.assert_array_equal(get_h3_parents(cells, h3_res), expected)
+
+    def test_get_h3_cell_polygons(self):
+        lons, lats = np.array([121.0, 125.0, 121.0]), np.array([15.0, 10.0, 15.0])
+        cells = get_h3_cells(lons, lats, 3)
+        polys = get_h3_cell_polygons(cells)
+
+        self.assertEqual(len(polys), 3)
+        for lon, lat, poly in zip(lons, lats, polys):
+            self.assertTrue(poly.contains(Point(lon, lat)))
+
+        sbin = SpacemagBin(None, bin_id=cells[0], min_mag=6.0, max_mag=7.0)
+        self.assertTrue(sbin.poly.equals(polys[0]))
+
+    def test_bin_ids_to_str(self):
+        cells = get_h3_cells(self.lons[:10], self.lats[:10], 3)
+        np.testing.assert_array_equal(bin_ids_to_str(cells), h3_cells_to_str(cells))
+
+        # ids of bins not made from h3 cells are kept
+        np.testing.assert_array_equal(bin_ids_to_str(np.arange(10)), np.arange(10))
+
+
+class TestPolygonBinIndex(unittest.TestCase):
+    def setUp(self):
+        self.bin_index = PolygonBinIndex(
+            [box(120.0, 14.0, 122.0, 16.0), box(124.0, 9.0, 126.0, 11.0)],
+            bin_ids=[10, 20],
+        )
+
+    def test_get_rows(self):
+        lons = np.array([121.0, 125.0, 121.5, 130.0, 121.0])
+        lats = np.array([15.0, 10.0, 14.5, 0.0, 15.0])
+        np.testing.assert_array_equal(
+            self.bin_index.get_rows(lons, lats), [0, 1, 0, -1, 0]
+        )
+        self.assertEqual(len(self.bin_index.get_rows([], [])), 0)
+
+    def test_get_rows_overlapping(self):
+        bin_index = PolygonBinIndex(
+            [box(120.0, 14.0, 122.0, 16.0), box(121.0, 14.0, 123.0, 16.0)]
+        )
+        np.testing.assert_array_equal(
+            bin_index.get_rows([120.5, 121.5, 122.5], [15.0, 15.0, 15.0]), [0, 0, 1]
+        )
+
+    @unittest.skipIf(binning.STRtree is None, "needs shapely >= 2.0")
+    def test_get_rows_time(self):
+        # looking up points in the polygons should take about as long as
+        # finding their h3 cells
+        rng = np.random.default_rng(42)
+        lons = rng.uniform(118.0, 128.0, 200_000)
+        lats = rng.uniform(8.0, 18.0, 200_000)
+        self.bin_index.get_rows(lons[:10], lats[:10])
+
+        t0 = time.time()
+        get_h3_cells(lons, lats, 3)
+        t1 = time.time()
+        self.bin_index.get_rows(lons, lats)
+        t2 = time.time()
+
+        self.assertLess(t2 - t1, 5.0 * (t1 - t0) + 0.5)
+
+    def test_binner(self):
+        binner = RuptureRateBinner(min_mag=6.0, max_mag=7.0, bin_index=self.bin_index)
+        binner.add_ruptures(
+            np.array([121.0, 121.0, 125.0, 130.0]),
+            np.array([15.0, 15.0, 10.0, 0.0]),
+            np.array([6.0, 6.55, 6.0, 6.0]),
+            np.array([0.1, 0.01, 0.2, 1.0]),
+        )
+        rate_df = binner.to_dataframe()
+
+        self.assertEqual(binner.n_ruptures, 3)
+        self.assertEqual(sorted(rate_df.index), [10, 20])
+        self.assertAlmostEqual(rate_df.loc[10, 6.6], 0.01)
+        self.assertAlmostEqual(rate_df.loc[20, 6.0], 0.2)
+
+
+class TestRuptureRateBinner(unittest.TestCase):
+    def setUp(self):
+        self.binner = RuptureRateBinner(h3_res=3, min_mag=6.0, max_mag=7.0)
+        self.lons = np.array([121.0, 121.0, 121.0, 125.0])
+        self.lats = np.array([15.0, 15.0, 15.0, 10.0])
+        self.mags = np.array([6.0, 6.05, 6.55, 5.0])
+        self.rates = np.array([0.1, 0.2, 0.01, 1.0])
+
+    def test_add_ruptures(self):
+        self.binner.add_ruptures(self.lons, self.lats, self.mags, self.rates)
+        self.binner.add_ruptures(self.lons, self.lats, self.mags, self.rates)
+        rate_df = self.binner.to_dataframe()
+
+        self.assertEqual(self.binner.n_ruptures, 8)
+        # the cell with only out-of-range ruptures is kept, with zero rates
+        self.assertEqual(len(rate_df), 2)
+        self.assertAlmostEqual(rate_df.values.sum(), 2 * 0.31)
+
+        self.assertEqual(rate_df.index.dtype, np.uint64)
+        cell_rates = rate_df.loc[int(h3.geo_to_h3(15.0, 121.0, 3), 16)]
+        self.assertAlmostEqual(cell_rates[6.0], 0.6)
+        self.assertAlmostEqual(cell_rates[6.4], 0.0)
+        self.assertAlmostEqual(cell_rates[6.6], 0.02)
+
+    def test_add_ruptures_on_bin_edges(self):
+        mags = np.array([6.3, 6.9, 6.1, 6.5])
+        self.binner.add_ruptures(self.lons, self.lats, mags, np.ones(4))
+        rate_df = self.binner.to_dataframe()
+
+        edges = SpacemagBin(None, min_mag=6.0, max_mag=7.0).get_bin_edges()
+        expected = pd.cut(mags, edges, labels=False)
+        cell_rates = rate_df.loc[int(h3.geo_to_h3(15.0, 121.0, 3), 16)]
+        np.testing.assert_array_equal(
+            np.flatnonzero(cell_rates.values), sorted(expected[:3])
+        )
+        self.assertEqual(cell_rates[6.2], 1.0)
+        self.assertEqual(cell_rates[6.8], 1.0)
+
+    def test_region(self):
+        region = Point(121.0, 15.0).buffer(0.1)
+        binner = RuptureRateBinner(h3_res=3, min_mag=6.0, max_mag=7.0, region=region)
+        binner.add_ruptures(self.lons, self.lats, self.mags, self.rates)
+        rate_df = binner.to_dataframe()
+
+        self.assertEqual(binner.n_ruptures, 3)
+        np.testing.assert_array_equal(
+            rate_df.index, get_h3_cells(self.lons[:1], self.lats[:1], 3)
+        )
+        np.testing.assert_array_equal(
+            binner.in_region(get_h3_cells(self.lons, self.lats, 3)),
+            [True, True, True, False],
+        )
+
+    def test_depth_edges(self):
+        depths = np.array([0.0, 10.0, 30.0, 200.0])
+        np.testing.assert_array_equal(
+            get_depth_bin_idx(depths, [0.0, 20.0, 70.0]), [0, 0, 1, -1]
+        )
+
+        binner = RuptureRateBinner(
+            h3_res=3, min_mag=6.0, max_mag=7.0, depth_edges=[0.0, 20.0, 70.0]
+        )
+        binner.add_ruptures(self.lons, self.lats, self.mags, self.rates, depth=depths)
+        slab_rates = split_depth_slabs(binner.to_dataframe())
+
+        self.assertEqual(list(slab_rates.keys()), ["0-20", "20-70"])
+        cell = int(h3.geo_to_h3(15.0, 121.0, 3), 16)
+        self.assertAlmostEqual(slab_rates["0-20"].loc[cell, 6.0], 0.3)
+        self.assertAlmostEqual(slab_rates["0-20"].loc[cell, 6.6], 0.0)
+        self.assertAlmostEqual(slab_rates["20-70"].loc[cell, 6.6], 0.01)
+        self.assertEqual(list(slab_rates["20-70"].columns), binner.mag_bin_centers)
+
+        with self.assertRaises(ValueError):
+            binner.add_ruptures(self.lons, self.lats, self.mags, self.rates)
+
+    def test_parent_rates(self):
+        fine = RuptureRateBinner(h3_res=5, min_mag=6.0, max_mag=7.0)
+        fine.add_ruptures(self.lons, self.lats, self.mags, self.rates)
+
+        fine_df = fine.to_dataframe()
+        parent_df = get_parent_rates(fine_df, 3)
+
+        self.assertEqual(parent_df.index.dtype, np.uint64)
+        self.assertEqual(
+            sorted(parent_df.index.tolist()),
+            sorted(set(get_h3_parents(fine_df.index.values, 3).tolist())),
+        )
+        np.testing.assert_allclose(
+            parent_df.values.sum(axis=0), fine_df.values.sum(axis=0)
+        )
+
+    def test_merge_arrays(self):
+        self.binner.add_ruptures(self.lons, self.lats, self.mags, self.rates)
+
+        other = RuptureRateBinner(**self.binner.get_params())
+        other.add_ruptures(self.lons, self.lats, self.mags, self.rates)
+        self.binner.add_arrays(other.to_arrays())
+
+        merged = RuptureRateBinner(**self.binner.get_params())
+        merged.add_ruptures(self.lons, self.lats, self.mags, 2 * self.rates)
+
+        self.assertEqual(self.binner.n_ruptures, 8)
+        pd.testing.assert_frame_equal(
+            self.binner.to_dataframe(), merged.to_dataframe()
+        )
+
+    def test_by_source(self):
+        binner = RuptureRateBinner(h3_res=3, min_mag=6.0, max_mag=7.0, by_source=True)
+        binner.add_ruptures(
+            self.lons[:2], self.lats[:2], self.mags[:2], self.rates[:2], "a"
+        )
+        binner.add_ruptures(
+            self.lons[2:], self.lats[2:], self.mags[2:], self.rates[2:], "b"
+        )
+
+        merged = RuptureRateBinner(**binner.get_params())
+        merged.add_arrays(binner.to_arrays())
+        source_df = merged.to_source_dataframe()
+
+        self.assertEqual(
+            sorted(set(source_df.index.get_level_values("source"))), ["a", "b"]
+        )
+        self.assertAlmostEqual(source_df.loc["a"].values.sum(), 0.3)
+        np.testing.assert_allclose(
+            source_df.groupby(level="cell").sum().loc[merged.to_dataframe().index],
+            merged.to_dataframe(),
+        )
+
+
+class TestRateOnlyMagBin(unittest.TestCase):
+    def test_total_rupture_rate(self):
+        mb = MagBin(bin_center=6.0, bin_width=0.2, rate=0.5)
+        self.assertEqual(mb.calculate_total_rupture_rate(return_rate=True), 0.5)
+
+    def test_sample_ruptures(self):
+        np.random.seed(69)
+        mb = MagBin(bin_center=6.0, bin_width=0.2, rate=0.5)
+        mb.sample_ruptures(1000.0)
+
+        self.assertTrue(400 < len(mb.stochastic_earthquakes) < 600)
+        self.assertTrue(
+            all(eq.magnitude == 6.0 for eq in mb.stochastic_earthquakes)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,6 +3,7 @@ import logging
 import unittest
 
 import numpy as np
+import pandas as pd
 
 from openquake.hme.core.core import load_inputs
 from openquake.hme.model_test_frameworks.relm.relm_tests import S_test, N_test, M_test
@@ -75,3 +76,39 @@ def test_sample_ruptures():
             print(k, len(v))
         evs.append(rs.copy())
         rnd.append(np.random.get_state())
+
+
+def test_bin_collection_views():
+    from openquake.hme.utils.utils import get_bin_collection
+
+    bin_collection = get_bin_collection(bin_gdf)
+    assert len(bin_collection) == len(bin_gdf)
+
+    sb = bin_gdf.iloc[0].SpacemagBin
+    row = bin_collection.get_rows([bin_gdf.index[0]])[0]
+
+    np.testing.assert_array_almost_equal(
+        list(sb.get_rupture_mfd().values()), bin_collection.rates[row]
+    )
+    np.testing.assert_array_equal(
+        [len(sb.observed_earthquakes[mag]) for mag in sb.mag_bin_centers],
+        bin_collection.observed_counts[row],
+    )
+
+
+def test_bin_collection_add_earthquake():
+    from openquake.hme.utils.bins import BinCollection
+
+    bin_collection = BinCollection(
+        [0, 1], min_mag=6.5, max_mag=7.5, bin_width=0.5
+    )
+    sbs = bin_collection.make_spacemag_bins([None, None])
+
+    sbs[1].add_earthquake(pd.Series({"magnitude": 7.1}))
+    sbs[1].add_earthquake(pd.Series({"magnitude": 9.0}))
+
+    # the bin centers are 6.5, 7.0, 7.5 and 8.0, as for a SpacemagBin
+    np.testing.assert_array_equal(
+        bin_collection.observed_counts, [[0, 0, 0, 0], [0, 1, 0, 0]]
+    )
+    assert len(sbs[1].observed_earthquakes[7.0]) == 1
@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from openquake.hme.utils.rupture_table import RuptureTable
+from openquake.hme.utils.cache import (
+    hash_file,
+    rupture_cache_key,
+    read_cached_ruptures,
+    write_cached_ruptures,
+    binned_rates_cache_key,
+    read_cached_binned_rates,
+    write_cached_binned_rates,
+)
+from openquake.hme.utils.binning import RuptureRateBinner
+
+BASE_PATH = os.path.dirname(__file__)
+SM1_FAULT = os.path.join(
+    BASE_PATH, "data", "source_models", "sm1", "ssm", "phl_fault.xml"
+)
+
+
+class TestRuptureCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.table = RuptureTable(
+            source_ids=["a", "b"],
+            mag=[6.0, 6.5, 7.0],
+            occurrence_rate=[0.1, 0.01, 0.001],
+            longitude=[120.0, 121.0, 122.0],
+            latitude=[10.0, 11.0, 12.0],
+            depth=[5.0, 10.0, 15.0],
+            source_idx=[0, 1, 1],
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_cache_miss(self):
+        self.assertIsNone(read_cached_ruptures(self.cache_dir, "nokey"))
+
+    def test_round_trip(self):
+        write_cached_ruptures(self.cache_dir, "key", self.table)
+        table = read_cached_ruptures(self.cache_dir, "key")
+
+        self.assertIsInstance(table.mag.base, np.memmap)
+        for col in RuptureTable.columns:
+            np.testing.assert_array_equal(
+                getattr(table, col), getattr(self.table, col)
+            )
+        np.testing.assert_array_equal(table.source, ["a", "b", "b"])
+
+    def test_cache_key(self):
+        key = rupture_cache_key([SM1_FAULT], branch="b1", rupture_mesh_spacing=2.0)
+
+        self.assertEqual(
+            key,
+            rupture_cache_key([SM1_FAULT], branch="b1", rupture_mesh_spacing=2.0),
+        )
+        self.assertNotEqual(
+            key,
+            rupture_cache_key([SM1_FAULT], branch="b1", rupture_mesh_spacing=5.0),
+        )
+        self.assertNotEqual(
+            key,
+            rupture_cache_key(
+                [SM1_FAULT],
+                branch="b1",
+                rupture_mesh_spacing=2.0,
+                tectonic_region_types=["Active Shallow Crust"],
+            ),
+        )
+
+    def test_cache_key_changes_with_file_contents(self):
+        tmp_file = os.path.join(self.cache_dir, "source.xml")
+        shutil.copy(SM1_FAULT, tmp_file)
+        key = rupture_cache_key([tmp_file], branch="b1")
+        hash_0 = hash_file(tmp_file)
+
+        with open(tmp_file, "a") as f:
+            f.write("\n")
+
+        self.assertNotEqual(hash_0, hash_file(tmp_file))
+        self.assertNotEqual(key, rupture_cache_key([tmp_file], branch="b1"))
+
+
+class TestBinnedRatesCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.binner = RuptureRateBinner(by_source=True)
+        self.binner.add_ruptures(
+            [120.0, 121.0], [10.0, 11.0], [6.5, 7.1], [0.01, 0.001], source_id="a"
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_round_trip(self):
+        self.assertIsNone(read_cached_binned_rates(self.cache_dir, "key"))
+
+        write_cached_binned_rates(self.cache_dir, "key", self.binner.to_arrays())
+        arrays = read_cached_binned_rates(self.cache_dir, "key")
+
+        binner = RuptureRateBinner(by_source=True)
+        binner.add_arrays(arrays)
+        self.assertEqual(binner.n_ruptures, 2)
+        np.testing.assert_array_equal(
+            binner.to_dataframe().values, self.binner.to_dataframe().values
+        )
+        np.testing.assert_array_equal(
+            binner.to_source_dataframe().values,
+            self.binner.to_source_dataframe().values,
+        )
+
+    def test_cache_key(self):
+        params = self.binner.get_params()
+        key = binned_rates_cache_key(SM1_FAULT, binning=params)
+
+        self.assertEqual(key, binned_rates_cache_key(SM1_FAULT, binning=params))
+        self.assertNotEqual(
+            key, binned_rates_cache_key(SM1_FAULT, binning={**params, "h3_res": 4})
+        )
+        self.assertNotEqual(
+            key,
+            binned_rates_cache_key(SM1_FAULT, binning=params, source_types=["point"]),
+        )
@@ -1,7 +1,21 @@
 import os
+import shutil
+import tempfile
 import unittest
+from copy import deepcopy
+from unittest import mock
 
-from openquake.hme.core.core import read_yaml_config, get_test_lists_from_config
+import numpy as np
+
+from openquake.hme.core.core import (
+    read_yaml_config,
+    get_test_lists_from_config,
+    cfg_defaults,
+    load_branch_rupture_rates_from_ssm,
+    _bin_source_list,
+    _get_model_cfg,
+    _get_h3_resolutions,
+)
 
 BASE_PATH = os.path.dirname(__file__)
 UNIT_TEST_DATA_DIR = os.path.join(BASE_PATH, "data", "unit_test_data")
@@ -15,21 +29,42 @@ def test_read_yaml_config():
     cfg = read_yaml_config(yml_2)
     assert cfg == {
         "input": {
-            "bins": {"h3_res": 3, "mfd_bin_max": 9.0},
+            "bins": {
+                "h3_res": 3,
+                "bin_gis_file": None,
+                "depth_edges": None,
+                "mfd_bin_max": 9.0,
+            },
             "ssm": {
                 "branch": "b1",
+                "datastore": None,
+                "all_branches": False,
+                "weighted_mean": True,
                 "tectonic_region_types": ["Active Shallow Crust"],
                 "source_types": None,
                 "ssm_dir": "../../../../data/source_models/sm1/",
                 "ssm_lt_file": "ssmLT.xml",
+                "keep_ruptures": False,
+                "analytic_point_sources": True,
+                "rupture_cache_dir": None,
+                "rate_cache_dir": None,
+                "area_source_discretization": 15.0,
+                "rupture_mesh_spacing": 2.0,
+                "complex_fault_mesh_spacing": 5.0,
+                "skip_bad_files": False,
             },
+            "subset": {"file": None, "buffer": 0.0},
         },
         "meta": {"description": "Fake yaml for testing"},
         "config": {
+            "n_procs": None,
+            "max_rups_per_task": None,
+            "max_in_flight_rups": None,
+            "max_rss_gb": None,
             "model_framework": {
                 "gem": {"likelihood": {"p1": 1, "p2": 2}},
                 "sanity": {"max_check": {"warn": True}},
-            }
+            },
         },
     }
 
@@ -41,3 +76,120 @@ def test_get_test_lists_from_config():
 
     assert gem_test_names == ["mfd_likelihood_test"]
     assert sanity_test_names == ["max_check"]
+
+
+SM1_DIR = os.path.join(BASE_PATH, "data", "source_models", "sm1")
+
+BRANCH_LT = """<?xml version="1.0" encoding="UTF-8"?>
+<nrml xmlns:gml="http://www.opengis.net/gml"
+      xmlns="http://openquake.org/xmlns/nrml/0.5">
+    <logicTree logicTreeID="lt1">
+        <logicTreeBranchingLevel branchingLevelID="bl1">
+            <logicTreeBranchSet uncertaintyType="sourceModel"
+                                branchSetID="bs1">
+                <logicTreeBranch branchID="b1">
+                    <uncertaintyModel>ssm/phl_fault.xml</uncertaintyModel>
+                    <uncertaintyWeight>0.4</uncertaintyWeight>
+                </logicTreeBranch>
+                <logicTreeBranch branchID="b2">
+                    <uncertaintyModel>
+                        ssm/phl_fault.xml ssm/phl_fault_2.xml
+                    </uncertaintyModel>
+                    <uncertaintyWeight>0.6</uncertaintyWeight>
+                </logicTreeBranch>
+            </logicTreeBranchSet>
+        </logicTreeBranchingLevel>
+    </logicTree>
+</nrml>
+"""
+
+
+class TestLoadBranchRuptureRates(unittest.TestCase):
+    def setUp(self):
+        self.ssm_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.ssm_dir, "ssm"))
+        fault_file = os.path.join(SM1_DIR, "ssm", "phl_fault.xml")
+        for name in ("phl_fault.xml", "phl_fault_2.xml"):
+            shutil.copy(fault_file, os.path.join(self.ssm_dir, "ssm", name))
+        with open(os.path.join(self.ssm_dir, "ssmLT.xml"), "w") as f:
+            f.write(BRANCH_LT)
+
+        self.cfg = deepcopy(cfg_defaults)
+        self.cfg["config"]["parallel"] = False
+        self.cfg["input"]["bins"].update(
+            {"mfd_bin_min": 6.0, "mfd_bin_max": 8.5, "mfd_bin_width": 0.2}
+        )
+        self.cfg["input"]["ssm"].update(
+            {
+                "ssm_dir": self.ssm_dir + "/",
+                "ssm_lt_file": "ssmLT.xml",
+                "all_branches": True,
+            }
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.ssm_dir)
+
+    def test_load_branch_rupture_rates_from_ssm(self):
+        branch_rates = load_branch_rupture_rates_from_ssm(self.cfg)
+        self.assertEqual(set(branch_rates.keys()), {"b1", "b2", "weighted_mean"})
+
+        b1 = branch_rates["b1"]
+        self.assertGreater(b1.values.sum(), 0.0)
+        np.testing.assert_allclose(branch_rates["b2"].loc[b1.index], 2.0 * b1)
+        np.testing.assert_allclose(
+            branch_rates["weighted_mean"].loc[b1.index], 1.6 * b1
+        )
+
+    def test_rate_cache_rebins_changed_files(self):
+        self.cfg["input"]["ssm"]["rate_cache_dir"] = os.path.join(
+            self.ssm_dir, "rate_cache"
+        )
+        branch_rates = load_branch_rupture_rates_from_ssm(self.cfg)
+
+        with open(os.path.join(self.ssm_dir, "ssm", "phl_fault_2.xml"), "a") as f:
+            f.write("\n")
+
+        with mock.patch(
+            "openquake.hme.core.core._bin_source_list", wraps=_bin_source_list
+        ) as bin_source_list:
+            new_branch_rates = load_branch_rupture_rates_from_ssm(self.cfg)
+
+        self.assertEqual(bin_source_list.call_count, 1)
+        for branch, rates in branch_rates.items():
+            np.testing.assert_allclose(
+                new_branch_rates[branch].loc[rates.index].values, rates.values
+            )
+
+    def test_get_model_cfg(self):
+        cfg = deepcopy(self.cfg)
+        cfg["report"] = {"basic": {"outfile": "out/report.html"}}
+        model_cfg = _get_model_cfg(cfg, "b2")
+
+        self.assertEqual(model_cfg["report"]["basic"]["outfile"], "out/report_b2.html")
+        self.assertEqual(model_cfg["input"]["ssm"]["branch"], "b2")
+        self.assertEqual(cfg["report"]["basic"]["outfile"], "out/report.html")
+        self.assertIs(_get_model_cfg(cfg, None), cfg)
+
+    def test_get_model_cfg_h3_res(self):
+        cfg = deepcopy(self.cfg)
+        cfg["input"]["bins"]["h3_res"] = [4, 2, 3]
+        cfg["report"] = {"basic": {"outfile": "out/report.html"}}
+        self.assertEqual(_get_h3_resolutions(cfg), [2, 3, 4])
+
+        model_cfg = _get_model_cfg(cfg, h3_res=2)
+        self.assertEqual(
+            model_cfg["report"]["basic"]["outfile"], "out/report_res2.html"
+        )
+        self.assertEqual(model_cfg["input"]["bins"]["h3_res"], 2)
+        self.assertEqual(_get_h3_resolutions(model_cfg), [2])
+
+        model_cfg = _get_model_cfg(cfg, "b2", 3)
+        self.assertEqual(
+            model_cfg["report"]["basic"]["outfile"], "out/report_b2_res3.html"
+        )
+
+        model_cfg = _get_model_cfg(cfg, depth_slab="0-20")
+        self.assertEqual(
+            model_cfg["report"]["basic"]["outfile"], "out/report_depth0-20.html"
+        )
@@ -0,0 +1,155 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+from openquake.hme.utils.binning import RuptureRateBinner
+from openquake.hme.utils.datastore import (
+    TWO24,
+    iter_datastore_rupture_chunks,
+    bin_rupture_rates_from_datastore,
+    rupture_table_from_datastore,
+)
+
+RUPTURE_DT = np.dtype(
+    [
+        ("id", np.int64),
+        ("source_id", np.uint32),
+        ("trt_smr", np.uint32),
+        ("mag", np.float32),
+        ("rake", np.float32),
+        ("occurrence_rate", np.float32),
+        ("hypo", (np.float32, 3)),
+    ]
+)
+
+SOURCE_INFO_DT = np.dtype([("source_id", "S10"), ("code", "S1")])
+
+
+def write_datastore(filename, n_rups=500, seed=42):
+    """
+    Writes a small HDF5 file with the layout of the `ruptures` and
+    `source_info` arrays of an OpenQuake datastore.
+    """
+    rng = np.random.default_rng(seed)
+
+    rups = np.zeros(n_rups, dtype=RUPTURE_DT)
+    rups["id"] = np.arange(n_rups)
+    rups["source_id"] = rng.integers(0, 3, n_rups)
+    rups["trt_smr"] = np.where(rups["source_id"] == 2, 1, 0) * TWO24
+    rups["mag"] = rng.uniform(6.0, 8.0, n_rups)
+    rups["rake"] = 90.0
+    rups["occurrence_rate"] = rng.uniform(1e-5, 1e-3, n_rups)
+    rups["hypo"][:, 0] = rng.uniform(120.0, 122.0, n_rups)
+    rups["hypo"][:, 1] = rng.uniform(14.0, 16.0, n_rups)
+    rups["hypo"][:, 2] = rng.uniform(0.0, 20.0, n_rups)
+
+    source_info = np.array(
+        [(b"flt_1", b"S"), (b"flt_2", b"C"), (b"pts", b"P")], dtype=SOURCE_INFO_DT
+    )
+
+    with h5py.File(filename, "w") as h5:
+        h5["ruptures"] = rups
+        h5["source_info"] = source_info
+        h5.attrs["trts"] = ["Active Shallow Crust", "Subduction Interface"]
+
+    return rups
+
+
+class TestDatastore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.datastore = os.path.join(self.tmp_dir, "calc_1.hdf5")
+        self.rups = write_datastore(self.datastore)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_iter_chunks(self):
+        chunks = list(iter_datastore_rupture_chunks(self.datastore, chunk_size=128))
+
+        self.assertEqual(len(chunks), 4)
+        np.testing.assert_array_equal(
+            np.concatenate([c["mag"] for c in chunks]), self.rups["mag"]
+        )
+        np.testing.assert_array_equal(
+            np.concatenate([c["longitude"] for c in chunks]), self.rups["hypo"][:, 0]
+        )
+        self.assertEqual(
+            set(np.concatenate([c["source_id"] for c in chunks])),
+            {"flt_1", "flt_2", "pts"},
+        )
+
+    def test_filters(self):
+        chunks = list(
+            iter_datastore_rupture_chunks(
+                self.datastore, source_types=["simple_fault", "point"]
+            )
+        )
+        source_ids = np.concatenate([c["source_id"] for c in chunks])
+        self.assertEqual(set(source_ids), {"flt_1", "pts"})
+
+        chunks = list(
+            iter_datastore_rupture_chunks(
+                self.datastore, tectonic_region_types=["Subduction Interface"]
+            )
+        )
+        source_ids = np.concatenate([c["source_id"] for c in chunks])
+        self.assertEqual(set(source_ids), {"pts"})
+        self.assertEqual(len(source_ids), (self.rups["source_id"] == 2).sum())
+
+    def test_bin_rupture_rates_from_datastore(self):
+        binner = bin_rupture_rates_from_datastore(
+            self.datastore,
+            RuptureRateBinner(h3_res=3, min_mag=6.0, max_mag=8.0, bin_width=0.2),
+            chunk_size=100,
+        )
+
+        direct = RuptureRateBinner(h3_res=3, min_mag=6.0, max_mag=8.0, bin_width=0.2)
+        direct.add_ruptures(
+            self.rups["hypo"][:, 0],
+            self.rups["hypo"][:, 1],
+            self.rups["mag"],
+            self.rups["occurrence_rate"],
+        )
+
+        self.assertEqual(binner.n_ruptures, len(self.rups))
+        binned = binner.to_dataframe()
+        expected = direct.to_dataframe()
+        np.testing.assert_allclose(
+            binned.loc[expected.index].values, expected.values, rtol=1e-6
+        )
+
+    def test_bin_rupture_rates_by_source(self):
+        binner = bin_rupture_rates_from_datastore(
+            self.datastore,
+            RuptureRateBinner(
+                h3_res=3, min_mag=6.0, max_mag=8.0, bin_width=0.2, by_source=True
+            ),
+            chunk_size=100,
+        )
+        source_df = binner.to_source_dataframe()
+        self.assertEqual(
+            set(source_df.index.get_level_values("source")), {"flt_1", "flt_2", "pts"}
+        )
+        np.testing.assert_almost_equal(
+            source_df.values.sum(), binner.to_dataframe().values.sum()
+        )
+
+    def test_rupture_table_from_datastore(self):
+        rup_table = rupture_table_from_datastore(self.datastore, chunk_size=100)
+
+        self.assertEqual(len(rup_table), len(self.rups))
+        self.assertEqual(sorted(rup_table.source_ids), ["flt_1", "flt_2", "pts"])
+        np.testing.assert_almost_equal(
+            rup_table.occurrence_rate.sum(), self.rups["occurrence_rate"].sum(), 5
+        )
+        self.assertTrue(np.all(rup_table.rake == 90.0))
+        self.assertTrue(np.all(np.isnan(rup_table.strike)))
+
+
+if __name__ == "__main__":
+    unittest.main()
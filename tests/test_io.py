@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from openquake.hazardlib.sourceconverter import SourceConverter
+
+from openquake.hme.utils.io import iter_source_files, read_file_sources, sort_sources
+from openquake.hme.utils.model import read
+
+BASE_PATH = os.path.dirname(__file__)
+SM1_FAULT = os.path.join(
+    BASE_PATH, "data", "source_models", "sm1", "ssm", "phl_fault.xml"
+)
+
+
+class TestReadSourceFiles(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fault_copy = os.path.join(self.tmp_dir, "phl_fault_copy.xml")
+        shutil.copy(SM1_FAULT, self.fault_copy)
+
+        self.bad_file = os.path.join(self.tmp_dir, "bad.xml")
+        with open(self.bad_file, "w") as f:
+            f.write("<nrml>not a source model")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_iter_source_files_parallel(self):
+        serial = {
+            source_file: [s.source_id for s in sources]
+            for source_file, sources, error in iter_source_files(
+                [SM1_FAULT, self.fault_copy], n_procs=1
+            )
+        }
+        parallel = {
+            source_file: [s.source_id for s in sources]
+            for source_file, sources, error in iter_source_files(
+                [SM1_FAULT, self.fault_copy], n_procs=2
+            )
+        }
+        self.assertEqual(serial, parallel)
+        self.assertEqual(serial[SM1_FAULT], ["88"])
+
+    def test_iter_source_files_error(self):
+        results = {
+            source_file: (sources, error)
+            for source_file, sources, error in iter_source_files(
+                [SM1_FAULT, self.bad_file], n_procs=2
+            )
+        }
+        self.assertIsNone(results[SM1_FAULT][1])
+        self.assertIsNone(results[self.bad_file][0])
+        self.assertIsInstance(results[self.bad_file][1], str)
+
+    def test_sort_sources_raises_on_bad_files(self):
+        bad_copy = os.path.join(self.tmp_dir, "bad_copy.xml")
+        shutil.copy(self.bad_file, bad_copy)
+
+        with self.assertLogs(level="ERROR") as logs:
+            with self.assertRaises(ValueError) as err:
+                sort_sources({"b1": [self.bad_file, SM1_FAULT, bad_copy]}, n_procs=2)
+
+        for bad in (self.bad_file, bad_copy):
+            self.assertIn(bad, str(err.exception))
+            self.assertTrue(any(f"error reading {bad}" in msg for msg in logs.output))
+
+    def test_sort_sources_skips_bad_file(self):
+        with self.assertLogs(level="ERROR") as logs:
+            lt = sort_sources(
+                {"b1": [self.bad_file, SM1_FAULT]}, n_procs=2, skip_bad_files=True
+            )
+
+        self.assertEqual([s.source_id for s in lt["b1"]], ["88"])
+        self.assertTrue(any(self.bad_file in msg for msg in logs.output))
+
+
+    def test_read_file_sources(self):
+        file_sources = read_file_sources([SM1_FAULT, self.fault_copy, SM1_FAULT])
+        self.assertEqual(list(file_sources.keys()), [SM1_FAULT, self.fault_copy])
+        self.assertEqual([s.source_id for s in file_sources[SM1_FAULT]], ["88"])
+
+        file_sources = read_file_sources([SM1_FAULT], source_types=["area"])
+        self.assertEqual(file_sources[SM1_FAULT], [])
+
+    def test_read_filters_before_conversion(self):
+        with mock.patch.object(SourceConverter, "convert_simpleFaultSource") as convert:
+            sources, _ = read(SM1_FAULT, get_info=False, source_types=["point"])
+            self.assertEqual(sources, [])
+
+            sources, _ = read(
+                SM1_FAULT,
+                get_info=False,
+                tectonic_region_types=["Stable Continental Crust"],
+            )
+            self.assertEqual(sources, [])
+
+        convert.assert_not_called()
+
+        sources, _ = read(
+            SM1_FAULT,
+            get_info=False,
+            source_types=["simple_fault"],
+            tectonic_region_types=["Active Shallow Crust"],
+        )
+        self.assertEqual([s.source_id for s in sources], ["88"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+
+import numpy as np
+
+from openquake.hme.utils.simple_rupture import SimpleRupture
+from openquake.hme.utils.rupture_table import RuptureTable, RuptureTableBuilder
+
+
+def _make_table(source_ids=("s1", "s2"), source_idx=(0, 1, 1)):
+    n = len(source_idx)
+    return RuptureTable(
+        source_ids=list(source_ids),
+        mag=np.linspace(6.0, 7.0, n),
+        occurrence_rate=np.full(n, 0.01),
+        longitude=np.arange(n, dtype=float),
+        latitude=np.arange(n, dtype=float) + 10.0,
+        depth=np.full(n, 15.0),
+        strike=np.zeros(n),
+        dip=np.full(n, 90.0),
+        rake=np.zeros(n),
+        source_idx=list(source_idx),
+    )
+
+
+class TestRuptureTable(unittest.TestCase):
+    def setUp(self):
+        self.table = _make_table()
+
+    def test_len(self):
+        self.assertEqual(len(self.table), 3)
+
+    def test_dtypes(self):
+        self.assertEqual(self.table.mag.dtype, np.float64)
+        self.assertEqual(self.table.occurrence_rate.dtype, np.float64)
+        self.assertEqual(self.table.source_idx.dtype, np.int32)
+
+    def test_getitem_int(self):
+        rup = self.table[1]
+        self.assertIsInstance(rup, SimpleRupture)
+        self.assertEqual(rup.source, "s2")
+        self.assertEqual(rup.hypocenter.latitude, 11.0)
+        np.testing.assert_almost_equal(rup.occurrence_rate, 0.01)
+
+    def test_getitem_array(self):
+        sub = self.table[np.array([0, 2])]
+        self.assertIsInstance(sub, RuptureTable)
+        self.assertEqual(len(sub), 2)
+        np.testing.assert_array_equal(sub.source, ["s1", "s2"])
+
+    def test_iter(self):
+        rups = list(self.table)
+        self.assertEqual(len(rups), 3)
+        self.assertEqual([r.source for r in rups], ["s1", "s2", "s2"])
+
+    def test_concatenate_merges_source_ids(self):
+        other = _make_table(source_ids=("s2", "s3"), source_idx=(0, 1))
+        joined = RuptureTable.concatenate([self.table, other])
+        self.assertEqual(len(joined), 5)
+        self.assertEqual(list(joined.source_ids), ["s1", "s2", "s3"])
+        np.testing.assert_array_equal(
+            joined.source, ["s1", "s2", "s2", "s2", "s3"]
+        )
+
+    def test_dataframe_round_trip(self):
+        df = self.table.to_dataframe()
+        self.assertEqual(df["source"].dtype.name, "category")
+        table = RuptureTable.from_dataframe(df)
+        np.testing.assert_array_equal(table.source, self.table.source)
+        np.testing.assert_array_equal(table.mag, self.table.mag)
+
+
+class TestRuptureTableBuilder(unittest.TestCase):
+    def test_build(self):
+        builder = RuptureTableBuilder()
+        s1 = builder.get_source_idx("s1")
+        s2 = builder.get_source_idx("s2")
+        self.assertEqual(builder.get_source_idx("s1"), s1)
+
+        for i, s in enumerate([s1, s2, s2]):
+            builder.append(
+                mag=6.0 + i,
+                occurrence_rate=0.1,
+                longitude=0.0,
+                latitude=0.0,
+                depth=10.0,
+                strike=0.0,
+                dip=45.0,
+                rake=90.0,
+                source_idx=s,
+            )
+
+        table = builder.to_table()
+        self.assertEqual(len(table), 3)
+        np.testing.assert_array_equal(table.mag, [6.0, 7.0, 8.0])
+        np.testing.assert_array_equal(table.source, ["s1", "s2", "s2"])
@@ -0,0 +1,65 @@
+import os
+import time
+import unittest
+
+from openquake.hme.utils.scheduler import iter_budgeted_tasks, get_memory_use
+
+
+def _square(x):
+    return x * x
+
+
+def _timed(x):
+    start = time.time()
+    time.sleep(0.05)
+    return (start, time.time())
+
+
+def _fail(x):
+    raise ValueError(f"bad task {x}")
+
+
+def _die(x):
+    # as if the worker were killed for running out of memory
+    if x == 2:
+        os._exit(137)
+    time.sleep(0.05)
+    return x
+
+
+class TestIterBudgetedTasks(unittest.TestCase):
+    def test_all_results_returned(self):
+        results = list(iter_budgeted_tasks(_square, range(10), [1] * 10, 2))
+        self.assertEqual(sorted(results), [x * x for x in range(10)])
+
+    def test_in_flight_budget(self):
+        # each task uses the whole budget, so they must run one at a time
+        results = list(
+            iter_budgeted_tasks(_timed, range(4), [10] * 4, 4, max_in_flight_rups=10)
+        )
+        results = sorted(results)
+        for (_, end), (next_start, _) in zip(results[:-1], results[1:]):
+            self.assertLessEqual(end, next_start)
+
+    def test_task_larger_than_budget_runs(self):
+        results = list(
+            iter_budgeted_tasks(_square, [3], [100], 2, max_in_flight_rups=10)
+        )
+        self.assertEqual(results, [9])
+
+    def test_worker_error_raised(self):
+        with self.assertRaises(ValueError):
+            list(iter_budgeted_tasks(_fail, range(3), [1] * 3, 2))
+
+    def test_dead_worker_raised(self):
+        with self.assertRaisesRegex(RuntimeError, "worker process died"):
+            list(iter_budgeted_tasks(_die, range(5), [1] * 5, 2))
+
+    def test_get_memory_use(self):
+        mem = get_memory_use()
+        if mem is not None:
+            self.assertGreater(mem, 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
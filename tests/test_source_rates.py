@@ -0,0 +1,164 @@
+import unittest
+
+import numpy as np
+
+from openquake.hazardlib.geo import Point, Polygon, NodalPlane
+from openquake.hazardlib.mfd import TruncatedGRMFD
+from openquake.hazardlib.pmf import PMF
+from openquake.hazardlib.scalerel import WC1994
+from openquake.hazardlib.geo.surface import PlanarSurface
+from openquake.hazardlib.source import (
+    PointSource,
+    AreaSource,
+    NonParametricSeismicSource,
+)
+from openquake.hazardlib.source.rupture import BaseRupture
+from openquake.hazardlib.tom import PoissonTOM
+
+from openquake.hme.utils import (
+    RuptureRateBinner,
+    bin_rupture_rates_from_source_list,
+    rupture_list_from_source_list,
+)
+from openquake.hme.utils.utils import _get_rupture_occurrence_rate
+from openquake.hme.utils.source_rates import (
+    get_source_rates,
+    get_nonparametric_source_rates,
+)
+
+SOURCE_PARAMS = dict(
+    name="test",
+    tectonic_region_type="Active Shallow Crust",
+    mfd=TruncatedGRMFD(
+        min_mag=5.0, max_mag=7.5, bin_width=0.1, a_val=4.0, b_val=1.0
+    ),
+    rupture_mesh_spacing=2.0,
+    magnitude_scaling_relationship=WC1994(),
+    rupture_aspect_ratio=1.5,
+    temporal_occurrence_model=PoissonTOM(1.0),
+    upper_seismogenic_depth=0.0,
+    lower_seismogenic_depth=20.0,
+    nodal_plane_distribution=PMF(
+        [(0.5, NodalPlane(0.0, 90.0, 0.0)), (0.5, NodalPlane(90.0, 45.0, 90.0))]
+    ),
+    hypocenter_distribution=PMF([(0.7, 5.0), (0.3, 10.0)]),
+)
+
+
+def make_point_source():
+    return PointSource(
+        source_id="pt", location=Point(121.0, 15.0), **SOURCE_PARAMS
+    )
+
+
+def make_area_source():
+    return AreaSource(
+        source_id="area",
+        polygon=Polygon(
+            [Point(120.0, 14.0), Point(121.0, 14.0), Point(121.0, 15.0),
+             Point(120.0, 15.0)]
+        ),
+        area_discretization=20.0,
+        **SOURCE_PARAMS
+    )
+
+
+class TestSourceRates(unittest.TestCase):
+    def test_point_source_rates(self):
+        source = make_point_source()
+        rates = get_source_rates(source)
+
+        n_mags = len(source.get_annual_occurrence_rates())
+        self.assertEqual(len(rates["mag"]), n_mags * 2)
+        np.testing.assert_almost_equal(
+            rates["occurrence_rate"].sum(),
+            sum(rate for mag, rate in source.get_annual_occurrence_rates()),
+        )
+        self.assertEqual(set(rates["depth"]), {5.0, 10.0})
+
+    def test_rates_match_ruptures(self):
+        sources = [make_point_source(), make_area_source()]
+
+        analytic = bin_rupture_rates_from_source_list(
+            sources,
+            RuptureRateBinner(h3_res=4, min_mag=5.0, max_mag=7.5, bin_width=0.1),
+            analytic_point_sources=True,
+        ).to_dataframe()
+        from_rups = bin_rupture_rates_from_source_list(
+            sources,
+            RuptureRateBinner(h3_res=4, min_mag=5.0, max_mag=7.5, bin_width=0.1),
+            analytic_point_sources=False,
+        ).to_dataframe()
+
+        self.assertEqual(sorted(analytic.index), sorted(from_rups.index))
+        np.testing.assert_allclose(
+            analytic.loc[from_rups.index].values, from_rups.values, rtol=1e-10
+        )
+
+    def test_other_sources(self):
+        self.assertIsNone(get_source_rates(None))
+
+
+def make_nonparametric_source():
+    surface = PlanarSurface.from_corner_points(
+        Point(121.0, 15.0, 0.0),
+        Point(121.2, 15.0, 0.0),
+        Point(121.2, 15.0, 10.0),
+        Point(121.0, 15.0, 10.0),
+    )
+    data = [
+        (
+            BaseRupture(
+                6.5, 0.0, "Active Shallow Crust", Point(121.1, 15.0, 5.0), surface
+            ),
+            PMF([(0.9, 0), (0.08, 1), (0.02, 2)]),
+        ),
+        (
+            BaseRupture(
+                7.1, 90.0, "Active Shallow Crust", Point(121.1, 15.0, 5.0), surface
+            ),
+            PMF([(0.5, 0), (0.5, 1)]),
+        ),
+    ]
+    return NonParametricSeismicSource("nonpar", "test", "Active Shallow Crust", data)
+
+
+class TestNonParametricSourceRates(unittest.TestCase):
+    def setUp(self):
+        self.source = make_nonparametric_source()
+
+    def test_nonparametric_source_rates(self):
+        rates = get_nonparametric_source_rates(self.source)
+
+        np.testing.assert_allclose(rates["occurrence_rate"], [0.12, 0.5])
+        np.testing.assert_allclose(
+            rates["occurrence_rate"],
+            [_get_rupture_occurrence_rate(r) for r in self.source.iter_ruptures()],
+        )
+        np.testing.assert_allclose(rates["mag"], [6.5, 7.1])
+        np.testing.assert_allclose(rates["rake"], [0.0, 90.0])
+
+    def test_nonparametric_rupture_table(self):
+        rup_table = rupture_list_from_source_list([self.source])
+
+        self.assertEqual(list(rup_table.source), ["nonpar", "nonpar"])
+        np.testing.assert_allclose(rup_table.occurrence_rate, [0.12, 0.5])
+        np.testing.assert_allclose(rup_table.strike, [90.0, 90.0], atol=0.1)
+        np.testing.assert_allclose(rup_table.dip, [90.0, 90.0])
+
+    def test_nonparametric_binning(self):
+        binner = bin_rupture_rates_from_source_list(
+            [self.source],
+            RuptureRateBinner(
+                h3_res=4, min_mag=6.0, max_mag=7.5, bin_width=0.1, by_source=True
+            ),
+        )
+        np.testing.assert_almost_equal(binner.to_dataframe().values.sum(), 0.62)
+        self.assertEqual(
+            list(binner.to_source_dataframe().index.get_level_values("source")),
+            ["nonpar"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,10 +2,19 @@ import os
 import unittest
 
 import numpy as np
+import pandas as pd
+from openquake.hazardlib.mfd import ArbitraryMFD
 from openquake.hazardlib.source import SimpleFaultSource
 from openquake.hazardlib.source.rupture import ParametricProbabilisticRupture
 
 from openquake.hme.utils.io import process_source_logic_tree
+from openquake.hme.utils.binning import split_depth_slabs
+from openquake.hme.utils.utils import (
+    _split_fault_source,
+    _make_fault_source_with_mfd,
+    _chunk_source_list,
+    _make_strike_dip_getter,
+)
 from openquake.hme.utils import (
     flatten_list,
     rupture_dict_from_logic_tree_dict,
@@ -13,13 +22,21 @@ from openquake.hme.utils import (
     rupture_list_from_source_list_parallel,
     rupture_list_to_gdf,
     SimpleRupture,
+    RuptureTable,
     SpacemagBin,
     make_bin_gdf_from_rupture_gdf,
+    add_bin_geometry,
+    make_bin_gdf_from_rate_df,
+    bin_rupture_rates_from_source_list,
+    bin_rupture_rates_from_source_list_parallel,
+    RuptureRateBinner,
     make_SpacemagBins_from_bin_gis_file,
     make_SpacemagBins_from_bin_gdf,
     add_ruptures_to_bins,
     add_earthquakes_to_bins,
     make_earthquake_gdf_from_csv,
+    bin_earthquake_counts,
+    bin_earthquake_counts_from_csv,
     get_model_mfd,
     get_obs_mfd,
     get_total_obs_eqs,
@@ -60,7 +77,7 @@ class TestPHL1(unittest.TestCase):
     def test_rupture_dict_from_logic_dict(self):
         self.assertEqual(list(self.rup_dict.keys()), ["b1"])
         self.assertEqual(len(self.rup_dict["b1"]), 7797)
-        self.assertIsInstance(self.rup_dict["b1"], list)
+        self.assertIsInstance(self.rup_dict["b1"], RuptureTable)
         self.assertIsInstance(
             self.rup_dict["b1"][0],
             # ParametricProbabilisticRupture)
@@ -68,7 +85,7 @@ class TestPHL1(unittest.TestCase):
         )
 
     def test_rupture_list_from_lt_branch(self):
-        self.assertIsInstance(self.rup_list, list)
+        self.assertIsInstance(self.rup_list, RuptureTable)
         self.assertEqual(len(self.rup_list), 7797)
         self.assertIsInstance(
             self.rup_list[0],
@@ -82,7 +99,7 @@ class TestPHL1(unittest.TestCase):
             self.lt["b1"], n_procs=4
         )
 
-        self.assertIsInstance(self.rup_list_par, list)
+        self.assertIsInstance(self.rup_list_par, RuptureTable)
         self.assertEqual(len(self.rup_list_par), 7797)
         self.assertIsInstance(
             self.rup_list_par[0],
@@ -90,15 +107,125 @@ class TestPHL1(unittest.TestCase):
             SimpleRupture,
         )
 
+    def test_bin_rupture_rates_from_source_list(self):
+        binner = bin_rupture_rates_from_source_list(
+            self.lt["b1"], RuptureRateBinner(h3_res=3), chunk_size=1000
+        )
+        table_binner = RuptureRateBinner(h3_res=3)
+        table_binner.add_rupture_table(self.rup_list)
+
+        self.assertEqual(binner.n_ruptures, 7797)
+        rate_df = binner.to_dataframe()
+        table_rate_df = table_binner.to_dataframe().loc[rate_df.index]
+        np.testing.assert_allclose(rate_df.values, table_rate_df.values)
+
+        self.assertEqual(
+            sorted(rate_df.index), sorted(set(self.rup_gdf["bin_id"].values))
+        )
+
+    def test_bin_rupture_rates_from_source_list_parallel(self):
+        binner = bin_rupture_rates_from_source_list(
+            self.lt["b1"], RuptureRateBinner(h3_res=3)
+        )
+        par_binner = bin_rupture_rates_from_source_list_parallel(
+            self.lt["b1"], RuptureRateBinner(h3_res=3), n_procs=4
+        )
+
+        self.assertEqual(par_binner.n_ruptures, 7797)
+        rate_df = binner.to_dataframe()
+        par_rate_df = par_binner.to_dataframe().loc[rate_df.index]
+        np.testing.assert_allclose(rate_df.values, par_rate_df.values)
+
+    def test_make_bin_gdf_from_rate_df(self):
+        binner = RuptureRateBinner(h3_res=3)
+        binner.add_rupture_table(self.rup_list)
+        rate_df = binner.to_dataframe()
+
+        bin_gdf = make_bin_gdf_from_rate_df(rate_df)
+        sbin = bin_gdf.loc[rate_df.index[0], "SpacemagBin"]
+
+        self.assertEqual(len(bin_gdf), len(rate_df))
+        self.assertEqual(
+            list(sbin.get_rupture_mfd().values()), list(rate_df.iloc[0].values)
+        )
+
+    def test_split_fault_source(self):
+        source = self.lt["b1"][0]
+        source_slices = _split_fault_source(source, 4)
+
+        self.assertEqual(len(source_slices), 4)
+        self.assertEqual(
+            sum(s.count_ruptures() for s in source_slices), source.count_ruptures()
+        )
+
+        slice_rups = RuptureTable.concatenate(
+            [rupture_list_from_source_list([s]) for s in source_slices]
+        )
+        self.assertEqual(len(slice_rups), 7797)
+        np.testing.assert_almost_equal(
+            slice_rups.occurrence_rate.sum(), self.rup_list.occurrence_rate.sum()
+        )
+        self.assertEqual(list(slice_rups.source_ids), ["88"])
+
+    def test_split_fault_source_single_mag(self):
+        source = _make_fault_source_with_mfd(
+            self.lt["b1"][0], ArbitraryMFD([6.5], [0.01])
+        )
+        n_rups = source.count_ruptures()
+        source_slices = _split_fault_source(source, 4)
+
+        self.assertEqual(len(source_slices), 4)
+        self.assertEqual(sum(s.count_ruptures() for s in source_slices), n_rups)
+
+        rups = rupture_list_from_source_list([source])
+        slice_rups = RuptureTable.concatenate(
+            [rupture_list_from_source_list([s]) for s in source_slices]
+        )
+        self.assertEqual(len(slice_rups), n_rups)
+        np.testing.assert_array_equal(slice_rups.longitude, rups.longitude)
+        np.testing.assert_array_equal(slice_rups.strike, rups.strike)
+        self.assertEqual(list(slice_rups.source_ids), ["88"])
+
+    def test_make_strike_dip_getter(self):
+        source = self.lt["b1"][0]
+        get_strike_dip = _make_strike_dip_getter(source)
+
+        for i, rup in enumerate(source.iter_ruptures()):
+            if i % 50 != 0:
+                continue
+            strike, dip = get_strike_dip(rup)
+            # the strike of a vertical fault may be flipped by 180 degrees
+            strike_diff = (strike - rup.surface.get_strike() + 90.0) % 180.0 - 90.0
+            self.assertLess(abs(strike_diff), 0.5)
+            self.assertAlmostEqual(dip, rup.surface.get_dip())
+
+        np.testing.assert_array_equal(self.rup_list.dip, 90.0)
+
+    def test_chunk_source_list_splits_faults(self):
+        source_chunks, chunk_sums = _chunk_source_list(self.lt["b1"], n_chunks=4)
+
+        self.assertEqual(len(source_chunks), 4)
+        self.assertEqual(sum(chunk_sums), 7797)
+        self.assertTrue(max(chunk_sums) - min(chunk_sums) < 7797 / 4)
+
     def test_rupture_list_to_gdf(self):
         r0 = self.rup_gdf.loc[0]
-        self.assertEqual(r0.bin_id, "83694afffffffff")
+        self.assertEqual(r0.bin_id, 0x83694afffffffff)
         self.assertEqual(r0.mag_r, 6)
 
+    def test_rupture_list_to_gdf_columns(self):
+        for col in ["mag", "occurrence_rate", "longitude", "latitude", "source"]:
+            self.assertIn(col, self.rup_gdf.columns)
+        self.assertNotIn("rupture", self.rup_gdf.columns)
+        self.assertEqual(self.rup_gdf["mag"].dtype, np.float64)
+
     def test_make_bin_gdf_from_rupture_gdf(self):
         bin_df = make_bin_gdf_from_rupture_gdf(self.rup_gdf, h3_res=3, parallel=False)
+        self.assertTrue(bin_df.geometry.isna().all())
+
+        add_bin_geometry(bin_df)
         self.assertEqual(
-            bin_df.loc["836860fffffffff"].geometry.area, 1.0966917348958416
+            bin_df.loc[0x836860fffffffff].geometry.area, 1.0966917348958416
         )
 
     def test_make_spatial_bins_from_file(self):
@@ -111,7 +238,7 @@ class TestPHL1(unittest.TestCase):
         add_ruptures_to_bins(self.rup_gdf, self.bin_gdf)
 
         num_rups_first_bin = len(
-            self.bin_gdf.SpacemagBin.loc["836860fffffffff"].mag_bins[6.2].ruptures
+            self.bin_gdf.SpacemagBin.loc[0x836860fffffffff].mag_bins[6.2].ruptures
         )
 
         self.assertEqual(num_rups_first_bin, 561)
@@ -120,12 +247,66 @@ class TestPHL1(unittest.TestCase):
         self.eq_df = make_earthquake_gdf_from_csv(self.test_dir + "data/phl_eqs.csv")
         self.assertEqual(self.eq_df.loc[0].magnitude, 7.4)
 
+    def test_make_earthquake_gdf_time_cols(self):
+        self.eq_df = make_earthquake_gdf_from_csv(
+            self.test_dir + "data/phl_eqs.csv",
+            time=["year", "month", "day", "hour", "minute", "second"],
+        )
+        self.assertEqual(self.eq_df.loc[0].time, pd.Timestamp("1907-04-18 23:52:24"))
+        self.assertEqual(self.eq_df.loc[0].longitude, 122.93)
+        self.assertEqual(self.eq_df.loc[0].latitude, 13.461)
+        self.assertEqual(self.eq_df.loc[0].geometry.z, 35.0)
+
+    def test_make_earthquake_gdf_year_month(self):
+        self.eq_df = make_earthquake_gdf_from_csv(
+            self.test_dir + "data/phl_eqs.csv", time=["year", "month"]
+        )
+        self.assertEqual(self.eq_df.loc[0].time, pd.Timestamp("1907-04-01"))
+
     def test_add_earthquakes_to_bins(self):
         self.eq_df = make_earthquake_gdf_from_csv(self.test_dir + "data/phl_eqs.csv")
         add_earthquakes_to_bins(self.eq_df, self.bin_gdf)
-        sbin = self.bin_gdf.loc["836860fffffffff"].SpacemagBin
+        sbin = self.bin_gdf.loc[0x836860fffffffff].SpacemagBin
         self.assertEqual(len(sbin.mag_bins[6.0].observed_earthquakes), 2)
 
+    def test_bin_earthquake_counts_from_csv(self):
+        binner = bin_earthquake_counts_from_csv(
+            self.test_dir + "data/phl_eqs.csv",
+            RuptureRateBinner(h3_res=3, min_mag=6.0, max_mag=9.0, bin_width=0.2),
+            chunksize=10,
+        )
+        count_df = binner.to_dataframe()
+        self.assertEqual(count_df.loc[0x836860fffffffff, 6.0], 2.0)
+
+        eq_df = make_earthquake_gdf_from_csv(self.test_dir + "data/phl_eqs.csv")
+        n_eqs = ((eq_df.magnitude >= 5.9) & (eq_df.magnitude <= 9.1)).sum()
+        self.assertEqual(count_df.values.sum(), n_eqs)
+
+    def test_bin_earthquake_counts_by_depth(self):
+        eq_df = make_earthquake_gdf_from_csv(self.test_dir + "data/phl_eqs.csv")
+        binner = bin_earthquake_counts(
+            eq_df,
+            RuptureRateBinner(
+                h3_res=3,
+                min_mag=6.0,
+                max_mag=9.0,
+                bin_width=0.2,
+                depth_edges=[0.0, 40.0, 700.0],
+            ),
+        )
+        slab_counts = split_depth_slabs(binner.to_dataframe())
+
+        in_mags = (eq_df.magnitude >= 5.9) & (eq_df.magnitude <= 9.1)
+        depths = eq_df.geometry.z.values
+        self.assertEqual(
+            slab_counts["0-40"].values.sum(),
+            (in_mags & (depths >= 0.0) & (depths < 40.0)).sum(),
+        )
+        self.assertEqual(
+            slab_counts["40-700"].values.sum(),
+            (in_mags & (depths >= 40.0) & (depths < 700.0)).sum(),
+        )
+
     def test_make_SpacemagBins_from_bin_gdf(self):
         self.assertIsInstance(self.bin_gdf.iloc[0].SpacemagBin, SpacemagBin)
 